@@ -0,0 +1,327 @@
+import contextlib
+import json
+import os
+import sys
+
+import psycopg2
+
+import DigitalRentalSystem as drs
+from RequestFields import RequestFields, json_default
+
+
+# Replays a JSONL stream of operations, one object per line, e.g.
+#   {"op": "reserve", "id": "r1", "username": "user_7", "equipment_id": 12,
+#    "start_date": "2025-03-01", "end_date": "2025-03-03"}
+# and writes one JSONL result per input line, in input order.
+#
+# Lines are grouped into transactions of batch_size operations. Each operation runs behind
+# a savepoint, so a failure undoes only that operation; the batch commits once at the end.
+# Runs of consecutive reserves, and of consecutive returns with the same condition, are
+# sent as one make_reservations_batch / return_equipment_batch call, so a run of any
+# length costs a single round trip.
+
+
+class BatchError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class _SavepointConnection:
+    # Handed to the helpers in place of the connection: their commit() leaves the work to
+    # the batch commit, and their rollback() undoes only the current operation.
+    def __init__(self, conn, cursor):
+        self._conn = conn
+        self._cursor = cursor
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._cursor.execute("ROLLBACK TO SAVEPOINT batch_op;")
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+_FIELDS = RequestFields(lambda message: BatchError("invalid_request", message), "Field")
+_require, _require_int, _require_date = _FIELDS.require, _FIELDS.require_int, _FIELDS.require_date
+_optional_date, _limit = _FIELDS.optional_date, _FIELDS.limit
+
+
+# Each parser validates a request and returns the arguments its operation needs.
+def _parse_register(request):
+    return (_require(request, "fullname"), _require(request, "email"),
+            _require(request, "username"), _require(request, "password"))
+
+
+def _parse_login(request):
+    return _require(request, "username"), _require(request, "password")
+
+
+def _parse_reserve(request):
+    return (_require(request, "username"), _require_int(request, "equipment_id"),
+            _require_date(request, "start_date"), _require_date(request, "end_date"))
+
+
+def _parse_return(request):
+    condition = request.get("condition") or None
+    if condition is not None and condition not in drs.EQUIPMENT_CONDITIONS:
+        raise BatchError("invalid_request", f"Field 'condition' must be one of {', '.join(drs.EQUIPMENT_CONDITIONS)}.")
+    return _require_int(request, "reservation_id"), condition
+
+
+def _parse_mark_status(request):
+    status = _require(request, "status")
+    if status not in drs.EQUIPMENT_CONDITIONS:
+        raise BatchError("invalid_request", f"Field 'status' must be one of {', '.join(drs.EQUIPMENT_CONDITIONS)}.")
+    return _require_int(request, "equipment_id"), status
+
+
+def _parse_mark_overdue(request):
+    return (_require_int(request, "reservation_id"),)
+
+
+def _parse_sweep_overdue(request):
+    return ()
+
+
+def _parse_top_equipment(request):
+    return _FIELDS.bounded_int(request, "limit", 3), _optional_date(request, "since"), _optional_date(request, "until")
+
+
+def _parse_overdue(request):
+    return request.get("after") or None, _limit(request)
+
+
+def _parse_my_reservations(request):
+    return _require(request, "username"), request.get("after") or None, _limit(request), request.get("status") or None
+
+
+# Single operations return a result dict with at least "code".
+def _register(conn, cursor, fullname, email, username, password):
+    if not drs.check_person_exists(cursor, fullname, email):
+        return {"code": "unknown_person", "message": "No student or staff record with this name and email."}
+    if drs.check_username_exists(cursor, username):
+        return {"code": "username_taken", "message": "Username already exists."}
+    if not drs.add_user_account(conn, cursor, email, username, password):
+        return {"code": "account_exists", "message": "This person already has an account."}
+    return {"code": drs.RESERVATION_OK}
+
+
+def _login(conn, cursor, username, password):
+    valid, role, account_id = drs.authenticate(cursor, username, password)
+    if not valid:
+        return {"code": "invalid_credentials", "message": "Invalid username or password."}
+    return {"code": drs.RESERVATION_OK, "role": role, "account_id": account_id}
+
+
+def _mark_status(conn, cursor, equipment_id, status):
+    if not drs.mark_equipment_status(conn, cursor, equipment_id, status):
+        return {"code": "not_found", "message": "There is no equipment with this ID."}
+    return {"code": drs.RESERVATION_OK}
+
+
+def _mark_overdue(conn, cursor, reservation_id):
+    if not drs.mark_reservation_overdue(conn, cursor, reservation_id):
+        return {"code": "not_overdue", "message": "Reservation not found, not Active, or not past its end date."}
+    return {"code": drs.RESERVATION_OK}
+
+
+def _sweep_overdue(conn, cursor):
+    count, elapsed = drs.sweep_overdue_reservations(conn, cursor)
+    return {"code": drs.RESERVATION_OK, "marked": count}
+
+
+def _top_equipment(conn, cursor, limit, since, until):
+    return {"code": drs.RESERVATION_OK,
+            "items": [{"name": e[0], "borrow_count": e[1]} for e in drs.get_top_borrowed_equipment(cursor, limit, since, until)]}
+
+
+def _overdue(conn, cursor, after, limit):
+    try:
+        rows, next_token = drs.get_overdue_page(cursor, after, limit)
+    except ValueError:
+        return {"code": "invalid_request", "message": "Invalid page token."}
+    return {"code": drs.RESERVATION_OK, "next": next_token,
+            "items": [{"reservation_id": o[0], "username": o[1], "equipment": o[2],
+                       "start_date": o[3], "end_date": o[4], "status": o[5]} for o in rows]}
+
+
+def _my_reservations(conn, cursor, username, after, limit, status):
+    try:
+        rows, next_token = drs.get_user_reservations_page(cursor, username, after, limit, status)
+    except ValueError:
+        return {"code": "invalid_request", "message": "Invalid page token."}
+    return {"code": drs.RESERVATION_OK, "next": next_token,
+            "items": [{"reservation_id": r[0], "equipment": r[1], "start_date": r[2], "end_date": r[3], "status": r[4]}
+                      for r in rows]}
+
+
+# Run operations take the parsed arguments of every request in the run and return one
+# result dict per request.
+def _reserve_run(conn, cursor, runs):
+    results = drs.make_reservations_batch(conn, cursor, runs, all_or_nothing=False)
+    return [{"code": code, "reservation_id": reservation_id, "message": message}
+            for code, reservation_id, message in results]
+
+
+def _return_run(conn, cursor, runs):
+    results = drs.return_equipment_batch(conn, cursor, [reservation_id for reservation_id, _ in runs], runs[0][1])
+    return [{"code": code, "equipment_id": equipment_id, "message": message}
+            for code, equipment_id, message in results]
+
+
+OPERATIONS = {
+    "register": (_parse_register, _register),
+    "login": (_parse_login, _login),
+    "mark_status": (_parse_mark_status, _mark_status),
+    "mark_overdue": (_parse_mark_overdue, _mark_overdue),
+    "sweep_overdue": (_parse_sweep_overdue, _sweep_overdue),
+    "top_equipment": (_parse_top_equipment, _top_equipment),
+    "overdue": (_parse_overdue, _overdue),
+    "my_reservations": (_parse_my_reservations, _my_reservations),
+}
+
+# op -> (parser, run function, key that must match for two requests to share a run)
+RUN_OPERATIONS = {
+    "reserve": (_parse_reserve, _reserve_run, lambda args: None),
+    "return": (_parse_return, _return_run, lambda args: args[1]),
+}
+
+
+def parse_request(request):
+    if not isinstance(request, dict):
+        raise BatchError("invalid_request", "Each line must be a JSON object.")
+    op = request.get("op")
+    if op in OPERATIONS:
+        return op, OPERATIONS[op][0](request)
+    if op in RUN_OPERATIONS:
+        return op, RUN_OPERATIONS[op][0](request)
+    raise BatchError("invalid_request", f"Unknown op {op!r}; expected one of {', '.join(sorted({**OPERATIONS, **RUN_OPERATIONS}))}.")
+
+
+# entries: (line number, op, args). Consecutive run operations with the same key are
+# merged; everything else stands alone.
+def _groups(entries):
+    group = []
+    for entry in entries:
+        _, op, args = entry
+        if group and op in RUN_OPERATIONS and group[0][1] == op \
+                and RUN_OPERATIONS[op][2](group[0][2]) == RUN_OPERATIONS[op][2](args):
+            group.append(entry)
+            continue
+        if group:
+            yield group
+        group = [entry]
+    if group:
+        yield group
+
+
+def _run_group(conn, cursor, group):
+    op = group[0][1]
+    try:
+        if op in RUN_OPERATIONS:
+            results = RUN_OPERATIONS[op][1](conn, cursor, [args for _, _, args in group])
+        else:
+            results = [OPERATIONS[op][1](conn, cursor, *group[0][2])]
+        cursor.execute("RELEASE SAVEPOINT batch_op; SAVEPOINT batch_op;")
+        return results
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT batch_op;")
+        message = (e.pgerror or str(e)).strip()
+        return [{"code": "error", "message": message}] * len(group)
+
+
+# entries: (line number, request, op, args), or (line number, request, None, BatchError)
+# for lines that failed validation. Returns one result dict per entry.
+def run_transaction(entries):
+    results = {}
+    valid = []
+    for line, request, op, args in entries:
+        if op is None:
+            results[line] = {"code": args.code, "message": args.message}
+        else:
+            valid.append((line, op, args))
+    if not valid:
+        return [results[line] for line, *_ in entries]
+    try:
+        with drs.db_session() as (conn, cursor):
+            cursor.execute("SAVEPOINT batch_op;")
+            proxy = _SavepointConnection(conn, cursor)
+            for group in _groups(valid):
+                for (line, _, _), result in zip(group, _run_group(proxy, cursor, group)):
+                    results[line] = result
+    except psycopg2.Error as e:
+        message = f"Transaction rolled back: {(e.pgerror or str(e)).strip()}"
+        for line, _, _ in valid:
+            results[line] = {"code": "rolled_back", "message": message}
+    return [results[line] for line, *_ in entries]
+
+
+def _write(out, line, request, op, result):
+    entry = {"line": line}
+    if isinstance(request, dict) and "id" in request:
+        entry["id"] = request["id"]
+    if op is None and isinstance(request, dict) and isinstance(request.get("op"), str):
+        op = request["op"]
+    if op is not None:
+        entry["op"] = op
+    entry.update((key, value) for key, value in result.items() if not (key == "message" and value is None))
+    out.write(json.dumps(entry, default=json_default) + "\n")
+
+
+# Reads requests from lines and writes results to out. Returns (requests, failures), where
+# a failure is any result other than ok.
+def run_batch(lines, out, batch_size=100):
+    total = failures = 0
+    pending = []
+
+    def flush():
+        nonlocal failures
+        for (line, request, op, _), result in zip(pending, run_transaction(pending)):
+            _write(out, line, request, op, result)
+            if result["code"] != drs.RESERVATION_OK:
+                failures += 1
+        out.flush()
+        pending.clear()
+
+    for number, text in enumerate(lines, 1):
+        if not text.strip():
+            continue
+        total += 1
+        request = None
+        try:
+            try:
+                request = json.loads(text)
+            except ValueError as e:
+                raise BatchError("invalid_request", f"Not valid JSON: {e}.")
+            op, args = parse_request(request)
+            pending.append((number, request, op, args))
+        except BatchError as e:
+            pending.append((number, request, None, e))
+        if len(pending) >= batch_size:
+            flush()
+    if pending:
+        flush()
+    return total, failures
+
+
+def main(input_path, output_path="-", batch_size=100):
+    source = sys.stdin if input_path == "-" else open(input_path, encoding="utf-8")
+    out = sys.stdout if output_path == "-" else open(output_path, "w", encoding="utf-8")
+    try:
+        with drs.db_session() as (conn, cursor):
+            drs.initialize_db(cursor, conn)
+        # The helpers print on success and failure; keep that out of the results.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            total, failures = run_batch(source, out, batch_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+        drs.close_pool()
+    print(f"Ran {total} requests; {failures} did not succeed.", file=sys.stderr)
+    return total, failures
@@ -0,0 +1,215 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+import DataGeneration
+import DigitalRentalSystem as drs
+
+
+# Relative weights of each operation in the mixed workload.
+DEFAULT_MIX = {
+    "login": 10,
+    "catalog": 10,
+    "availability": 25,
+    "reserve": 20,
+    "return": 10,
+    "my_reservations": 15,
+    "overdue": 5,
+    "top_equipment": 5,
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    rank = math.ceil(p / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class Worker:
+    def __init__(self, worker_id, args, deadline):
+        self.rng = random.Random(args.seed * 1000 + worker_id)
+        self.args = args
+        self.deadline = deadline
+        self.accounts = max(1, int(args.people * args.account_ratio))
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.outcomes = Counter()
+        self.my_reservations = []
+        operations = list(args.mix)
+        weights = [args.mix[op] for op in operations]
+        self.choose = lambda: self.rng.choices(operations, weights)[0]
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            operation = self.choose()
+            username = f"user_{self.rng.randint(1, self.accounts)}"
+            started = time.perf_counter()
+            try:
+                with drs.db_session() as (conn, cursor):
+                    getattr(self, f"op_{operation}")(conn, cursor, username)
+            except Exception as e:
+                self.errors[operation] += 1
+                self.outcomes[f"{operation}:{type(e).__name__}"] += 1
+                continue
+            self.latencies[operation].append(time.perf_counter() - started)
+
+    def op_login(self, conn, cursor, username):
+        valid = drs.authenticate(cursor, username, self.args.password)[0]
+        self.outcomes[f"login:{'ok' if valid else 'invalid'}"] += 1
+
+    def op_catalog(self, conn, cursor, username):
+        drs.view_equipment_catalog(cursor)
+
+    def op_availability(self, conn, cursor, username):
+        drs.check_equipment_availability(cursor, self.rng.randint(1, self.args.equipment))
+
+    def op_reserve(self, conn, cursor, username):
+        start = date.today() + timedelta(days=self.rng.randint(0, 60))
+        end = start + timedelta(days=self.rng.randint(1, 7))
+        code, reservation_id = drs.call_make_reservation_proc(
+            conn, cursor, username, self.rng.randint(1, self.args.equipment), start, end)
+        self.outcomes[f"reserve:{code}"] += 1
+        if code == drs.RESERVATION_OK:
+            self.my_reservations.append(reservation_id)
+
+    def op_return(self, conn, cursor, username):
+        if not self.my_reservations:
+            self.outcomes["return:nothing_to_return"] += 1
+            return
+        returned = drs.return_equipment(conn, cursor, self.my_reservations.pop(0))
+        self.outcomes[f"return:{'ok' if returned else 'not_active'}"] += 1
+
+    def op_my_reservations(self, conn, cursor, username):
+        drs.get_user_reservations_page(cursor, username, limit=50)
+
+    def op_overdue(self, conn, cursor, username):
+        drs.get_overdue_page(cursor, limit=50)
+
+    def op_top_equipment(self, conn, cursor, username):
+        drs.get_top_borrowed_equipment(cursor, self.args.top_n, date.today() - timedelta(days=30))
+
+
+def seed_database(args):
+    conn, cursor = drs.get_db_connection_and_cursor()
+    try:
+        drs.initialize_db(cursor, conn)
+        cursor.execute("SELECT crypt(%s, gen_salt('bf', %s));", (args.password, drs.get_password_hash_cost()))
+        password_hash = cursor.fetchone()[0]
+        tables = DataGeneration.table_chunks(args.seed, args.people, args.equipment, args.reservations,
+                                             args.account_ratio, 50000, password_hash)
+        started = time.perf_counter()
+        DataGeneration.load_into_database(conn, cursor, tables, truncate=True)
+        cursor.execute("ANALYZE;")
+        conn.commit()
+        return time.perf_counter() - started
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def summarize(workers, elapsed):
+    latencies = defaultdict(list)
+    errors = Counter()
+    outcomes = Counter()
+    for worker in workers:
+        for operation, values in worker.latencies.items():
+            latencies[operation].extend(values)
+        errors.update(worker.errors)
+        outcomes.update(worker.outcomes)
+
+    operations = {}
+    for operation in sorted(set(latencies) | set(errors)):
+        values = sorted(latencies[operation])
+        operations[operation] = {
+            "count": len(values),
+            "errors": errors[operation],
+            "throughput_ops_s": round(len(values) / elapsed, 2),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else None,
+            "p50_ms": round(percentile(values, 50) * 1000, 3) if values else None,
+            "p95_ms": round(percentile(values, 95) * 1000, 3) if values else None,
+            "p99_ms": round(percentile(values, 99) * 1000, 3) if values else None,
+            "max_ms": round(values[-1] * 1000, 3) if values else None,
+        }
+    total = sum(op["count"] for op in operations.values())
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total_ops": total,
+        "throughput_ops_s": round(total / elapsed, 2),
+        "operations": operations,
+        "outcomes": dict(sorted(outcomes.items())),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the rental system against the database in .env")
+    parser.add_argument("--seed-db", action="store_true",
+                        help="TRUNCATE the four tables and load generated data first")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--people", type=int, default=10000)
+    parser.add_argument("--equipment", type=int, default=2000)
+    parser.add_argument("--reservations", type=int, default=100000)
+    parser.add_argument("--account-ratio", type=float, default=0.5)
+    parser.add_argument("--password", default="password",
+                        help="password of the generated accounts")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of measured load")
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--mix", type=json.loads, default=DEFAULT_MIX,
+                        help="JSON object of operation weights, e.g. '{\"reserve\": 50, \"catalog\": 50}'")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.mix) - set(DEFAULT_MIX)
+    if unknown:
+        parser.error(f"unknown operations in --mix: {', '.join(sorted(unknown))}")
+
+    seed_seconds = seed_database(args) if args.seed_db else None
+    drs.init_pool(minconn=args.workers, maxconn=args.workers)
+    with drs.db_session() as (conn, cursor):
+        drs.initialize_db(cursor, conn)
+
+    deadline = time.monotonic() + args.duration
+    workers = [Worker(i, args, deadline) for i in range(args.workers)]
+    threads = [threading.Thread(target=worker.run, name=f"bench-{i}") for i, worker in enumerate(workers)]
+    # The helpers print on success and failure; keep that out of the report.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    drs.close_pool()
+
+    report = {
+        "config": {
+            "workers": args.workers,
+            "duration_s": args.duration,
+            "seed": args.seed,
+            "people": args.people,
+            "equipment": args.equipment,
+            "reservations": args.reservations,
+            "mix": args.mix,
+            "seeded": args.seed_db,
+            "seed_load_s": round(seed_seconds, 3) if seed_seconds is not None else None,
+        },
+        **summarize(workers, elapsed),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import bisect
+import itertools
+import select
+import threading
+import time
+
+import psycopg2
+
+import DigitalRentalSystem as drs
+
+
+CHANNEL = "equipment_changed"
+CATALOG_QUERY = "SELECT equipment_id, name, equipment_condition, equipment_availability FROM Equipment"
+
+
+class CatalogCache:
+    # Equipment rows keyed by id plus an availability bitmap, kept current by the
+    # equipment_changed trigger. A notification batch touching more than max_pending
+    # ids (or a '*' payload from TRUNCATE) is answered with one full reload instead.
+    def __init__(self, max_pending=1000, poll_interval=5.0, reconnect_delay=1.0):
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self._rows = {}
+        self._sorted = None
+        self._available = bytearray()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._conn = None
+        self._thread = None
+        self.connected = False
+
+    def start(self):
+        self._connect()
+        self._thread = threading.Thread(target=self._listen, name="catalog-cache", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval + 1)
+        if self._conn is not None:
+            self._conn.close()
+
+    def catalog(self):
+        with self._lock:
+            if self._sorted is None:
+                self._sorted = [self._rows[i] for i in sorted(self._rows)]
+            return self._sorted
+
+    def page(self, after_id, limit, matches):
+        rows = self.catalog()
+        start = 0 if after_id is None else bisect.bisect_right(rows, after_id, key=lambda row: row[0])
+        result = []
+        for row in itertools.islice(rows, start, None):
+            if matches(row):
+                result.append(row)
+                if len(result) == limit:
+                    break
+        return result
+
+    def is_available(self, equipment_id):
+        if equipment_id not in self._rows:
+            return None
+        byte = equipment_id >> 3
+        return byte < len(self._available) and bool(self._available[byte] & (1 << (equipment_id & 7)))
+
+    def _connect(self):
+        conn = psycopg2.connect(**drs.get_db_config())
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            # LISTEN before loading so no change between the two is lost.
+            cursor.execute(f"LISTEN {CHANNEL};")
+        self._conn = conn
+        self.reload()
+        self.connected = True
+
+    def reload(self):
+        with self._conn.cursor() as cursor:
+            cursor.execute(CATALOG_QUERY + ";")
+            rows = cursor.fetchall()
+        available = bytearray((max((r[0] for r in rows), default=0) >> 3) + 1)
+        for row in rows:
+            if row[3]:
+                available[row[0] >> 3] |= 1 << (row[0] & 7)
+        with self._lock:
+            self._rows = {row[0]: row for row in rows}
+            self._available = available
+            self._sorted = None
+
+    def _refresh(self, equipment_ids):
+        with self._conn.cursor() as cursor:
+            cursor.execute(CATALOG_QUERY + " WHERE equipment_id = ANY(%s);", (list(equipment_ids),))
+            rows = {row[0]: row for row in cursor.fetchall()}
+        with self._lock:
+            for equipment_id in equipment_ids:
+                row = rows.get(equipment_id)
+                if row is None:
+                    self._rows.pop(equipment_id, None)
+                else:
+                    self._rows[equipment_id] = row
+                self._set_available(equipment_id, row is not None and row[3])
+            self._sorted = None
+
+    def _set_available(self, equipment_id, available):
+        byte = equipment_id >> 3
+        if byte >= len(self._available):
+            self._available.extend(bytes(byte + 1 - len(self._available)))
+        if available:
+            self._available[byte] |= 1 << (equipment_id & 7)
+        else:
+            self._available[byte] &= ~(1 << (equipment_id & 7)) & 0xFF
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                if select.select([self._conn], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                self._conn.poll()
+                changed = set()
+                full_reload = False
+                while self._conn.notifies:
+                    payload = self._conn.notifies.pop(0).payload
+                    if payload == "*":
+                        full_reload = True
+                    else:
+                        changed.add(int(payload))
+                if full_reload or len(changed) > self.max_pending:
+                    self.reload()
+                elif changed:
+                    self._refresh(changed)
+            except (psycopg2.Error, OSError, ValueError) as e:
+                if self._stop.is_set():
+                    break
+                self.connected = False
+                print(f"Catalog cache lost its connection ({e}); reconnecting.")
+                self._reconnect()
+
+    def _reconnect(self):
+        if self._conn is not None:
+            self._conn.close()
+        while not self._stop.is_set():
+            try:
+                self._connect()
+                return
+            except psycopg2.Error:
+                time.sleep(self.reconnect_delay)
@@ -1,9 +1,10 @@
+import argparse
 import csv
-import random
-from faker import Faker
-from datetime import timedelta
+import io
+from datetime import date
 
-fake = Faker()
+import numpy as np
+from faker import Faker
 
 # Define equipment names
 equipment_names = [
@@ -13,66 +14,204 @@ equipment_names = [
     "Router"
 ]
 
-# --- 1. Generate Student_Staff ---
-roles = ["Student", "Staff"]
-student_staff = []
-
-for i in range(1, 51):
-    fullname = fake.name()
-    email = f"user{i}@example.com"
-    role = random.choice(roles)
-    student_staff.append([i, fullname, email, role])  
-
-with open("student_staff.csv", "w", newline="", encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(["id", "fullname", "email", "role"])
-    writer.writerows(student_staff)
-
-
-# --- 2. Generate User_Account ---
-user_accounts = []
-used_ids = random.sample(range(1, 51), 20)
-
-for i in used_ids:
-    username = f"user_{i}"
-    password = fake.password(length=10)
-    user_accounts.append([i, username, password])  
-
-with open("user_account.csv", "w", newline="", encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(["id", "username", "password"])
-    writer.writerows(user_accounts)
-
-
-# --- 3. Generate Equipment ---
-equipment = []
-
-for i in range(1, 71):
-    name = random.choice(equipment_names)
-    condition = random.choice(["Good",  "Worn Out", "Poor"])
-    available = random.choice([True, False])
-    equipment.append([i, name, condition, available])  
-
-with open("equipment.csv", "w", newline="", encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(["equipment_id", "name", "equipment_condition", "equipment_availability"])
-    writer.writerows(equipment)
-
-
-# --- 4. Generate Reservations ---
-reservations = []
-usernames = [u[1] for u in user_accounts]  
-
-for i in range(1, 16):
-    username = random.choice(usernames)
-    equipment_id = random.randint(1, 70)
-    start = fake.date_between(start_date="-30d", end_date="today")
-    end = start + timedelta(days=random.randint(1, 10))
-    status = random.choice(["Ongoing", "Returned", "Overdue"])
-    reservations.append([i, username, equipment_id, start, end, status])
-
-with open("reservations.csv", "w", newline="", encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(["reservation_id", "username", "equipment_id", "start_date", "end_date", "status"])
-    writer.writerows(reservations)
-
+ROLES = np.array(["Student", "Staff"])
+CONDITIONS = np.array(["Good", "Worn Out", "Poor"])
+PASSWORD_ALPHABET = np.array(list("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789#%+!"))
+
+# Reservation k books equipment (k % equipment) + 1 in round k // equipment. Each round is a
+# BOOKING_SLOT_DAYS window and every booking ends inside its window, so bookings of the same
+# unit never overlap. The newest round straddles today; older rounds lie in the past.
+BOOKING_SLOT_DAYS = 14
+MAX_BOOKING_DAYS = 7
+MAX_HISTORY_DAYS = 365 * 50
+
+CSV_FILES = {
+    "Student_Staff": "student_staff.csv",
+    "User_Account": "user_account.csv",
+    "Equipment": "equipment.csv",
+    "Reservation": "reservations.csv",
+}
+
+
+class ChunkReader:
+    # File-like wrapper so COPY FROM STDIN pulls one generated chunk at a time. Reads are
+    # served from an offset into the current chunk and never span two chunks, so each
+    # character is copied once; COPY keeps reading until it gets an empty string.
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = ""
+        self._offset = 0
+
+    def read(self, size=-1):
+        if size < 0:
+            data = self._chunk[self._offset:] + "".join(self._chunks)
+            self._chunk, self._offset = "", 0
+            return data
+        while self._offset >= len(self._chunk):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return ""
+            self._chunk, self._offset = chunk, 0
+        data = self._chunk[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+
+def to_csv(columns):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(zip(*columns))
+    return buffer.getvalue()
+
+
+def id_chunks(count, chunk_size):
+    for start in range(1, count + 1, chunk_size):
+        yield np.arange(start, min(start + chunk_size, count + 1))
+
+
+def student_staff_chunks(rng, names, count, chunk_size, staff_ratio=0.2):
+    for ids in id_chunks(count, chunk_size):
+        fullnames = names[rng.integers(0, len(names), len(ids))]
+        emails = np.char.add(np.char.add("user", ids.astype(str)), "@example.com")
+        roles = ROLES[(rng.random(len(ids)) < staff_ratio).astype(int)]
+        yield to_csv([ids, fullnames, emails, roles])
+
+
+# Accounts belong to people 1..accounts so reservations can pick a valid username by id alone.
+# With password_hash every account shares that bcrypt hash; hashing millions of distinct
+# passwords would dominate the load time.
+def user_account_chunks(rng, accounts, chunk_size, password_length=10, password_hash=None):
+    for ids in id_chunks(accounts, chunk_size):
+        usernames = np.char.add("user_", ids.astype(str))
+        if password_hash is None:
+            letters = PASSWORD_ALPHABET[rng.integers(0, len(PASSWORD_ALPHABET), (len(ids), password_length))]
+            passwords = letters.view(f"<U{password_length}").ravel()
+        else:
+            passwords = np.full(len(ids), password_hash)
+        yield to_csv([ids, usernames, passwords])
+
+
+def equipment_chunks(rng, count, chunk_size):
+    names = np.array(equipment_names)
+    for ids in id_chunks(count, chunk_size):
+        yield to_csv([
+            ids,
+            names[rng.integers(0, len(names), len(ids))],
+            CONDITIONS[rng.integers(0, len(CONDITIONS), len(ids))],
+            np.full(len(ids), "true"),
+        ])
+
+
+def reservation_chunks(rng, count, equipment, accounts, chunk_size, today=None, overdue_ratio=0.1):
+    today = np.datetime64(today or date.today(), "D")
+    rounds = -(-count // equipment)
+    if rounds * BOOKING_SLOT_DAYS > MAX_HISTORY_DAYS:
+        raise ValueError(f"{count} reservations over {equipment} units spans more than "
+                         f"{MAX_HISTORY_DAYS // 365} years; generate more equipment.")
+    first_window = today - (rounds - 1) * BOOKING_SLOT_DAYS - BOOKING_SLOT_DAYS // 2
+    for ids in id_chunks(count, chunk_size):
+        k = ids - 1
+        equipment_ids = k % equipment + 1
+        durations = rng.integers(1, MAX_BOOKING_DAYS + 1, len(ids))
+        offsets = rng.integers(0, BOOKING_SLOT_DAYS - durations)
+        starts = first_window + (k // equipment) * BOOKING_SLOT_DAYS + offsets
+        ends = starts + durations
+        # Only bookings from the latest window can still be out; older ones were all returned.
+        late = (ends < today) & (ends >= today - BOOKING_SLOT_DAYS) & (rng.random(len(ids)) < overdue_ratio)
+        statuses = np.where(ends >= today, "Active", np.where(late, "Overdue", "Returned"))
+        usernames = np.char.add("user_", rng.integers(1, accounts + 1, len(ids)).astype(str))
+        yield to_csv([ids, usernames, equipment_ids, starts.astype(str), ends.astype(str), statuses])
+
+
+def name_pool(seed, size=1000):
+    fake = Faker()
+    fake.seed_instance(seed)
+    return np.array([fake.name() for _ in range(size)])
+
+
+def table_chunks(seed, people, equipment, reservations, account_ratio, chunk_size, password_hash=None):
+    accounts = max(1, int(people * account_ratio))
+    rng = np.random.default_rng(seed)
+    names = name_pool(seed)
+    return [
+        ("Student_Staff", ["id", "fullname", "email", "role"],
+         student_staff_chunks(rng, names, people, chunk_size)),
+        ("User_Account", ["id", "username", "password"],
+         user_account_chunks(rng, accounts, chunk_size, password_hash=password_hash)),
+        ("Equipment", ["equipment_id", "name", "equipment_condition", "equipment_availability"],
+         equipment_chunks(rng, equipment, chunk_size)),
+        ("Reservation", ["reservation_id", "username", "equipment_id", "start_date", "end_date", "status"],
+         reservation_chunks(rng, reservations, equipment, accounts, chunk_size)),
+    ]
+
+
+def write_csv_files(tables, output_dir="."):
+    for table, columns, chunks in tables:
+        path = f"{output_dir}/{CSV_FILES[table]}"
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            f.write(",".join(columns) + "\n")
+            for chunk in chunks:
+                f.write(chunk)
+        print(f"Wrote {path}")
+
+
+def load_into_database(conn, cursor, tables, truncate=False):
+    if truncate:
+        # TRUNCATE skips the triggers on Reservation, so the tables they maintain are emptied explicitly.
+        cursor.execute("TRUNCATE Equipment_Usage_Daily, Active_Reservation, Reservation, Equipment, User_Account, Student_Staff "
+                       "RESTART IDENTITY CASCADE;")
+    # Bookings near today go into their own month's partition rather than reservation_default.
+    cursor.execute("SELECT ensure_reservation_partitions();")
+    for table, columns, chunks in tables:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            ChunkReader(chunks),
+        )
+        print(f"Loaded {cursor.rowcount} rows into {table}")
+    cursor.execute("""
+    UPDATE Equipment SET equipment_availability = FALSE
+    WHERE equipment_id IN (SELECT equipment_id FROM Reservation WHERE status IN ('Active', 'Overdue'));
+    """)
+    for table, column in (("Student_Staff", "id"), ("Equipment", "equipment_id"), ("Reservation", "reservation_id")):
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), COALESCE(MAX({column}), 1)) FROM {table};")
+    conn.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate test data for the rental system")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--people", type=int, default=50)
+    parser.add_argument("--equipment", type=int, default=70)
+    parser.add_argument("--reservations", type=int, default=15)
+    parser.add_argument("--account-ratio", type=float, default=0.4,
+                        help="share of people that get a user account")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--load", action="store_true",
+                        help="COPY straight into the database configured in .env instead of writing CSV files")
+    parser.add_argument("--truncate", action="store_true",
+                        help="with --load, empty the four tables first")
+    parser.add_argument("--password", default="password",
+                        help="with --load, the password every generated account can log in with")
+    parser.add_argument("--output-dir", default=".")
+    args = parser.parse_args(argv)
+
+    if not args.load:
+        write_csv_files(table_chunks(args.seed, args.people, args.equipment, args.reservations,
+                                     args.account_ratio, args.chunk_size), args.output_dir)
+        return
+
+    import DigitalRentalSystem as drs
+    conn, cursor = drs.get_db_connection_and_cursor()
+    try:
+        drs.initialize_db(cursor, conn)
+        cursor.execute("SELECT crypt(%s, gen_salt('bf', %s));", (args.password, drs.get_password_hash_cost()))
+        password_hash = cursor.fetchone()[0]
+        tables = table_chunks(args.seed, args.people, args.equipment, args.reservations,
+                              args.account_ratio, args.chunk_size, password_hash)
+        load_into_database(conn, cursor, tables, args.truncate)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
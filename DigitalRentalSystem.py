@@ -1,246 +1,782 @@
+import argparse
+import base64
+import gzip
+import itertools
 import psycopg2
+import re
+import secrets
+from psycopg2 import errors as pg_errors
+from psycopg2 import pool as pg_pool
+from psycopg2 import sql as pg_sql
 from dotenv import load_dotenv
 import os
-from datetime import datetime
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from SchemaMigrations import MIGRATIONS, LATEST_SCHEMA_VERSION
+import Metrics
+from Metrics import timed_query
 
 
 # Database Connection
-def get_db_connection_and_cursor():
+def get_db_config():
     load_dotenv()
-    conn = psycopg2.connect(
-        user=os.getenv("user"),
-        password=os.getenv("password"),
-        host=os.getenv("host"),
-        port=os.getenv("port"),
-        dbname=os.getenv("dbname")
-    )
-    cursor = conn.cursor()
-    return conn, cursor
-
-
-# Create tables 
-def initialize_db(cursor, conn):
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Student_Staff (
-        id SERIAL PRIMARY KEY,
-        fullname VARCHAR(50) NOT NULL,
-        email VARCHAR(50) NOT NULL UNIQUE,
-        role VARCHAR(10) CHECK (role IN ('Student', 'Staff'))
-    );
-    """)
-
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS User_Account (
-        id INT PRIMARY KEY REFERENCES Student_Staff(id),
-        username VARCHAR(50) UNIQUE NOT NULL,
-        password VARCHAR(255) NOT NULL
-    );
-    """)
-
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Equipment (
-        equipment_id SERIAL PRIMARY KEY,
-        name VARCHAR(50) NOT NULL,
-        equipment_condition VARCHAR(20) DEFAULT 'Good',
-        equipment_availability BOOLEAN DEFAULT TRUE
-    );
-    """)
-
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Reservation (
-        reservation_id SERIAL PRIMARY KEY,
-        username VARCHAR(50) NOT NULL REFERENCES User_Account(username),
-        equipment_id INT NOT NULL REFERENCES Equipment(equipment_id),
-        start_date DATE NOT NULL,
-        end_date DATE NOT NULL,
-        status VARCHAR(20) DEFAULT 'Active'
-    );
-    """)
-    conn.commit()
+    return {
+        "user": os.getenv("user"),
+        "password": os.getenv("password"),
+        "host": os.getenv("host"),
+        "port": os.getenv("port"),
+        "dbname": os.getenv("dbname")
+    }
 
 
-# SQL-Queries
-    cursor.execute("DROP FUNCTION IF EXISTS check_person_exists(VARCHAR, VARCHAR);")
-    cursor.execute("""
-    CREATE OR REPLACE FUNCTION check_person_exists(p_email VARCHAR, p_fullname VARCHAR)
-    RETURNS BOOLEAN AS $$
-    DECLARE
-        exists BOOLEAN;
-    BEGIN
-        SELECT EXISTS (SELECT 1 FROM Student_Staff WHERE email = p_email AND fullname = p_fullname) INTO exists;
-        RETURN exists;
-    END;
-    $$ LANGUAGE plpgsql;
-    """)
-
+def get_db_connection_and_cursor():
+    conn = psycopg2.connect(**get_db_config())
+    cursor = conn.cursor()
+    return conn, cursor
 
-    cursor.execute("DROP FUNCTION IF EXISTS check_username_exists(VARCHAR);")
-    cursor.execute("""
-    CREATE OR REPLACE FUNCTION check_username_exists(p_username VARCHAR)
-    RETURNS BOOLEAN AS $$
-    DECLARE
-        exists BOOLEAN;
-    BEGIN
-        SELECT EXISTS (SELECT 1 FROM User_Account WHERE username = p_username) INTO exists;
-        RETURN exists;
-    END;
-    $$ LANGUAGE plpgsql;
-    """)
 
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    # minconn connections are opened up front; up to max_idle (default maxconn) returned
+    # connections are kept open for reuse.
+    def __init__(self, minconn, maxconn, health_check_interval=30, timeout=30, max_idle=None, **db_config):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **db_config)
+        # ThreadedConnectionPool closes a returned connection once minconn are idle, so with
+        # pool_min=1 nearly every concurrent checkout reconnected. Its minconn is only read
+        # again by putconn, so raising it now keeps connections without opening more.
+        self._pool.minconn = maxconn if max_idle is None else max_idle
+        # ThreadedConnectionPool raises when exhausted; the semaphore makes callers wait instead.
+        self._slots = threading.BoundedSemaphore(maxconn)
+        # Weakly keyed, so connections the inner pool closes and drops do not linger here.
+        self._last_checked = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            Metrics.REGISTRY.record_pool_wait(time.perf_counter() - started)
+            raise PoolTimeout(f"No database connection available after {timeout}s.")
+        try:
+            conn = self._ensure_healthy(self._pool.getconn())
+        except Exception:
+            self._slots.release()
+            raise
+        Metrics.REGISTRY.record_pool_wait(time.perf_counter() - started)
+        return conn
+
+    def putconn(self, conn, close=False):
+        try:
+            self._pool.putconn(conn, close=close or conn.closed != 0)
+        finally:
+            # The inner pool may close it too, e.g. when the connection was broken.
+            if conn.closed:
+                with self._lock:
+                    self._last_checked.pop(conn, None)
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            self._last_checked.clear()
+        self._pool.closeall()
+
+    @timed_query("pool_health_check")
+    def _ensure_healthy(self, conn):
+        now = time.monotonic()
+        with self._lock:
+            last_checked = self._last_checked.get(conn)
+        if conn.closed == 0 and last_checked is not None and now - last_checked < self.health_check_interval:
+            return conn
+        try:
+            if conn.closed:
+                raise psycopg2.InterfaceError("connection already closed")
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+        except psycopg2.Error:
+            with self._lock:
+                self._last_checked.pop(conn, None)
+            self._pool.putconn(conn, close=True)
+            conn = self._pool.getconn()
+        with self._lock:
+            self._last_checked[conn] = now
+        return conn
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(minconn=None, maxconn=None):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = get_db_config()
+            Metrics.configure(os.getenv("slow_query_ms", 500), os.getenv("slow_query_log"))
+            _pool = ConnectionPool(
+                int(minconn or os.getenv("pool_min", 1)),
+                int(maxconn or os.getenv("pool_max", 10)),
+                health_check_interval=float(os.getenv("pool_health_check_interval", 30)),
+                timeout=float(os.getenv("pool_timeout", 30)),
+                cursor_factory=Metrics.InstrumentedCursor,
+                **config
+            )
+    return _pool
+
+
+def close_pool():
+    global _pool, _router, _router_checked
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+        if _router is not None:
+            _router.closeall()
+        _router = None
+        _router_checked = False
+
+
+@contextmanager
+def db_session():
+    pool = init_pool()
+    with _checked_out(pool, pool.getconn()) as session:
+        yield session
+
+
+@contextmanager
+def _checked_out(pool, conn):
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    outcome = "rollback"
+    try:
+        yield conn, cursor
+        conn.commit()
+        outcome = "commit"
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        Metrics.REGISTRY.record_transaction(time.perf_counter() - started, outcome)
+        cursor.close()
+        pool.putconn(conn)
+
+
+# Read replicas
+# replica_dsns lists standby servers (comma-separated libpq DSNs or URIs). Read-only helpers
+# run through read_session(), which takes the replicas in turn and skips any that lag more
+# than replica_max_lag seconds or cannot be reached; with none left it uses the primary.
+# A user who just reserved or returned something reads from the primary for
+# read_your_writes_window seconds so they always see their own change.
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END;
+"""
+
+
+class Replica:
+    __slots__ = ("name", "pool", "lag", "checked_at", "lock")
+
+    def __init__(self, dsn, pool):
+        # Shown in stats; never includes the password.
+        params = psycopg2.extensions.parse_dsn(dsn)
+        self.name = f"{params.get('host', 'localhost')}:{params.get('port', 5432)}/{params.get('dbname', '')}"
+        self.pool = pool
+        self.lag = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+
+class ReplicaRouter:
+    def __init__(self, dsns, maxconn, max_lag=5.0, lag_check_interval=5.0, read_your_writes_window=30.0, timeout=5.0):
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.read_your_writes_window = read_your_writes_window
+        self.timeout = timeout
+        # minconn 0: an unreachable replica must not stop the pool from being created. Once
+        # opened, up to maxconn connections stay idle for reuse, as on the primary, so routed
+        # reads and lag probes do not reconnect each time.
+        self.replicas = [
+            Replica(dsn, ConnectionPool(0, maxconn, timeout=timeout, max_idle=maxconn, dsn=dsn,
+                                        cursor_factory=Metrics.InstrumentedCursor))
+            for dsn in dsns
+        ]
+        self._next = itertools.count()
+        self._recent_writes = {}
+        self._lock = threading.Lock()
+
+    def note_write(self, username):
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[username] = now
+            if len(self._recent_writes) > 10000:
+                cutoff = now - self.read_your_writes_window
+                self._recent_writes = {u: t for u, t in self._recent_writes.items() if t > cutoff}
+
+    def wrote_recently(self, username):
+        with self._lock:
+            written_at = self._recent_writes.get(username)
+        return written_at is not None and time.monotonic() - written_at < self.read_your_writes_window
+
+    # (pool, connection) from the next replica that is caught up, or None for the primary.
+    def checkout(self, username=None):
+        if username is not None and self.wrote_recently(username):
+            return None
+        start = next(self._next)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if not self._caught_up(replica):
+                continue
+            try:
+                return replica.pool, replica.pool.getconn(self.timeout)
+            except (psycopg2.Error, PoolTimeout):
+                replica.lag, replica.checked_at = None, time.monotonic()
+        return None
 
-    cursor.execute("DROP FUNCTION IF EXISTS check_credentials(VARCHAR, VARCHAR);")
-    cursor.execute("""
-    CREATE OR REPLACE FUNCTION check_credentials(p_username VARCHAR, p_password VARCHAR)
-    RETURNS BOOLEAN AS $$
-    DECLARE
-        valid BOOLEAN;
-    BEGIN
-        SELECT EXISTS (
-            SELECT 1 FROM User_Account WHERE username = p_username AND password = p_password) INTO valid;
-            RETURN valid;
-    END;
-    $$ LANGUAGE plpgsql;
-    """)
+    def _caught_up(self, replica):
+        now = time.monotonic()
+        # One thread re-measures; the others use the last measurement meanwhile.
+        if (replica.checked_at is None or now - replica.checked_at >= self.lag_check_interval) \
+                and replica.lock.acquire(blocking=False):
+            try:
+                replica.lag = self._measure_lag(replica)
+                replica.checked_at = now
+            finally:
+                replica.lock.release()
+        return replica.lag is not None and replica.lag <= self.max_lag
+
+    def _measure_lag(self, replica):
+        try:
+            conn = replica.pool.getconn(self.timeout)
+        except (psycopg2.Error, PoolTimeout):
+            return None
+        try:
+            with Metrics.query_label("replica_lag"), conn.cursor() as cursor:
+                cursor.execute(REPLICA_LAG_QUERY)
+                lag = float(cursor.fetchone()[0])
+            conn.rollback()
+            replica.pool.putconn(conn)
+            return lag
+        except psycopg2.Error:
+            replica.pool.putconn(conn, close=True)
+            return None
+
+    def status(self):
+        return [(replica.name, replica.lag) for replica in self.replicas]
+
+    def closeall(self):
+        for replica in self.replicas:
+            replica.pool.closeall()
+
+
+_router = None
+_router_checked = False
+
+
+def init_router():
+    global _router, _router_checked
+    if _router_checked:
+        return _router
+    with _pool_lock:
+        if not _router_checked:
+            _router_checked = True
+            dsns = [dsn.strip() for dsn in os.getenv("replica_dsns", "").split(",") if dsn.strip()]
+            if dsns:
+                _router = ReplicaRouter(
+                    dsns,
+                    int(os.getenv("pool_max", 10)),
+                    max_lag=float(os.getenv("replica_max_lag", 5)),
+                    lag_check_interval=float(os.getenv("replica_lag_check_interval", 5)),
+                    read_your_writes_window=float(os.getenv("read_your_writes_window", 30)),
+                    timeout=float(os.getenv("replica_timeout", 5)),
+                )
+    return _router
+
+
+def note_write(username):
+    router = init_router()
+    if router is not None:
+        router.note_write(username)
+
+
+# For helpers that only read. username is whose data is being read, for read-your-writes.
+@contextmanager
+def read_session(username=None):
+    router = init_router()
+    checkout = router.checkout(username) if router is not None else None
+    if checkout is None:
+        with db_session() as session:
+            yield session
+    else:
+        with _checked_out(*checkout) as session:
+            yield session
+
+
+# Schema migrations
+MIGRATION_LOCK_ID = 4815162342
+
+
+@timed_query("schema_version")
+def get_schema_version(conn, cursor):
+    try:
+        cursor.execute("SELECT MAX(version) FROM Schema_Version;")
+        return cursor.fetchone()[0] or 0
+    except pg_errors.UndefinedTable:
+        conn.rollback()
+        return 0
 
 
-    cursor.execute("DROP FUNCTION IF EXISTS add_user_account(VARCHAR, VARCHAR, VARCHAR);")
-    cursor.execute("""
-    CREATE OR REPLACE FUNCTION add_user_account(p_email VARCHAR, p_username VARCHAR, p_password VARCHAR)
-    RETURNS BOOLEAN AS $$
-    DECLARE
-        user_id INT;
-        exists BOOLEAN;
-    BEGIN
-        SELECT id INTO user_id FROM Student_Staff WHERE email = p_email;
-        IF user_id IS NULL THEN
-            RETURN FALSE;
-        END IF;
-
-        SELECT EXISTS(SELECT 1 FROM User_Account WHERE id = user_id) INTO exists;
-        IF exists THEN
-            RETURN FALSE;
-        ELSE
-            INSERT INTO User_Account (id, username, password) VALUES (user_id, p_username, p_password);
-            RETURN TRUE;
-        END IF;
-    END;
-    $$ LANGUAGE plpgsql;
-    """)
+@timed_query("migrations")
+def run_migrations(conn, cursor):
+    try:
+        # The advisory lock serialises concurrent starts; the version is re-read under it.
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Schema_Version (
+            version INT PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+        """)
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM Schema_Version;")
+        current = cursor.fetchone()[0]
+        applied = False
+        for version, description, sql in MIGRATIONS:
+            if version <= current:
+                continue
+            cursor.execute(sql)
+            cursor.execute("INSERT INTO Schema_Version (version, description) VALUES (%s, %s);", (version, description))
+            print(f"Applied schema migration {version}: {description}")
+            current = version
+            applied = True
+        conn.commit()
+        if applied:
+            invalidate_prepared_statements()
+        return current
+    except Exception:
+        conn.rollback()
+        raise
 
 
-    cursor.execute("DROP PROCEDURE IF EXISTS make_reservation_proc(VARCHAR, INT, DATE, DATE);")
-    cursor.execute("""
-    CREATE OR REPLACE PROCEDURE make_reservation_proc(
-        p_username VARCHAR,
-        p_equipment_id INT,
-        p_start_date DATE,
-        p_end_date DATE
-    )
-    LANGUAGE plpgsql
-    AS $$
-    DECLARE
-        available BOOLEAN;
-        conflict_count INT;
-    BEGIN
-        SELECT equipment_availability INTO available FROM Equipment WHERE equipment_id = p_equipment_id;
-        IF available IS NULL THEN
-            RAISE EXCEPTION 'Equipment ID % does not exist.', p_equipment_id;
-        END IF;
-
-        IF NOT available THEN
-            RAISE EXCEPTION 'Equipment is currently not available.';
-        END IF;
-
-        SELECT COUNT(*) INTO conflict_count FROM Reservation
-        WHERE equipment_id = p_equipment_id
-          AND status = 'Active'
-          AND (p_start_date <= end_date AND p_end_date >= start_date);
-
-        IF conflict_count > 0 THEN
-            RAISE EXCEPTION 'Equipment is already reserved for the selected date range.';
-        END IF;
-
-        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
-        VALUES (p_username, p_equipment_id, p_start_date, p_end_date, 'Active');
-
-        UPDATE Equipment SET equipment_availability = FALSE WHERE equipment_id = p_equipment_id;
-
-        RAISE NOTICE 'Reservation successful.';
-    END;
-    $$;
-    """)
-    conn.commit()
+def initialize_db(cursor, conn):
+    if get_schema_version(conn, cursor) >= LATEST_SCHEMA_VERSION:
+        return LATEST_SCHEMA_VERSION
+    return run_migrations(conn, cursor)
+
+
+# Prepared statements
+# The hottest queries are PREPAREd once per pooled connection and then run with EXECUTE,
+# so the server parses and plans them only once. PREPARE cannot wrap CALL, so reservations
+# run reserve_equipment() directly; make_reservation_proc only wraps it. Transaction-mode
+# poolers such as PgBouncer do not keep prepared statements; set use_prepared_statements=false
+# behind one.
+PREPARED_STATEMENTS = {
+    "authenticate": ("VARCHAR, VARCHAR, INT", "SELECT valid, role, account_id FROM authenticate($1, $2, $3)"),
+    "equipment_availability": ("INT", "SELECT equipment_availability FROM Equipment WHERE equipment_id = $1"),
+    # Reservation history pages: the first page, and every later one after a keyset cursor.
+    "user_reservations_first": ("VARCHAR, VARCHAR, INT", """
+    SELECT r.reservation_id, e.name, r.start_date, r.end_date, r.status
+    FROM Reservation r
+    JOIN Equipment e ON r.equipment_id = e.equipment_id
+    WHERE r.username = $1 AND ($2::VARCHAR IS NULL OR r.status = $2)
+    ORDER BY r.start_date DESC, r.reservation_id DESC
+    LIMIT $3"""),
+    "user_reservations_after": ("VARCHAR, VARCHAR, DATE, INT, INT", """
+    SELECT r.reservation_id, e.name, r.start_date, r.end_date, r.status
+    FROM Reservation r
+    JOIN Equipment e ON r.equipment_id = e.equipment_id
+    WHERE r.username = $1 AND ($2::VARCHAR IS NULL OR r.status = $2)
+      AND (r.start_date, r.reservation_id) < ($3, $4)
+    ORDER BY r.start_date DESC, r.reservation_id DESC
+    LIMIT $5"""),
+    "reserve_equipment": ("VARCHAR, INT, DATE, DATE", "SELECT reserve_equipment($1, $2, $3, $4)"),
+}
+
+# connection -> (generation, names prepared on it). A new connection starts empty, and
+# bumping the generation after a migration makes every connection start over.
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+_prepared_generation = 0
+
+
+def invalidate_prepared_statements():
+    global _prepared_generation
+    with _prepared_lock:
+        _prepared_generation += 1
+
+
+def use_prepared_statements():
+    return os.getenv("use_prepared_statements", "true").lower() not in ("0", "false", "no")
+
+
+def _prepare(conn, cursor, name):
+    with _prepared_lock:
+        generation, names = _prepared.get(conn, (_prepared_generation, set()))
+        stale = generation != _prepared_generation
+        if stale:
+            generation, names = _prepared_generation, set()
+        _prepared[conn] = (generation, names)
+    if stale:
+        cursor.execute("DEALLOCATE ALL;")
+    if name not in names:
+        types, sql = PREPARED_STATEMENTS[name]
+        cursor.execute(f"PREPARE {name} ({types}) AS {sql};")
+        names.add(name)
+
+
+def _forget_prepared(conn):
+    with _prepared_lock:
+        if conn in _prepared:
+            _prepared[conn] = (None, set())
+
+
+def execute_prepared(cursor, name, params):
+    if not use_prepared_statements():
+        # $n may repeat, so bind by position number rather than by order of appearance.
+        cursor.execute(re.sub(r"\$(\d+)", r"%(\1)s", PREPARED_STATEMENTS[name][1]) + ";",
+                       {str(i): value for i, value in enumerate(params, 1)})
+        return
+    conn = cursor.connection
+    execute = f"EXECUTE {name} ({', '.join(['%s'] * len(params))});"
+    first_statement = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    try:
+        _prepare(conn, cursor, name)
+        cursor.execute(execute, params)
+    except (pg_errors.InvalidSqlStatementName, pg_errors.FeatureNotSupported):
+        # The statement is gone or its cached plan no longer fits the schema, e.g. after
+        # another process migrated it. Start over; retry if nothing else was lost.
+        _forget_prepared(conn)
+        if not first_statement:
+            raise
+        conn.rollback()
+        _prepare(conn, cursor, name)
+        cursor.execute(execute, params)
 
 
 # Helper Functions
+@timed_query("check_person_exists")
 def check_person_exists(cursor, fullname, email):
     cursor.execute("SELECT check_person_exists(%s, %s);", (email, fullname))
     return cursor.fetchone()[0]
 
 
+@timed_query("check_username_exists")
 def check_username_exists(cursor, username):
     cursor.execute("SELECT check_username_exists(%s);", (username,))
     return cursor.fetchone()[0]
 
 
+@timed_query("check_credentials")
 def check_credentials(cursor, username, password):
     cursor.execute("SELECT check_credentials(%s, %s);", (username, password))
     return cursor.fetchone()[0]
 
 
+def get_password_hash_cost():
+    return int(os.getenv("password_hash_cost", 10))
+
+
+# A successful login rehashes a password stored at another cost than password_hash_cost;
+# the caller's session commits it.
+@timed_query("login")
+def authenticate(cursor, username, password):
+    execute_prepared(cursor, "authenticate", (username, password, get_password_hash_cost()))
+    return cursor.fetchone()
+
+
+@timed_query("register")
 def add_user_account(conn, cursor, email, username, password):
-    cursor.execute("SELECT add_user_account(%s, %s, %s);", (email, username, password))
+    cursor.execute("SELECT add_user_account(%s, %s, %s, %s);", (email, username, password, get_password_hash_cost()))
     result = cursor.fetchone()[0]
     conn.commit()
     return result
 
 
+# For accounts loaded outside the application (e.g. CSVs imported by hand).
+@timed_query("hash_passwords")
+def hash_plaintext_passwords(conn, cursor):
+    cursor.execute("""
+    UPDATE User_Account SET password = crypt(password, gen_salt('bf', %s))
+    WHERE password NOT LIKE '$2_$%%';
+    """, (get_password_hash_cost(),))
+    count = cursor.rowcount
+    conn.commit()
+    return count
+
+
+class SessionCache:
+    # token -> (username, role, account_id, expires_at), least recently used first.
+    def __init__(self, ttl=900, max_sessions=10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, username, role, account_id):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[token] = (username, role, account_id, time.monotonic() + self.ttl)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return token
+
+    def get(self, token):
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None:
+                return None
+            if entry[3] < time.monotonic():
+                del self._sessions[token]
+                return None
+            self._sessions.move_to_end(token)
+            return entry[:3]
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+
+@timed_query("user_role")
 def get_user_role(cursor, email):
     cursor.execute("SELECT role FROM Student_Staff WHERE email = %s;", (email,))
     role = cursor.fetchone()
     return role[0] if role else None
 
 
+_catalog_cache = None
+
+
+def enable_catalog_cache():
+    global _catalog_cache
+    if _catalog_cache is None:
+        from CatalogCache import CatalogCache
+        cache = CatalogCache()
+        cache.start()
+        _catalog_cache = cache
+    return _catalog_cache
+
+
+def disable_catalog_cache():
+    global _catalog_cache
+    if _catalog_cache is not None:
+        _catalog_cache.stop()
+        _catalog_cache = None
+
+
+def catalog_cache_ready():
+    return _catalog_cache is not None and _catalog_cache.connected
+
+
+@timed_query("catalog")
 def view_equipment_catalog(cursor):
+    if catalog_cache_ready():
+        return _catalog_cache.catalog()
     cursor.execute("SELECT equipment_id, name, equipment_condition, equipment_availability FROM Equipment;")
     return cursor.fetchall()
 
 
+@timed_query("availability")
 def check_equipment_availability(cursor, equipment_id):
-    cursor.execute("SELECT equipment_availability FROM Equipment WHERE equipment_id = %s;", (equipment_id,))
+    if catalog_cache_ready():
+        return _catalog_cache.is_available(equipment_id)
+    execute_prepared(cursor, "equipment_availability", (equipment_id,))
     result = cursor.fetchone()
     if result is None:
         return None  
     return result[0]  
 
 
+RESERVATION_OK = "ok"
+EQUIPMENT_CONDITIONS = ('Lost', 'Damaged', 'Worn Out', 'Poor', 'Good')
+
+# SQLSTATE raised by make_reservation_proc -> (result code, message)
+RESERVATION_ERRORS = {
+    "RS001": ("not_found", "There is no equipment with this ID."),
+    "RS002": ("unavailable", "Equipment is currently not available."),
+    "RS003": ("invalid_dates", "Start date cannot be after end date."),
+    "23P01": ("conflict", "Equipment is already reserved for the selected date range."),
+    "23503": ("unknown_user", "No account exists with this username."),
+    "RS004": ("insufficient_units", "Not enough units of this model are free for those dates."),
+}
+RESERVATION_MESSAGES = dict(RESERVATION_ERRORS.values())
+
+
+def reservation_error(error):
+    if error.pgcode in RESERVATION_ERRORS:
+        return RESERVATION_ERRORS[error.pgcode]
+    return "error", (error.pgerror or str(error)).strip()
+
+
+# Returns (code, reservation_id); reservation_id is None unless code is RESERVATION_OK.
+@timed_query("reserve")
 def call_make_reservation_proc(conn, cursor, username, equipment_id, start_date, end_date):
     try:
-        cursor.execute("CALL make_reservation_proc(%s, %s, %s, %s);", (username, equipment_id, start_date, end_date))
+        execute_prepared(cursor, "reserve_equipment", (username, equipment_id, start_date, end_date))
+        reservation_id = cursor.fetchone()[0]
         conn.commit()
-        print("Reservation successful.")
+        note_write(username)
+        print(f"Reservation successful (Reservation ID: {reservation_id}).")
+        return RESERVATION_OK, reservation_id
     except psycopg2.Error as e:
-        print(f"Reservation failed: {e.pgerror.strip()}")
+        conn.rollback()
+        code, message = reservation_error(e)
+        print(f"Reservation failed: {message}")
+        return code, None
+
+
+# items: (username, equipment_id, start_date, end_date) tuples. Returns one
+# (code, reservation_id, message) tuple per item, in the same order.
+@timed_query("reserve_batch")
+def make_reservations_batch(conn, cursor, items, all_or_nothing=True):
+    items = list(items)
+    if not items:
+        return []
+    usernames, equipment_ids, start_dates, end_dates = (list(column) for column in zip(*items))
+    try:
+        cursor.execute("""
+        SELECT item_index, new_reservation_id, error_code, error_message
+        FROM make_reservations_batch(%s::VARCHAR[], %s::INT[], %s::DATE[], %s::DATE[], %s);
+        """, (usernames, equipment_ids, start_dates, end_dates, all_or_nothing))
+        rows = {row[0]: row for row in cursor.fetchall()}
+    except psycopg2.Error as e:
+        conn.rollback()
+        code, message = reservation_error(e)
+        print(f"Batch reservation failed: {message}")
+        return [(code, None, message)] * len(items)
+
+    failed = len(rows) < len(items) or any(row[2] is not None for row in rows.values())
+    rolled_back = all_or_nothing and failed
+    results = []
+    for index in range(1, len(items) + 1):
+        row = rows.get(index)
+        if row is None:
+            results.append(("skipped", None, "Not attempted because another item failed."))
+        elif row[2] is not None:
+            code, message = RESERVATION_ERRORS.get(row[2], ("error", row[3]))
+            results.append((code, None, message))
+        elif rolled_back:
+            results.append(("rolled_back", None, "Rolled back because another item failed."))
+        else:
+            results.append((RESERVATION_OK, row[1], None))
+    if rolled_back:
+        conn.rollback()
+    else:
+        conn.commit()
+        for item, result in zip(items, results):
+            if result[0] == RESERVATION_OK:
+                note_write(item[0])
+    return results
+
+
+# Books quantity free Good units named name, all or none. Returns (code, units, message)
+# where units lists (equipment_id, reservation_id) for each booked unit.
+@timed_query("reserve_model")
+def reserve_by_model(conn, cursor, username, name, quantity, start_date, end_date):
+    if quantity < 1:
+        raise ValueError("Quantity must be at least 1.")
+    try:
+        cursor.execute("SELECT booked_equipment_id, new_reservation_id FROM reserve_by_model(%s, %s, %s, %s, %s);",
+                       (username, name, quantity, start_date, end_date))
+        units = cursor.fetchall()
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        code, message = reservation_error(e)
+        print(f"Reservation failed: {message}")
+        return code, [], message
+    note_write(username)
+    print(f"Reserved {len(units)} x {name}.")
+    return RESERVATION_OK, units, None
+
+
+# Closes every Active or Overdue reservation among reservation_ids in one statement and
+# frees its equipment, optionally recording the condition it came back in. Units with a
+# waitlist get an offer_next_waiter job; the booking for the waiter happens off this path.
+# Returns one (code, equipment_id, message) tuple per id, in order; code is
+# RESERVATION_OK, "not_active" or "not_found". An id listed again after it was returned
+# gets not_active, as it would if the ids were returned one at a time. With username,
+# other users' reservations count as not found.
+@timed_query("return_batch")
+def return_equipment_batch(conn, cursor, reservation_ids, condition=None, username=None):
+    reservation_ids = [int(i) for i in reservation_ids]
+    if not reservation_ids:
+        return []
+    if condition is not None and condition not in EQUIPMENT_CONDITIONS:
+        raise ValueError(f"Invalid condition {condition!r}.")
+    # Overdue bookings are no longer in Active_Reservation, so rows are found by id in
+    # Reservation itself. The final SELECT reads Reservation as it was before the UPDATE,
+    # so ids that could not be returned report the status that stopped them.
+    cursor.execute("""
+    WITH requested AS (
+        SELECT DISTINCT reservation_id FROM unnest(%s::INT[]) AS t(reservation_id)
+    ),
+    returned AS (
+        UPDATE Reservation r SET status = 'Returned'
+        FROM requested q
+        WHERE r.reservation_id = q.reservation_id AND r.status IN ('Active', 'Overdue')
+          AND (%s::VARCHAR IS NULL OR r.username = %s)
+        RETURNING r.reservation_id, r.equipment_id, r.username
+    ),
+    restored AS (
+        UPDATE Equipment e
+        SET equipment_condition = COALESCE(%s, e.equipment_condition),
+            equipment_availability = e.in_service AND COALESCE(%s, e.equipment_condition) NOT IN ('Lost', 'Damaged')
+        WHERE e.equipment_id IN (SELECT equipment_id FROM returned)
+    ),
+    queued AS (
+        INSERT INTO Job_Queue (kind, payload)
+        SELECT 'offer_next_waiter', jsonb_build_object('equipment_id', t.equipment_id)
+        FROM (SELECT DISTINCT equipment_id FROM returned) t
+        WHERE EXISTS (SELECT 1 FROM Waitlist w WHERE w.equipment_id = t.equipment_id AND w.status = 'Waiting')
+    )
+    SELECT q.reservation_id, ret.equipment_id, ret.username, r.status, r.equipment_id
+    FROM requested q
+    LEFT JOIN returned ret ON ret.reservation_id = q.reservation_id
+    LEFT JOIN Reservation r ON r.reservation_id = q.reservation_id AND (%s::VARCHAR IS NULL OR r.username = %s);
+    """, (reservation_ids, username, username, condition, condition, username, username))
+    rows = {row[0]: row for row in cursor.fetchall()}
+    conn.commit()
 
+    results = []
+    returned_ids = set()
+    for reservation_id in reservation_ids:
+        _, returned_equipment_id, owner, status, equipment_id = rows[reservation_id]
+        if reservation_id in returned_ids:
+            results.append(("not_active", returned_equipment_id, "Reservation is Returned, not Active or Overdue."))
+        elif returned_equipment_id is not None:
+            returned_ids.add(reservation_id)
+            note_write(owner)
+            results.append((RESERVATION_OK, returned_equipment_id, None))
+        elif status is None:
+            results.append(("not_found", None, "No reservation with this ID."))
+        else:
+            results.append(("not_active", equipment_id, f"Reservation is {status}, not Active or Overdue."))
+    return results
 
-def return_equipment(conn, cursor, reservation_id):
-    cursor.execute("""
-        SELECT equipment_id FROM Reservation WHERE reservation_id = %s AND status = 'Active';
-    """, (reservation_id,))
-    row = cursor.fetchone()
-    if not row:
+
+@timed_query("return")
+def return_equipment(conn, cursor, reservation_id, condition=None, username=None):
+    code, equipment_id, message = return_equipment_batch(conn, cursor, [reservation_id], condition, username)[0]
+    if code != RESERVATION_OK:
         print("No active reservation found with that ID.")
         return False
-    equipment_id = row[0]
-    cursor.execute("UPDATE Reservation SET status = 'Returned' WHERE reservation_id = %s;", (reservation_id,))
-    cursor.execute("UPDATE Equipment SET equipment_availability = TRUE WHERE equipment_id = %s;", (equipment_id,))
-    conn.commit()
     return True
 
 
+@timed_query("my_reservations")
 def view_user_reservations(cursor, username):
     cursor.execute("""
     SELECT r.reservation_id, e.name, r.start_date, r.end_date, r.status
@@ -252,20 +788,30 @@ def view_user_reservations(cursor, username):
     return cursor.fetchall()
 
 
+# Staff's in_service flag: any condition but Good takes the unit out of service until it is
+# marked Good again. Returns never change it.
+@timed_query("mark_status")
 def mark_equipment_status(conn, cursor, equipment_id, new_status):
     cursor.execute("SELECT equipment_id FROM Equipment WHERE equipment_id = %s;", (equipment_id,))
     if cursor.fetchone() is None:
         print(f"No equipment with ID {equipment_id} found.")
         return False
-    if new_status not in ('Lost', 'Damaged', 'Worn Out', 'Poor', 'Good' ):
+    if new_status not in EQUIPMENT_CONDITIONS:
         print("Invalid status.")
         return False
-    cursor.execute("UPDATE Equipment SET equipment_condition = %s, equipment_availability = FALSE WHERE equipment_id = %s;", (new_status, equipment_id))
+    cursor.execute("""
+    UPDATE Equipment e
+    SET equipment_condition = %s, in_service = %s = 'Good',
+        equipment_availability = %s = 'Good' AND NOT EXISTS (
+            SELECT 1 FROM Active_Reservation a WHERE a.equipment_id = e.equipment_id)
+    WHERE e.equipment_id = %s;
+    """, (new_status, new_status, new_status, equipment_id))
     conn.commit()
     print(f"Equipment {equipment_id} marked as {new_status}.")
     return True
 
 
+@timed_query("mark_overdue")
 def mark_reservation_overdue(conn, cursor, reservation_id):
     cursor.execute("""
         SELECT equipment_id, end_date, status
@@ -294,18 +840,275 @@ def mark_reservation_overdue(conn, cursor, reservation_id):
     return True
 
 
-def get_top_borrowed_equipment(cursor):
+@timed_query("overdue_sweep")
+def sweep_overdue_reservations(conn, cursor):
+    started = time.perf_counter()
     cursor.execute("""
-    SELECT e.name, COUNT(r.reservation_id) AS borrow_count
-    FROM Equipment e
-    JOIN Reservation r ON e.equipment_id = r.equipment_id
-    GROUP BY e.name
-    ORDER BY borrow_count DESC
-    LIMIT 3;
+    WITH overdue AS (
+        UPDATE Reservation r SET status = 'Overdue'
+        FROM Active_Reservation a
+        WHERE a.end_date < CURRENT_DATE
+          AND r.reservation_id = a.reservation_id AND r.start_date = a.start_date AND r.status = 'Active'
+        RETURNING r.equipment_id
+    ), flagged AS (
+        UPDATE Equipment SET equipment_availability = FALSE
+        WHERE equipment_id IN (SELECT equipment_id FROM overdue) AND equipment_availability
+    )
+    SELECT COUNT(*) FROM overdue;
     """)
+    count = cursor.fetchone()[0]
+    conn.commit()
+    return count, time.perf_counter() - started
+
+
+class OverdueSweeper:
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="overdue-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run_once(self):
+        try:
+            with db_session() as (conn, cursor):
+                count, elapsed = sweep_overdue_reservations(conn, cursor)
+            print(f"Overdue sweep: {count} reservations marked overdue in {elapsed * 1000:.1f} ms.")
+        except Exception as e:
+            print(f"Overdue sweep failed: {e}")
+        # Keeps upcoming months' partitions ahead of the bookings; a no-op once they exist.
+        try:
+            with db_session() as (conn, cursor):
+                created = ensure_reservation_partitions(conn, cursor)
+            if created:
+                print(f"Created {created} new Reservation partitions.")
+        except Exception as e:
+            print(f"Could not create Reservation partitions: {e}")
+
+    def run_forever(self):
+        self.run_once()
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+
+# Partition maintenance
+# Reservation is partitioned by month of start_date (reservation_YYYY_MM), with everything
+# from before the migration's first month in reservation_history. Archiving detaches
+# partitions that ended keep_months ago and hold no Active or Overdue booking, and moves
+# them to the reservation_archive schema, or exports them to gzip CSV and drops them.
+# Equipment_Usage_Daily is left alone, so the top-borrowed report keeps their history.
+ARCHIVE_SCHEMA = "reservation_archive"
+
+
+def list_reservation_partitions(cursor):
+    cursor.execute("""
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'reservation'::regclass
+    ORDER BY c.relname;
+    """)
+    partitions = []
+    for name, bound in cursor.fetchall():
+        upper = re.search(r"TO \('([0-9-]+)'\)", bound)
+        partitions.append((name, date.fromisoformat(upper.group(1)) if upper else None))
+    return partitions
+
+
+# Bookings never create partitions themselves; until this has run for their month they
+# wait in reservation_default, and are moved into the new partition when it is made.
+@timed_query("partition_maintenance")
+def ensure_reservation_partitions(conn, cursor, months_ahead=3, lock_timeout="5s"):
+    cursor.execute("SET LOCAL lock_timeout = %s;", (lock_timeout,))
+    cursor.execute("SELECT ensure_reservation_partitions(%s);", (months_ahead,))
+    created = cursor.fetchone()[0]
+    conn.commit()
+    return created
+
+
+@timed_query("partition_maintenance")
+def archive_reservation_partitions(conn, cursor, keep_months=12, export_dir=None, compress_level=6, lock_timeout="5s"):
+    first_kept = date.today().replace(day=1)
+    for _ in range(keep_months):
+        first_kept = (first_kept - timedelta(days=1)).replace(day=1)
+    archived = []
+    for name, upper in list_reservation_partitions(cursor):
+        if upper is None or upper > first_kept:
+            continue
+        partition = pg_sql.Identifier(name)
+        archived_table = pg_sql.Identifier(ARCHIVE_SCHEMA, name)
+        try:
+            # DETACH locks Reservation; give up rather than queue bookings behind us.
+            cursor.execute("SET LOCAL lock_timeout = %s;", (lock_timeout,))
+            cursor.execute(pg_sql.SQL("ALTER TABLE Reservation DETACH PARTITION {};").format(partition))
+            # Checked only once detached: until this transaction ends nothing can write to
+            # the partition, so a booking cannot slip in between the check and the detach.
+            cursor.execute(pg_sql.SQL("SELECT EXISTS (SELECT 1 FROM {} WHERE status IN ('Active', 'Overdue'));").format(partition))
+            if cursor.fetchone()[0]:
+                conn.rollback()
+                continue
+            cursor.execute(pg_sql.SQL("CREATE SCHEMA IF NOT EXISTS {};").format(pg_sql.Identifier(ARCHIVE_SCHEMA)))
+            cursor.execute(pg_sql.SQL("ALTER TABLE {} SET SCHEMA {};").format(partition, pg_sql.Identifier(ARCHIVE_SCHEMA)))
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"Could not archive partition {name}: {(e.pgerror or str(e)).strip()}")
+            continue
+        destination = f"{ARCHIVE_SCHEMA}.{name}"
+        if export_dir:
+            path = os.path.join(export_dir, f"{name}.csv.gz")
+            with gzip.open(path, "wb", compresslevel=compress_level) as out:
+                cursor.copy_expert(pg_sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(archived_table), out)
+            cursor.execute(pg_sql.SQL("DROP TABLE {};").format(archived_table))
+            conn.commit()
+            destination = path
+        archived.append((name, destination))
+    return archived
+
+
+# Waitlist and job queue
+# A user refused a booking can wait for the unit. Returns queue an offer_next_waiter job
+# for units with waiters, and JobWorkers threads claim jobs FOR UPDATE SKIP LOCKED, so any
+# number of workers, in any number of processes, share the queue without double work.
+# Offers are only queued when a booking is returned, and a unit that is Lost, Damaged or
+# taken out of service takes no bookings, so it would never serve its waiters. Returns None
+# without waitlisting for such a unit, or one that does not exist.
+@timed_query("waitlist")
+def join_waitlist(conn, cursor, username, equipment_id, start_date, end_date):
+    cursor.execute("""
+    INSERT INTO Waitlist (username, equipment_id, start_date, end_date)
+    SELECT %s, e.equipment_id, %s, %s
+    FROM Equipment e
+    WHERE e.equipment_id = %s
+      AND e.equipment_condition NOT IN ('Lost', 'Damaged')
+      AND e.in_service
+    RETURNING waitlist_id;
+    """, (username, start_date, end_date, equipment_id))
+    row = cursor.fetchone()
+    conn.commit()
+    return row[0] if row else None
+
+
+@timed_query("waitlist")
+def view_waitlist(cursor, username):
+    cursor.execute("""
+    SELECT waitlist_id, equipment_id, start_date, end_date, status, reservation_id
+    FROM Waitlist
+    WHERE username = %s
+    ORDER BY created_at DESC;
+    """, (username,))
     return cursor.fetchall()
 
 
+# Job handlers run inside the worker's transaction and return the usernames they wrote for.
+def _offer_next_waiter(conn, cursor, payload):
+    cursor.execute("SELECT fulfilled_username FROM offer_to_waiters(%s);", (payload["equipment_id"],))
+    return [row[0] for row in cursor.fetchall()]
+
+
+JOB_HANDLERS = {
+    "offer_next_waiter": _offer_next_waiter,
+}
+
+
+# Claims up to batch_size due jobs and runs each in its own savepoint; the claim locks
+# are held until the batch commits, so a crashed worker's jobs simply become due again.
+# Returns the number of jobs claimed.
+@timed_query("job_queue")
+def run_due_jobs(conn, cursor, batch_size=10, max_attempts=5, retry_delay=30):
+    cursor.execute("""
+    SELECT job_id, kind, payload, attempts
+    FROM Job_Queue
+    WHERE status = 'Queued' AND run_at <= now()
+    ORDER BY run_at, job_id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED;
+    """, (batch_size,))
+    jobs = cursor.fetchall()
+    wrote_for = []
+    for job_id, kind, payload, attempts in jobs:
+        cursor.execute("SAVEPOINT job;")
+        try:
+            handler = JOB_HANDLERS.get(kind)
+            if handler is None:
+                raise ValueError(f"Unknown job kind {kind!r}.")
+            wrote_for.extend(handler(conn, cursor, payload))
+            cursor.execute("DELETE FROM Job_Queue WHERE job_id = %s;", (job_id,))
+            cursor.execute("RELEASE SAVEPOINT job;")
+        except (psycopg2.Error, ValueError, KeyError, TypeError) as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT job;")
+            error = (getattr(e, "pgerror", None) or str(e)).strip()
+            cursor.execute("""
+            UPDATE Job_Queue
+            SET attempts = attempts + 1,
+                last_error = %s,
+                status = CASE WHEN attempts + 1 >= %s THEN 'Failed' ELSE 'Queued' END,
+                run_at = now() + %s * (attempts + 1) * INTERVAL '1 second'
+            WHERE job_id = %s;
+            """, (error, max_attempts, retry_delay, job_id))
+            print(f"Job {job_id} ({kind}) failed: {error}")
+    conn.commit()
+    for username in wrote_for:
+        note_write(username)
+    return len(jobs)
+
+
+class JobWorkers:
+    def __init__(self, workers=2, poll_interval=1.0, batch_size=10):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.run_forever, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                with db_session() as (conn, cursor):
+                    claimed = run_due_jobs(conn, cursor, self.batch_size)
+            except Exception as e:
+                print(f"Job worker failed: {e}")
+                claimed = 0
+            # A full batch means more may be waiting; otherwise poll.
+            if claimed < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+
+# Answered from Equipment_Usage_Daily, which triggers on Reservation keep current,
+# so the cost depends on the window length rather than the size of the history.
+@timed_query("top_equipment")
+def get_top_borrowed_equipment(cursor, limit=3, since=None, until=None):
+    where, params = _where([("usage_date >= %s", since), ("usage_date <= %s", until)])
+    cursor.execute(f"""
+    SELECT name, SUM(borrow_count) AS borrow_count
+    FROM Equipment_Usage_Daily{where}
+    GROUP BY name
+    HAVING SUM(borrow_count) > 0
+    ORDER BY borrow_count DESC, name
+    LIMIT %s;
+    """, params + [limit])
+    return cursor.fetchall()
+
+
+@timed_query("overdue")
 def view_overdue_reservations(cursor):
     cursor.execute("""
     SELECT r.reservation_id, r.username, e.name, r.start_date, r.end_date, r.status
@@ -317,6 +1120,324 @@ def view_overdue_reservations(cursor):
     return cursor.fetchall()
 
 
+# Streaming and paginated reads
+# The iter_* generators read through a server-side (named) cursor, batch_size rows per
+# round trip, so memory stays flat however large the table. The *_page functions use
+# keyset pagination and return (rows, next_token); next_token is None on the last page.
+_stream_ids = itertools.count(1)
+
+
+# Only the DECLARE is timed; the FETCHes run while the caller iterates.
+def _stream(conn, query, params, batch_size, query_name):
+    with conn.cursor(name=f"stream_{next(_stream_ids)}") as cursor:
+        cursor.itersize = batch_size
+        with Metrics.query_label(query_name):
+            cursor.execute(query, params)
+        yield from cursor
+
+
+def _where(filters):
+    used = [(clause, value) for clause, value in filters if value is not None]
+    if not used:
+        return "", []
+    return " WHERE " + " AND ".join(clause for clause, value in used), [value for clause, value in used]
+
+
+def _page(rows, limit, key):
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_page_token(*key(rows[-1]))
+    return rows, None
+
+
+def encode_page_token(*values):
+    raw = "|".join(str(value) for value in values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_page_token(token, *types):
+    raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+    parts = raw.split("|")
+    if len(parts) != len(types):
+        raise ValueError("Invalid page token.")
+    return [convert(part) for convert, part in zip(types, parts)]
+
+
+def _equipment_filters(name, condition, available):
+    return [
+        ("name = %s", name),
+        ("equipment_condition = %s", condition),
+        ("equipment_availability = %s", available),
+    ]
+
+
+def _matches_equipment(row, name, condition, available):
+    return ((name is None or row[1] == name)
+            and (condition is None or row[2] == condition)
+            and (available is None or row[3] == available))
+
+
+def iter_equipment_catalog(conn, name=None, condition=None, available=None, batch_size=1000):
+    if catalog_cache_ready():
+        return (row for row in _catalog_cache.catalog() if _matches_equipment(row, name, condition, available))
+    where, params = _where(_equipment_filters(name, condition, available))
+    return _stream(conn, f"""
+    SELECT equipment_id, name, equipment_condition, equipment_availability
+    FROM Equipment{where}
+    ORDER BY equipment_id;
+    """, params, batch_size, "catalog")
+
+
+@timed_query("catalog")
+def get_equipment_page(cursor, after=None, limit=50, name=None, condition=None, available=None):
+    after_id = decode_page_token(after, int)[0] if after else None
+    if catalog_cache_ready():
+        rows = _catalog_cache.page(after_id, limit + 1, lambda row: _matches_equipment(row, name, condition, available))
+    else:
+        where, params = _where(_equipment_filters(name, condition, available) + [("equipment_id > %s", after_id)])
+        cursor.execute(f"""
+        SELECT equipment_id, name, equipment_condition, equipment_availability
+        FROM Equipment{where}
+        ORDER BY equipment_id
+        LIMIT %s;
+        """, params + [limit + 1])
+        rows = cursor.fetchall()
+    return _page(rows, limit, lambda row: (row[0],))
+
+
+def iter_user_reservations(conn, username, status=None, batch_size=1000):
+    where, params = _where([("r.username = %s", username), ("r.status = %s", status)])
+    return _stream(conn, f"""
+    SELECT r.reservation_id, e.name, r.start_date, r.end_date, r.status
+    FROM Reservation r
+    JOIN Equipment e ON r.equipment_id = e.equipment_id{where}
+    ORDER BY r.start_date DESC, r.reservation_id DESC;
+    """, params, batch_size, "my_reservations")
+
+
+@timed_query("my_reservations")
+def get_user_reservations_page(cursor, username, after=None, limit=50, status=None):
+    if after:
+        start_date, reservation_id = decode_page_token(after, date.fromisoformat, int)
+        execute_prepared(cursor, "user_reservations_after", (username, status, start_date, reservation_id, limit + 1))
+    else:
+        execute_prepared(cursor, "user_reservations_first", (username, status, limit + 1))
+    return _page(cursor.fetchall(), limit, lambda row: (row[2], row[0]))
+
+
+def iter_overdue_reservations(conn, batch_size=1000):
+    return _stream(conn, """
+    SELECT r.reservation_id, r.username, e.name, r.start_date, r.end_date, r.status
+    FROM Reservation r
+    JOIN Equipment e ON r.equipment_id = e.equipment_id
+    WHERE r.status = 'Overdue'
+    ORDER BY r.end_date ASC, r.reservation_id ASC;
+    """, [], batch_size, "overdue")
+
+
+@timed_query("overdue")
+def get_overdue_page(cursor, after=None, limit=50):
+    where, params = " WHERE r.status = 'Overdue'", []
+    if after:
+        where += " AND (r.end_date, r.reservation_id) > (%s, %s)"
+        params += decode_page_token(after, date.fromisoformat, int)
+    cursor.execute(f"""
+    SELECT r.reservation_id, r.username, e.name, r.start_date, r.end_date, r.status
+    FROM Reservation r
+    JOIN Equipment e ON r.equipment_id = e.equipment_id{where}
+    ORDER BY r.end_date ASC, r.reservation_id ASC
+    LIMIT %s;
+    """, params + [limit + 1])
+    return _page(cursor.fetchall(), limit, lambda row: (row[4], row[0]))
+
+
+# Date-range availability search
+# A unit is bookable unless it is Lost/Damaged, taken out of service by staff, or still out
+# on an Overdue booking (the same rule as reserve_equipment). The overlap probes use the
+# GiST index behind reservation_no_overlap on Active_Reservation.
+@timed_query("search")
+def search_available_equipment(cursor, start_date, end_date, name=None, condition=None):
+    where, params = _where([("e.name = %s", name), ("e.equipment_condition = %s", condition)])
+    where = (where + " AND" if where else " WHERE")
+    cursor.execute(f"""
+    SELECT e.equipment_id, e.name, e.equipment_condition, e.equipment_availability
+    FROM Equipment e{where}
+        e.equipment_condition NOT IN ('Lost', 'Damaged')
+        AND e.in_service
+        AND NOT EXISTS (
+            SELECT 1 FROM Reservation r WHERE r.equipment_id = e.equipment_id AND r.status = 'Overdue')
+        AND NOT EXISTS (
+            SELECT 1 FROM Active_Reservation a
+            WHERE a.equipment_id = e.equipment_id AND a.period && daterange(%s, %s, '[]'))
+    ORDER BY e.equipment_id;
+    """, params + [start_date, end_date])
+    return cursor.fetchall()
+
+
+# Returns {equipment_id: [(day, free), ...]} covering start_date..end_date, once per unit
+# and only for units that exist. Each unit's active bookings in the window are merged into
+# one multirange, then tested per day; a unit search_available_equipment would leave out
+# (Lost/Damaged, out of service or held by an Overdue booking) is never free.
+@timed_query("calendar")
+def get_availability_calendar(cursor, equipment_ids, start_date, end_date):
+    cursor.execute("""
+    SELECT u.equipment_id, d::DATE, u.bookable AND NOT COALESCE(b.booked @> d::DATE, FALSE)
+    FROM (
+        SELECT e.equipment_id,
+               e.equipment_condition NOT IN ('Lost', 'Damaged') AND e.in_service AND NOT EXISTS (
+                   SELECT 1 FROM Reservation r WHERE r.equipment_id = e.equipment_id AND r.status = 'Overdue'
+               ) AS bookable
+        FROM Equipment e
+        WHERE e.equipment_id = ANY(%s::INT[])
+    ) u
+    LEFT JOIN LATERAL (
+        SELECT range_agg(a.period) AS booked
+        FROM Active_Reservation a
+        WHERE a.equipment_id = u.equipment_id AND a.period && daterange(%s, %s, '[]')
+    ) b ON TRUE
+    CROSS JOIN generate_series(%s::DATE, %s::DATE, INTERVAL '1 day') AS d
+    ORDER BY u.equipment_id, d;
+    """, (list(set(equipment_ids)), start_date, end_date, start_date, end_date))
+    calendar = {}
+    for equipment_id, day, free in cursor.fetchall():
+        calendar.setdefault(equipment_id, []).append((day, free))
+    return calendar
+
+
+# Bulk account onboarding
+# Registrar export columns: fullname, email, role, username, password. Rows without
+# fullname only add an account for an existing person; rows without username only
+# upsert the person. Rejected rows are reported, never fatal to the batch.
+@timed_query("import_accounts")
+def bulk_import_accounts(conn, cursor, csv_file):
+    cursor.execute("""
+    CREATE TEMP TABLE Account_Import (
+        line_no SERIAL,
+        fullname TEXT,
+        email TEXT,
+        role TEXT,
+        username TEXT,
+        password TEXT,
+        reject_reason VARCHAR(30)
+    ) ON COMMIT DROP;
+    """)
+    cursor.copy_expert(
+        "COPY Account_Import (fullname, email, role, username, password) FROM STDIN WITH (FORMAT csv, HEADER true)",
+        csv_file
+    )
+    # Staged as TEXT so an over-long value is rejected here instead of failing the COPY.
+    # Passwords are stored as bcrypt hashes, so their length does not matter.
+    cursor.execute("""
+    UPDATE Account_Import a SET reject_reason = t.reason
+    FROM (
+        SELECT DISTINCT ON (i.line_no) i.line_no, 'too_long_' || v.column_name AS reason
+        FROM Account_Import i
+        CROSS JOIN LATERAL (VALUES
+            (1, 'student_staff', 'fullname', i.fullname),
+            (2, 'student_staff', 'email', i.email),
+            (3, 'student_staff', 'role', i.role),
+            (4, 'user_account', 'username', i.username)
+        ) AS v(position, table_name, column_name, value)
+        JOIN information_schema.columns c
+          ON c.table_schema = current_schema() AND c.table_name = v.table_name AND c.column_name = v.column_name
+        WHERE length(v.value) > c.character_maximum_length
+        ORDER BY i.line_no, v.position
+    ) t
+    WHERE a.line_no = t.line_no;
+
+    UPDATE Account_Import SET reject_reason = 'missing_email' WHERE reject_reason IS NULL AND email IS NULL;
+
+    UPDATE Account_Import SET reject_reason = 'invalid_role'
+    WHERE reject_reason IS NULL AND role IS NOT NULL AND role NOT IN ('Student', 'Staff');
+
+    UPDATE Account_Import a SET reject_reason = 'missing_role'
+    WHERE a.reject_reason IS NULL AND a.role IS NULL AND a.fullname IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM Student_Staff ss WHERE ss.email = a.email);
+
+    UPDATE Account_Import SET reject_reason = 'missing_password'
+    WHERE reject_reason IS NULL AND username IS NOT NULL AND password IS NULL;
+
+    UPDATE Account_Import a SET reject_reason = 'duplicate_email'
+    FROM (SELECT line_no, row_number() OVER (PARTITION BY email ORDER BY line_no) AS n
+          FROM Account_Import WHERE reject_reason IS NULL) d
+    WHERE a.line_no = d.line_no AND d.n > 1;
+
+    UPDATE Account_Import a SET reject_reason = 'duplicate_username'
+    FROM (SELECT line_no, row_number() OVER (PARTITION BY username ORDER BY line_no) AS n
+          FROM Account_Import WHERE reject_reason IS NULL AND username IS NOT NULL) d
+    WHERE a.line_no = d.line_no AND d.n > 1;
+
+    UPDATE Account_Import a SET reject_reason = 'duplicate_username'
+    WHERE a.reject_reason IS NULL AND EXISTS (
+        SELECT 1 FROM User_Account ua JOIN Student_Staff ss ON ss.id = ua.id
+        WHERE ua.username = a.username AND ss.email <> a.email);
+
+    UPDATE Account_Import a SET reject_reason = 'account_exists'
+    WHERE a.reject_reason IS NULL AND a.username IS NOT NULL AND EXISTS (
+        SELECT 1 FROM User_Account ua JOIN Student_Staff ss ON ss.id = ua.id
+        WHERE ss.email = a.email AND ua.username <> a.username);
+
+    UPDATE Account_Import a SET reject_reason = 'unknown_person'
+    WHERE a.reject_reason IS NULL AND a.fullname IS NULL
+      AND NOT EXISTS (SELECT 1 FROM Student_Staff ss WHERE ss.email = a.email);
+    """)
+    cursor.execute("""
+    INSERT INTO Student_Staff (fullname, email, role)
+    SELECT fullname, email, role FROM Account_Import
+    WHERE reject_reason IS NULL AND fullname IS NOT NULL
+    ON CONFLICT (email) DO UPDATE
+        SET fullname = EXCLUDED.fullname, role = COALESCE(EXCLUDED.role, Student_Staff.role);
+    """)
+    people = cursor.rowcount
+    cursor.execute("""
+    INSERT INTO User_Account (id, username, password)
+    SELECT ss.id, a.username, crypt(a.password, gen_salt('bf', %s))
+    FROM Account_Import a JOIN Student_Staff ss ON ss.email = a.email
+    WHERE a.reject_reason IS NULL AND a.username IS NOT NULL
+    ON CONFLICT (id) DO UPDATE SET password = EXCLUDED.password;
+    """, (get_password_hash_cost(),))
+    accounts = cursor.rowcount
+    cursor.execute("""
+    SELECT line_no + 1, email, username, reject_reason
+    FROM Account_Import WHERE reject_reason IS NOT NULL ORDER BY line_no;
+    """)
+    rejected = cursor.fetchall()
+    conn.commit()
+    return people, accounts, rejected
+
+
+# History export
+# COPY ... TO STDOUT hands rows straight from the server to the output file in chunks,
+# so memory stays flat and nothing is built up in Python. Rows come in no particular order.
+RESERVATION_STATUSES = ('Active', 'Overdue', 'Returned')
+HISTORY_COLUMNS = """
+    r.reservation_id, r.username, s.fullname, s.email, s.role,
+    r.equipment_id, e.name AS equipment_name, e.equipment_condition,
+    r.start_date, r.end_date, r.status
+"""
+
+
+# Exports reservations that start between start_date and end_date (either may be None)
+# with any of statuses to out, a binary file. Returns the number of rows written.
+@timed_query("export_history")
+def export_reservation_history(cursor, out, start_date=None, end_date=None, statuses=None):
+    where, params = _where([
+        ("r.start_date >= %s", start_date),
+        ("r.start_date <= %s", end_date),
+        ("r.status = ANY(%s)", list(statuses) if statuses else None),
+    ])
+    # COPY takes no bind parameters, so they are interpolated client-side by mogrify.
+    query = cursor.mogrify(f"""
+    SELECT {HISTORY_COLUMNS}
+    FROM Reservation r
+    JOIN Equipment e ON e.equipment_id = r.equipment_id
+    JOIN User_Account u ON u.username = r.username
+    JOIN Student_Staff s ON s.id = u.id{where}
+    """, params)
+    cursor.copy_expert(b"COPY (" + query + b") TO STDOUT WITH (FORMAT csv, HEADER)", out)
+    return cursor.rowcount
+
+
 #Login information
 def input_account_info():
     full_name = input("\nEnter full name: ")
@@ -340,9 +1461,8 @@ def validate_date_format(date_str):
 
 
 #Menu & main functions
-def student_menu(conn, cursor, username):
+def student_menu(username):
     while True:
-        conn.rollback()
         print("""
 Student Menu:
 1. View equipment catalog
@@ -350,21 +1470,24 @@ Student Menu:
 3. Make a reservation
 4. Return equipment
 5. View my reservations
+6. Search equipment free between two dates
+7. Reserve any free units of a model
+8. View my waitlist
 0. Logout
         """)
         choice = input("Choose an option: ")
         if choice == '1':
             try:
-                catalog = view_equipment_catalog(cursor)
-                for eq in catalog:
-                    print(f"ID: {eq[0]}, Name: {eq[1]}, Condition: {eq[2]}, Available: {'Yes' if eq[3] else 'No'}")
+                with read_session(username) as (conn, cursor):
+                    for eq in iter_equipment_catalog(conn):
+                        print(f"ID: {eq[0]}, Name: {eq[1]}, Condition: {eq[2]}, Available: {'Yes' if eq[3] else 'No'}")
             except Exception as e:
-                conn.rollback()
                 print(f"Error fetching catalog: {e}")
         elif choice == '2':
             try:
                 equipment_id = int(input("Enter equipment ID to check availability: "))
-                available = check_equipment_availability(cursor, equipment_id)
+                with read_session(username) as (conn, cursor):
+                    available = check_equipment_availability(cursor, equipment_id)
                 if available is None:
                     print("There is no equipment with this ID.")
                 elif available:
@@ -374,7 +1497,6 @@ Student Menu:
             except ValueError:
                 print("Invalid equipment ID. Please enter a number.")
             except Exception as e:
-                conn.rollback()
                 print(f"Error checking availability: {e}")
         elif choice == '3':
             try:
@@ -389,39 +1511,119 @@ Student Menu:
                 if start_date > end_date:
                     print("Start date cannot be after end date.")
                     continue
-                call_make_reservation_proc(conn, cursor, username, equipment_id, start_date, end_date)
+                with db_session() as (conn, cursor):
+                    code, _ = call_make_reservation_proc(conn, cursor, username, equipment_id, start_date, end_date)
+                if code in ("conflict", "unavailable") and input("Join the waitlist? (y/n): ").strip().lower() == 'y':
+                    with db_session() as (conn, cursor):
+                        waitlist_id = join_waitlist(conn, cursor, username, equipment_id, start_date, end_date)
+                    if waitlist_id is None:
+                        print("This equipment is out of service, so there is no waitlist for it.")
+                    else:
+                        print(f"Added to the waitlist (Waitlist ID: {waitlist_id}). You will be booked if it frees up.")
             except ValueError:
                 print("Invalid input. Please enter numeric values where required.")
             except Exception as e:
-                conn.rollback()
                 print(f"Reservation failed: {e}")
         elif choice == '4':
             try:
                 reservation_id = int(input("Enter reservation ID to return: "))
-                success = return_equipment(conn, cursor, reservation_id)
+                with db_session() as (conn, cursor):
+                    success = return_equipment(conn, cursor, reservation_id, username=username)
                 if success:
                     print("Equipment returned successfully!")
             except ValueError:
                 print("Invalid reservation ID. Please enter a number.")
             except Exception as e:
-                conn.rollback()
                 print(f"Return failed: {e}")
         elif choice == '5':
             try:
-                reservations = view_user_reservations(cursor, username)
-                for r in reservations:
-                    print(f"Reservation ID: {r[0]}, Equipment: {r[1]}, From: {r[2]}, To: {r[3]}, Status: {r[4]}")
+                with read_session(username) as (conn, cursor):
+                    for r in iter_user_reservations(conn, username):
+                        print(f"Reservation ID: {r[0]}, Equipment: {r[1]}, From: {r[2]}, To: {r[3]}, Status: {r[4]}")
             except Exception as e:
-                conn.rollback()
                 print(f"Failed to fetch reservations: {e}")
+        elif choice == '6':
+            try:
+                start_date = validate_date_format(input("Enter start date (YYYY-MM-DD): "))
+                end_date = validate_date_format(input("Enter end date (YYYY-MM-DD): "))
+                if not start_date or not end_date:
+                    print("Invalid date format. Please use YYYY-MM-DD.")
+                    continue
+                if start_date > end_date:
+                    print("Start date cannot be after end date.")
+                    continue
+                name = input("Equipment name (leave empty for any): ").strip() or None
+                with read_session(username) as (conn, cursor):
+                    free = search_available_equipment(cursor, start_date, end_date, name)
+                if not free:
+                    print("No equipment is free for those dates.")
+                for eq in free:
+                    print(f"ID: {eq[0]}, Name: {eq[1]}, Condition: {eq[2]}")
+            except Exception as e:
+                print(f"Search failed: {e}")
+        elif choice == '7':
+            try:
+                name = input("Equipment name (e.g. Laptop): ").strip()
+                quantity = int(input("How many units: "))
+                start_date = validate_date_format(input("Enter start date (YYYY-MM-DD): "))
+                end_date = validate_date_format(input("Enter end date (YYYY-MM-DD): "))
+                if not start_date or not end_date:
+                    print("Invalid date format. Please use YYYY-MM-DD.")
+                    continue
+                if quantity < 1:
+                    print("Quantity must be at least 1.")
+                    continue
+                with db_session() as (conn, cursor):
+                    code, units, message = reserve_by_model(conn, cursor, username, name, quantity, start_date, end_date)
+                for equipment_id, reservation_id in units:
+                    print(f"Equipment {equipment_id}: reserved (Reservation ID: {reservation_id})")
+            except ValueError:
+                print("Invalid quantity. Please enter a number.")
+            except Exception as e:
+                print(f"Reservation failed: {e}")
+        elif choice == '8':
+            try:
+                with db_session() as (conn, cursor):
+                    entries = view_waitlist(cursor, username)
+                if not entries:
+                    print("You are not on any waitlist.")
+                for w in entries:
+                    booked = f", Reservation ID: {w[5]}" if w[5] is not None else ""
+                    print(f"Waitlist ID: {w[0]}, Equipment: {w[1]}, From: {w[2]}, To: {w[3]}, Status: {w[4]}{booked}")
+            except Exception as e:
+                print(f"Failed to fetch waitlist: {e}")
         elif choice == '0':
             break
         else:
             print("Invalid option.")
 
 
-def staff_menu(conn, cursor, username):
-    conn.rollback()
+def _format_bound(histogram, p):
+    bound = histogram.percentile_bound(p)
+    return f"<={bound * 1000:g}" if bound is not None else f">{Metrics.BUCKETS[-1] * 1000:g}"
+
+
+def print_performance_stats():
+    # Counts cover this process only, since it started.
+    print(f"{'Query':<24}{'Calls':>8}{'Errors':>8}{'Rows':>10}{'Avg ms':>10}{'p95 ms':>10}")
+    for name, stats in Metrics.REGISTRY.query_stats():
+        latency = stats.latency
+        print(f"{name:<24}{latency.count:>8}{stats.errors:>8}{stats.rows:>10}"
+              f"{latency.sum / latency.count * 1000:>10.2f}{_format_bound(latency, 95):>10}")
+    wait = Metrics.REGISTRY.pool_wait()
+    if wait.count:
+        print(f"Pool wait: {wait.count} checkouts, avg {wait.sum / wait.count * 1000:.2f} ms, p95 {_format_bound(wait, 95)} ms")
+    for outcome, duration in Metrics.REGISTRY.transactions():
+        print(f"Transactions ({outcome}): {duration.count}, avg {duration.sum / duration.count * 1000:.2f} ms, "
+              f"p95 {_format_bound(duration, 95)} ms")
+    print(f"Slow query threshold: {Metrics.REGISTRY.slow_query_seconds * 1000:g} ms")
+    router = init_router()
+    if router is not None:
+        for name, lag in router.status():
+            print(f"Replica {name}: {'unreachable or unchecked' if lag is None else f'{lag:.1f}s behind'}")
+
+
+def staff_menu(username):
     while True:
         print("""
 Staff Menu:
@@ -430,61 +1632,112 @@ Staff Menu:
 3. Mark equipment condition as Lost, Damaged, Poor or Good
 4. View top 3 most borrowed equipment
 5. Mark reservation as overdue
+6. Reserve a kit of equipment
+7. Mark all overdue reservations now
+8. View performance stats
+9. Return a batch of scanned reservations
 0. Logout
         """)
         choice = input("Choose an option: ")
         if choice == '1':
             try:
-                catalog = view_equipment_catalog(cursor)
-                for eq in catalog:
-                    print(f"ID: {eq[0]}, Name: {eq[1]}, Condition: {eq[2]}, Available: {'Yes' if eq[3] else 'No'}")
+                with read_session(username) as (conn, cursor):
+                    for eq in iter_equipment_catalog(conn):
+                        print(f"ID: {eq[0]}, Name: {eq[1]}, Condition: {eq[2]}, Available: {'Yes' if eq[3] else 'No'}")
             except Exception as e:
-                conn.rollback()
                 print(f"Error fetching catalog: {e}")
         elif choice == '2':
             try:
-                overdue = view_overdue_reservations(cursor)
-                for o in overdue:
-                    print(f"Reservation ID: {o[0]}, User: {o[1]}, Equipment: {o[2]}, From: {o[3]}, To: {o[4]}, Status: {o[5]}")
+                with read_session() as (conn, cursor):
+                    for o in iter_overdue_reservations(conn):
+                        print(f"Reservation ID: {o[0]}, User: {o[1]}, Equipment: {o[2]}, From: {o[3]}, To: {o[4]}, Status: {o[5]}")
             except Exception as e:
-                conn.rollback()
                 print(f"Error fetching overdue reservations: {e}")
         elif choice == '3':
             try:
                 equipment_id = int(input("Enter equipment ID to update status: "))
                 new_status = input("Enter new status (Returned, Lost, Damaged, Worn Out, Poor, Good): ")
-                mark_equipment_status(conn, cursor, equipment_id, new_status)
+                with db_session() as (conn, cursor):
+                    mark_equipment_status(conn, cursor, equipment_id, new_status)
             except ValueError:
                 print("Invalid equipment ID.")
             except Exception as e:
-                conn.rollback()
                 print(f"Error updating equipment status: {e}")
         elif choice == '4':
             try:
-                top_equipment = get_top_borrowed_equipment(cursor)
+                with read_session() as (conn, cursor):
+                    top_equipment = get_top_borrowed_equipment(cursor)
                 for i, e in enumerate(top_equipment, 1):
                     print(f"{i}. {e[0]} (Borrowed {e[1]} times)")
             except Exception as e:
-                conn.rollback()
                 print(f"Error fetching top equipment: {e}")
         elif choice == '5':
             try:
                 reservation_id = int(input("Enter reservation ID to mark as overdue: "))
-                mark_reservation_overdue(conn, cursor, reservation_id)
+                with db_session() as (conn, cursor):
+                    mark_reservation_overdue(conn, cursor, reservation_id)
             except ValueError:
                 print("Invalid reservation ID.")
             except Exception as e:
-                conn.rollback()
                 print(f"Error marking overdue: {e}")
+        elif choice == '6':
+            try:
+                equipment_ids = [int(i) for i in input("Enter equipment IDs separated by commas: ").split(",")]
+                start_date = validate_date_format(input("Enter start date (YYYY-MM-DD): "))
+                end_date = validate_date_format(input("Enter end date (YYYY-MM-DD): "))
+                if not start_date or not end_date:
+                    print("Invalid date format. Please use YYYY-MM-DD.")
+                    continue
+                all_or_nothing = input("Book only if every item is free? (y/n): ").strip().lower() != 'n'
+                items = [(username, equipment_id, start_date, end_date) for equipment_id in equipment_ids]
+                with db_session() as (conn, cursor):
+                    results = make_reservations_batch(conn, cursor, items, all_or_nothing)
+                for equipment_id, (code, reservation_id, message) in zip(equipment_ids, results):
+                    if code == RESERVATION_OK:
+                        print(f"Equipment {equipment_id}: reserved (Reservation ID: {reservation_id})")
+                    else:
+                        print(f"Equipment {equipment_id}: {message}")
+            except ValueError:
+                print("Invalid equipment ID list.")
+            except Exception as e:
+                print(f"Kit reservation failed: {e}")
+        elif choice == '7':
+            try:
+                with db_session() as (conn, cursor):
+                    count, elapsed = sweep_overdue_reservations(conn, cursor)
+                print(f"{count} reservations marked as overdue in {elapsed * 1000:.1f} ms.")
+            except Exception as e:
+                print(f"Error marking overdue: {e}")
+        elif choice == '8':
+            print_performance_stats()
+        elif choice == '9':
+            try:
+                reservation_ids = [int(i) for i in input("Enter reservation IDs separated by commas: ").split(",")]
+                condition = input("Condition they came back in (Good, Poor, Worn Out, Damaged, Lost; leave empty to keep): ").strip() or None
+                if condition is not None and condition not in EQUIPMENT_CONDITIONS:
+                    print("Invalid condition.")
+                    continue
+                with db_session() as (conn, cursor):
+                    results = return_equipment_batch(conn, cursor, reservation_ids, condition)
+                for reservation_id, (code, equipment_id, message) in zip(reservation_ids, results):
+                    if code == RESERVATION_OK:
+                        print(f"Reservation {reservation_id}: returned (Equipment ID: {equipment_id})")
+                    else:
+                        print(f"Reservation {reservation_id}: {message}")
+            except ValueError:
+                print("Invalid reservation ID list.")
+            except Exception as e:
+                print(f"Batch return failed: {e}")
         elif choice == '0':
             break
         else:
             print("Invalid option.")
 
 
-def main():
-    conn, cursor = get_db_connection_and_cursor()
-    initialize_db(cursor, conn)
+def run_menu():
+    init_pool()
+    with db_session() as (conn, cursor):
+        initialize_db(cursor, conn)
 
     print("Welcome to Equipment Reservation System!")
 
@@ -498,25 +1751,27 @@ Main Menu:
         choice = input("Choose an option: ")
         if choice == '1':
             full_name, email, username, password = input_account_info()
-            if not check_person_exists(cursor, full_name, email):
-                print("No record found. You must be a registered student or staff first.")
-                continue
-            if check_username_exists(cursor, username):
-                print("Username already exists.")
-                continue
-            success = add_user_account(conn, cursor, email, username, password)
+            with db_session() as (conn, cursor):
+                if not check_person_exists(cursor, full_name, email):
+                    print("No record found. You must be a registered student or staff first.")
+                    continue
+                if check_username_exists(cursor, username):
+                    print("Username already exists.")
+                    continue
+                success = add_user_account(conn, cursor, email, username, password)
             print("Registration successful! You can now log in." if success else "Registration failed or account already exists.")
         elif choice == '2':
             username, password = input_login()
-            if check_credentials(cursor, username, password):
-                cursor.execute("SELECT ss.role FROM User_Account ua JOIN Student_Staff ss ON ua.id = ss.id WHERE ua.username = %s;", (username,))
-                role = cursor.fetchone()[0]
-                if role == 'Student':
-                    student_menu(conn, cursor, username)
-                else:
-                    staff_menu(conn, cursor, username)
-            else:
+            with db_session() as (conn, cursor):
+                valid, role, account_id = authenticate(cursor, username, password)
+            if not valid:
                 print("Invalid username or password.")
+            elif role == 'Student':
+                student_menu(username)
+            elif role == 'Staff':
+                staff_menu(username)
+            else:
+                print("This account has no valid role. Please contact staff.")
         elif choice == '0':
             print("Exiting program...")
             break
@@ -524,9 +1779,188 @@ Main Menu:
             print("Invalid option.")
 
             
-    cursor.close()
-    conn.close()
+    close_pool()
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Digital Equipment Rental System")
+    commands = parser.add_subparsers(dest="command")
+
+    serve_parser = commands.add_parser("serve", help="run the HTTP service instead of the interactive menu")
+    serve_parser.add_argument("--host", default=os.getenv("server_host", "127.0.0.1"))
+    serve_parser.add_argument("--port", type=int, default=int(os.getenv("server_port", 8080)))
+    serve_parser.add_argument("--db-concurrency", type=int, default=None,
+                              help="maximum number of requests talking to the database at once (default: pool_max)")
+    serve_parser.add_argument("--no-catalog-cache", action="store_true",
+                              help="read the catalog from the database on every request")
+    serve_parser.add_argument("--sweep-interval", type=float, default=None,
+                              help="also mark overdue reservations every N seconds")
+    serve_parser.add_argument("--metrics-file", default=os.getenv("metrics_file"),
+                              help="also write Prometheus metrics to this file every metrics_file_interval seconds")
+    serve_parser.add_argument("--job-workers", type=int, default=int(os.getenv("job_workers", 0)),
+                              help="also run this many background job workers (waitlist offers)")
+
+    sweep_parser = commands.add_parser("sweep-overdue", help="mark every reservation past its end date as overdue")
+    sweep_parser.add_argument("--interval", type=float, default=None,
+                              help="keep running and sweep every N seconds instead of once")
+
+    commands.add_parser("migrate", help="apply pending schema migrations and exit")
+
+    import_parser = commands.add_parser("import-accounts", help="bulk-create people and accounts from a registrar CSV")
+    import_parser.add_argument("csv_path", help="CSV with header fullname,email,role,username,password")
+
+    commands.add_parser("hash-passwords", help="bcrypt-hash any plaintext passwords left by manual imports")
+
+    export_parser = commands.add_parser("export-history", help="stream reservation history to a CSV file")
+    export_parser.add_argument("output", help="file to write; a .gz name is gzip-compressed, '-' writes to stdout")
+    export_parser.add_argument("--from", dest="start_date", type=date.fromisoformat, default=None,
+                               help="only reservations starting on or after this date (YYYY-MM-DD)")
+    export_parser.add_argument("--to", dest="end_date", type=date.fromisoformat, default=None,
+                               help="only reservations starting on or before this date (YYYY-MM-DD)")
+    export_parser.add_argument("--status", action="append", choices=RESERVATION_STATUSES,
+                               help="only reservations with this status; repeat for several")
+    export_parser.add_argument("--compress-level", type=int, default=6, help="gzip level, 1 (fastest) to 9")
+
+    partitions_parser = commands.add_parser("maintain-partitions",
+                                            help="create upcoming Reservation partitions and archive old closed ones")
+    partitions_parser.add_argument("--months-ahead", type=int, default=3,
+                                   help="make sure partitions exist up to this many months ahead")
+    partitions_parser.add_argument("--keep-months", type=int, default=12,
+                                   help="archive partitions that ended more than this many months ago")
+    partitions_parser.add_argument("--export-dir", default=None,
+                                   help="export archived partitions here as gzip CSV and drop them, "
+                                        f"instead of keeping them in the {ARCHIVE_SCHEMA} schema")
+    partitions_parser.add_argument("--no-archive", action="store_true", help="only create partitions")
+
+    batch_parser = commands.add_parser("batch", help="run a JSONL file of operations and write one JSONL result per line")
+    batch_parser.add_argument("input", help="JSONL requests, one per line; '-' reads stdin")
+    batch_parser.add_argument("--output", default="-", help="where to write the JSONL results (default: stdout)")
+    batch_parser.add_argument("--batch-size", type=int, default=100,
+                              help="operations per transaction")
+
+    jobs_parser = commands.add_parser("work-jobs", help="run background job workers (waitlist offers) until interrupted")
+    jobs_parser.add_argument("--workers", type=int, default=2)
+    jobs_parser.add_argument("--poll-interval", type=float, default=1.0,
+                             help="seconds to wait when the queue is empty")
+
+    what_if_parser = commands.add_parser("what-if", help="check a batch of bookings against an in-memory copy of the schedule")
+    what_if_parser.add_argument("csv_path", help="CSV with header username,equipment_id,start_date,end_date")
+    what_if_parser.add_argument("--best-effort", action="store_true",
+                                help="keep checking after a failure instead of treating the file as one all-or-nothing batch")
+    what_if_parser.add_argument("--commit", action="store_true",
+                                help="book the batch afterwards if the check allows it")
+
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        import BatchRunner
+        if args.batch_size < 1:
+            parser.error("--batch-size must be at least 1")
+        BatchRunner.main(args.input, args.output, args.batch_size)
+    elif args.command == "work-jobs":
+        with db_session() as (conn, cursor):
+            initialize_db(cursor, conn)
+        workers = JobWorkers(args.workers, args.poll_interval)
+        workers.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        workers.stop()
+        close_pool()
+    elif args.command == "maintain-partitions":
+        with db_session() as (conn, cursor):
+            initialize_db(cursor, conn)
+            created = ensure_reservation_partitions(conn, cursor, args.months_ahead)
+            print(f"Created {created} new Reservation partitions.")
+            if not args.no_archive:
+                archived = archive_reservation_partitions(conn, cursor, args.keep_months, args.export_dir)
+                for name, destination in archived:
+                    print(f"Archived {name} to {destination}")
+                print(f"Archived {len(archived)} partitions.")
+        close_pool()
+    elif args.command == "export-history":
+        import sys
+        if args.output == "-":
+            out = sys.stdout.buffer
+        elif args.output.endswith(".gz"):
+            out = gzip.open(args.output, "wb", compresslevel=args.compress_level)
+        else:
+            out = open(args.output, "wb")
+        started = time.perf_counter()
+        try:
+            with read_session() as (conn, cursor):
+                count = export_reservation_history(cursor, out, args.start_date, args.end_date, args.status)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        if args.output != "-":
+            print(f"Exported {count} reservations to {args.output} in {time.perf_counter() - started:.1f}s.")
+        close_pool()
+    elif args.command == "what-if":
+        import csv
+        from ReservationEngine import ReservationEngine
+        with open(args.csv_path, newline="", encoding="utf-8") as f:
+            items = [(row["username"], int(row["equipment_id"]), date.fromisoformat(row["start_date"]),
+                      date.fromisoformat(row["end_date"])) for row in csv.DictReader(f)]
+        with db_session() as (conn, cursor):
+            initialize_db(cursor, conn)
+            engine = ReservationEngine()
+            load_seconds = engine.reload(conn)
+            started = time.perf_counter()
+            results = engine.what_if(items, not args.best_effort)
+            check_seconds = time.perf_counter() - started
+            print(f"Loaded {len(engine.units)} units in {load_seconds:.2f}s; "
+                  f"checked {len(items)} bookings in {check_seconds * 1000:.1f} ms.")
+            for code, count in sorted(Counter(result[0] for result in results).items()):
+                print(f"{code}: {count}")
+            for line, (item, (code, _, message)) in enumerate(zip(items, results), 2):
+                if code not in (RESERVATION_OK, "skipped", "rolled_back"):
+                    print(f"Line {line}: {message} (equipment {item[1]}, {item[2]} to {item[3]})")
+            if args.commit:
+                results = engine.reserve_batch(conn, cursor, items, not args.best_effort)
+                booked = sum(1 for result in results if result[0] == RESERVATION_OK)
+                print(f"Booked {booked} of {len(items)} reservations.")
+        close_pool()
+    elif args.command == "hash-passwords":
+        with db_session() as (conn, cursor):
+            initialize_db(cursor, conn)
+            count = hash_plaintext_passwords(conn, cursor)
+        print(f"Hashed {count} plaintext passwords.")
+        close_pool()
+    elif args.command == "sweep-overdue":
+        with db_session() as (conn, cursor):
+            initialize_db(cursor, conn)
+        sweeper = OverdueSweeper(args.interval)
+        if args.interval is None:
+            sweeper.run_once()
+        else:
+            try:
+                sweeper.run_forever()
+            except KeyboardInterrupt:
+                pass
+        close_pool()
+    elif args.command == "import-accounts":
+        with db_session() as (conn, cursor), open(args.csv_path, newline="", encoding="utf-8") as f:
+            initialize_db(cursor, conn)
+            people, accounts, rejected = bulk_import_accounts(conn, cursor, f)
+        print(f"Upserted {people} people and {accounts} accounts; rejected {len(rejected)} rows.")
+        for line, email, username, reason in rejected:
+            print(f"Line {line}: {reason} (email: {email}, username: {username})")
+        close_pool()
+    elif args.command == "migrate":
+        with db_session() as (conn, cursor):
+            version = initialize_db(cursor, conn)
+        print(f"Database schema is at version {version}.")
+        close_pool()
+    elif args.command == "serve":
+        import RentalServer
+        RentalServer.serve(args.host, args.port, args.db_concurrency, not args.no_catalog_cache, args.sweep_interval,
+                           args.metrics_file, args.job_workers)
+    else:
+        run_menu()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
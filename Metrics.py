@@ -0,0 +1,239 @@
+import functools
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from psycopg2.extensions import cursor as base_cursor
+
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_query_log = logging.getLogger("rental.slow_query")
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+
+    # Upper bound of the bucket holding the p-th percentile (None if it is past the last bucket).
+    def percentile_bound(self, p):
+        if not self.count:
+            return None
+        target = p / 100 * self.count
+        running = 0
+        for bound, bucket_count in zip(BUCKETS, self.counts):
+            running += bucket_count
+            if running >= target:
+                return bound
+        return None
+
+
+class QueryStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0
+        self.errors = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.slow_query_seconds = 0.5
+        self._lock = threading.Lock()
+        self._queries = defaultdict(QueryStats)
+        self._pool_wait = Histogram()
+        self._transactions = defaultdict(Histogram)
+
+    def record_query(self, name, seconds, rows, failed):
+        with self._lock:
+            stats = self._queries[name]
+            stats.latency.observe(seconds)
+            if rows > 0:
+                stats.rows += rows
+            if failed:
+                stats.errors += 1
+
+    def record_pool_wait(self, seconds):
+        with self._lock:
+            self._pool_wait.observe(seconds)
+
+    def record_transaction(self, seconds, outcome):
+        with self._lock:
+            self._transactions[outcome].observe(seconds)
+
+    def query_stats(self):
+        with self._lock:
+            return sorted(self._queries.items())
+
+    def pool_wait(self):
+        return self._pool_wait
+
+    def transactions(self):
+        with self._lock:
+            return sorted(self._transactions.items())
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            lines += _histogram_lines("rental_query_duration_seconds",
+                                      "Time spent executing each named query.",
+                                      [({"query": name}, stats.latency) for name, stats in sorted(self._queries.items())])
+            lines += ["# HELP rental_query_rows_total Rows returned or affected by each named query.",
+                      "# TYPE rental_query_rows_total counter"]
+            lines += [f'rental_query_rows_total{{query="{name}"}} {stats.rows}' for name, stats in sorted(self._queries.items())]
+            lines += ["# HELP rental_query_errors_total Failed executions of each named query.",
+                      "# TYPE rental_query_errors_total counter"]
+            lines += [f'rental_query_errors_total{{query="{name}"}} {stats.errors}' for name, stats in sorted(self._queries.items())]
+            lines += _histogram_lines("rental_pool_wait_seconds",
+                                      "Time spent waiting for a pooled connection.",
+                                      [({}, self._pool_wait)])
+            lines += _histogram_lines("rental_transaction_duration_seconds",
+                                      "Time from checking out a connection to commit or rollback.",
+                                      [({"outcome": outcome}, histogram) for outcome, histogram in sorted(self._transactions.items())])
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    merged = {**labels, **extra}
+    if not merged:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in merged.items()) + "}"
+
+
+def _histogram_lines(metric, help_text, series):
+    lines = [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+    for labels, histogram in series:
+        running = 0
+        for bound, bucket_count in zip(BUCKETS, histogram.counts):
+            running += bucket_count
+            lines.append(f"{metric}_bucket{_labels(labels, le=bound)} {running}")
+        lines.append(f'{metric}_bucket{_labels(labels, le="+Inf")} {histogram.count}')
+        lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum:.6f}")
+        lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+    return lines
+
+
+REGISTRY = MetricsRegistry()
+
+
+_slow_query_handler = None
+
+
+# Safe to call again, e.g. each time the pool is started: the log file gets one handler.
+def configure(slow_query_ms=None, slow_query_log_path=None):
+    global _slow_query_handler
+    if slow_query_ms is not None:
+        REGISTRY.slow_query_seconds = float(slow_query_ms) / 1000
+    if not slow_query_log_path:
+        return
+    path = os.path.abspath(slow_query_log_path)
+    if _slow_query_handler is not None:
+        if _slow_query_handler.baseFilename == path:
+            return
+        slow_query_log.removeHandler(_slow_query_handler)
+        _slow_query_handler.close()
+    _slow_query_handler = logging.FileHandler(path)
+    _slow_query_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_query_log.addHandler(_slow_query_handler)
+
+
+# Query names are set per thread by @timed_query on the helpers; the outermost helper wins.
+_current = threading.local()
+
+
+def current_query_name():
+    return getattr(_current, "name", None) or "other"
+
+
+@contextmanager
+def query_label(name):
+    previous = getattr(_current, "name", None)
+    if previous is None:
+        _current.name = name
+    try:
+        yield
+    finally:
+        _current.name = previous
+
+
+def timed_query(name):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with query_label(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class InstrumentedCursor(base_cursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, vars)
+            failed = False
+            return result
+        finally:
+            self._record(query, time.perf_counter() - started, failed)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().copy_expert(sql, file, size)
+            failed = False
+            return result
+        finally:
+            self._record(sql, time.perf_counter() - started, failed)
+
+    def _record(self, query, seconds, failed):
+        name = current_query_name()
+        REGISTRY.record_query(name, seconds, 0 if failed else self.rowcount, failed)
+        if seconds >= REGISTRY.slow_query_seconds:
+            text = query.decode("utf-8", "replace") if isinstance(query, bytes) else str(query)
+            slow_query_log.warning("slow query %s took %.1f ms: %s", name, seconds * 1000, " ".join(text.split())[:500])
+
+
+class MetricsFileWriter:
+    # Rewrites a Prometheus text file (e.g. for node_exporter's textfile collector) every interval.
+    def __init__(self, path, interval=15.0):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics-file", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
+
+    def write(self):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(REGISTRY.render_prometheus())
+        os.replace(temporary, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Could not write metrics file {self.path}: {e}")
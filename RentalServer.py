@@ -0,0 +1,471 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import DigitalRentalSystem as drs
+import Metrics
+from RequestFields import RequestFields, json_default
+
+
+MAX_BODY_SIZE = 64 * 1024
+MAX_CALENDAR_DAYS = 366
+MAX_CALENDAR_UNITS = 200
+KEEP_ALIVE_TIMEOUT = 30
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+RESERVATION_STATUS = {
+    "not_found": 404,
+    "unavailable": 409,
+    "conflict": 409,
+    "invalid_dates": 400,
+    "unknown_user": 400,
+    "insufficient_units": 409,
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, code=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.code = code
+
+
+class PlainText(str):
+    # A handler result sent as-is instead of JSON-encoded.
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+
+_FIELDS = RequestFields(lambda message: HttpError(400, message), "Parameter")
+_require, _require_int, _require_date = _FIELDS.require, _FIELDS.require_int, _FIELDS.require_date
+
+
+def _optional_bool(params, name):
+    value = params.get(name)
+    if value is None or value == "":
+        return None
+    return value in (True, "true", "1", "yes")
+
+
+def _paged(params, fetch, to_item):
+    limit = _FIELDS.limit(params)
+    try:
+        rows, next_token = fetch(params.get("after") or None, limit)
+    except ValueError:
+        raise HttpError(400, "Invalid page token.")
+    return {"items": [to_item(row) for row in rows], "next": next_token}
+
+
+# Filled in from session_ttl / session_max when the server starts.
+SESSIONS = drs.SessionCache()
+
+
+def _session(params, staff=False):
+    session = params.get("_session")
+    if session is None:
+        raise HttpError(401, "Log in first and send 'Authorization: Bearer <token>'.")
+    if staff and session[1] != "Staff":
+        raise HttpError(403, "Only staff can do this.")
+    return session
+
+
+# Students always act as themselves; staff may name another user.
+def _acting_username(params, entry):
+    username, role, account_id = _session(params)
+    requested = entry.get("username") or username
+    if requested != username and role != "Staff":
+        raise HttpError(403, "Students can only act on their own account.")
+    return requested
+
+
+# Endpoint handlers, run on the executor inside a pooled db_session
+def login(conn, cursor, params):
+    username = _require(params, "username")
+    valid, role, account_id = drs.authenticate(cursor, username, _require(params, "password"))
+    if not valid:
+        raise HttpError(401, "Invalid username or password.")
+    return {"token": SESSIONS.create(username, role, account_id), "role": role, "account_id": account_id}
+
+
+def logout(conn, cursor, params):
+    _session(params)
+    SESSIONS.revoke(params["_token"])
+    return {"logged_out": True}
+
+
+def catalog(conn, cursor, params):
+    return _paged(
+        params,
+        lambda after, limit: drs.get_equipment_page(
+            cursor, after, limit, params.get("name") or None, params.get("condition") or None,
+            _optional_bool(params, "available")),
+        lambda eq: {"equipment_id": eq[0], "name": eq[1], "condition": eq[2], "available": eq[3]},
+    )
+
+
+def availability(conn, cursor, params):
+    equipment_id = _require_int(params, "equipment_id")
+    available = drs.check_equipment_availability(cursor, equipment_id)
+    if available is None:
+        raise HttpError(404, "There is no equipment with this ID.")
+    return {"equipment_id": equipment_id, "available": available}
+
+
+def _require_date_range(params):
+    start_date = _require_date(params, "start_date")
+    end_date = _require_date(params, "end_date")
+    if start_date > end_date:
+        raise HttpError(400, "Start date cannot be after end date.")
+    return start_date, end_date
+
+
+def search(conn, cursor, params):
+    start_date, end_date = _require_date_range(params)
+    return [
+        {"equipment_id": eq[0], "name": eq[1], "condition": eq[2]}
+        for eq in drs.search_available_equipment(
+            cursor, start_date, end_date, params.get("name") or None, params.get("condition") or None)
+    ]
+
+
+def calendar(conn, cursor, params):
+    start_date, end_date = _require_date_range(params)
+    if (end_date - start_date).days >= MAX_CALENDAR_DAYS:
+        raise HttpError(400, f"A calendar can cover at most {MAX_CALENDAR_DAYS} days.")
+    ids = _require(params, "equipment_ids")
+    try:
+        equipment_ids = list(dict.fromkeys(int(i) for i in (ids if isinstance(ids, list) else str(ids).split(","))))
+    except (TypeError, ValueError):
+        raise HttpError(400, "Parameter 'equipment_ids' must be a list of numbers.")
+    if len(equipment_ids) > MAX_CALENDAR_UNITS:
+        raise HttpError(400, f"A calendar can cover at most {MAX_CALENDAR_UNITS} units.")
+    days = drs.get_availability_calendar(cursor, equipment_ids, start_date, end_date)
+    unknown = [equipment_id for equipment_id in equipment_ids if equipment_id not in days]
+    if unknown:
+        raise HttpError(404, f"No equipment with ID {', '.join(map(str, unknown))}.", "not_found")
+    return {
+        str(equipment_id): [{"date": day, "free": free} for day, free in entries]
+        for equipment_id, entries in days.items()
+    }
+
+
+def reserve(conn, cursor, params):
+    username = _acting_username(params, params)
+    equipment_id = _require_int(params, "equipment_id")
+    start_date = _require_date(params, "start_date")
+    end_date = _require_date(params, "end_date")
+    if start_date > end_date:
+        raise HttpError(400, "Start date cannot be after end date.")
+    code, reservation_id = drs.call_make_reservation_proc(conn, cursor, username, equipment_id, start_date, end_date)
+    if code != drs.RESERVATION_OK:
+        message = drs.RESERVATION_MESSAGES.get(code, "Reservation failed.")
+        raise HttpError(RESERVATION_STATUS.get(code, 500), message, code)
+    return {"reserved": True, "reservation_id": reservation_id}
+
+
+def join_waitlist(conn, cursor, params):
+    username = _acting_username(params, params)
+    equipment_id = _require_int(params, "equipment_id")
+    start_date, end_date = _require_date_range(params)
+    waitlist_id = drs.join_waitlist(conn, cursor, username, equipment_id, start_date, end_date)
+    if waitlist_id is None:
+        raise HttpError(409, "This equipment is out of service or does not exist, so there is no waitlist for it.",
+                        "unavailable")
+    return {"waitlist_id": waitlist_id}
+
+
+def my_waitlist(conn, cursor, params):
+    username = _acting_username(params, params)
+    return [
+        {"waitlist_id": w[0], "equipment_id": w[1], "start_date": w[2], "end_date": w[3],
+         "status": w[4], "reservation_id": w[5]}
+        for w in drs.view_waitlist(cursor, username)
+    ]
+
+
+def reserve_model(conn, cursor, params):
+    username = _acting_username(params, params)
+    name = _require(params, "name")
+    quantity = _FIELDS.bounded_int(params, "quantity")
+    start_date = _require_date(params, "start_date")
+    end_date = _require_date(params, "end_date")
+    if start_date > end_date:
+        raise HttpError(400, "Start date cannot be after end date.")
+    code, units, message = drs.reserve_by_model(conn, cursor, username, name, quantity, start_date, end_date)
+    if code != drs.RESERVATION_OK:
+        raise HttpError(RESERVATION_STATUS.get(code, 500), message, code)
+    return {"units": [{"equipment_id": equipment_id, "reservation_id": reservation_id} for equipment_id, reservation_id in units]}
+
+
+def reserve_batch(conn, cursor, params):
+    entries = _require(params, "items")
+    if not isinstance(entries, list):
+        raise HttpError(400, "Parameter 'items' must be a list.")
+    items = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise HttpError(400, "Each item must be an object.")
+        items.append((
+            _acting_username(params, entry),
+            _require_int(entry, "equipment_id"),
+            _require_date(entry, "start_date"),
+            _require_date(entry, "end_date"),
+        ))
+    all_or_nothing = params.get("all_or_nothing", True) not in (False, "false", "0")
+    results = drs.make_reservations_batch(conn, cursor, items, all_or_nothing)
+    return [
+        {"equipment_id": item[1], "code": code, "reservation_id": reservation_id, "message": message}
+        for item, (code, reservation_id, message) in zip(items, results)
+    ]
+
+
+def return_reservation(conn, cursor, params):
+    username, role, account_id = _session(params)
+    reservation_id = _require_int(params, "reservation_id")
+    # Students can only return their own bookings; anyone else's looks like it does not exist.
+    owner = None if role == "Staff" else username
+    if not drs.return_equipment(conn, cursor, reservation_id, username=owner):
+        raise HttpError(404, "No active reservation found with that ID.")
+    return {"returned": True}
+
+
+def return_batch(conn, cursor, params):
+    _session(params, staff=True)
+    reservation_ids = _require(params, "reservation_ids")
+    if not isinstance(reservation_ids, list) or not all(isinstance(i, int) for i in reservation_ids):
+        raise HttpError(400, "Parameter 'reservation_ids' must be a list of integers.")
+    condition = params.get("condition") or None
+    if condition is not None and condition not in drs.EQUIPMENT_CONDITIONS:
+        raise HttpError(400, f"Parameter 'condition' must be one of {', '.join(drs.EQUIPMENT_CONDITIONS)}.")
+    results = drs.return_equipment_batch(conn, cursor, reservation_ids, condition)
+    return [
+        {"reservation_id": reservation_id, "code": code, "equipment_id": equipment_id, "message": message}
+        for reservation_id, (code, equipment_id, message) in zip(reservation_ids, results)
+    ]
+
+
+def my_reservations(conn, cursor, params):
+    username = _acting_username(params, params)
+    return _paged(
+        params,
+        lambda after, limit: drs.get_user_reservations_page(cursor, username, after, limit, params.get("status") or None),
+        lambda r: {"reservation_id": r[0], "equipment": r[1], "start_date": r[2], "end_date": r[3], "status": r[4]},
+    )
+
+
+def overdue(conn, cursor, params):
+    _session(params, staff=True)
+    return _paged(
+        params,
+        lambda after, limit: drs.get_overdue_page(cursor, after, limit),
+        lambda o: {"reservation_id": o[0], "username": o[1], "equipment": o[2],
+                   "start_date": o[3], "end_date": o[4], "status": o[5]},
+    )
+
+
+def top_equipment(conn, cursor, params):
+    _session(params, staff=True)
+    limit = _FIELDS.bounded_int(params, "limit", 3)
+    since = _FIELDS.optional_date(params, "since")
+    until = _FIELDS.optional_date(params, "until")
+    return [{"name": e[0], "borrow_count": e[1]} for e in drs.get_top_borrowed_equipment(cursor, limit, since, until)]
+
+
+def metrics(conn, cursor, params):
+    return PlainText(Metrics.REGISTRY.render_prometheus())
+
+
+ROUTES = {
+    ("POST", "/login"): login,
+    ("POST", "/logout"): logout,
+    ("GET", "/catalog"): catalog,
+    ("GET", "/availability"): availability,
+    ("GET", "/search"): search,
+    ("GET", "/calendar"): calendar,
+    ("POST", "/reserve"): reserve,
+    ("POST", "/reserve-batch"): reserve_batch,
+    ("POST", "/reserve-model"): reserve_model,
+    ("POST", "/waitlist"): join_waitlist,
+    ("GET", "/waitlist"): my_waitlist,
+    ("POST", "/return"): return_reservation,
+    ("POST", "/return-batch"): return_batch,
+    ("GET", "/reservations"): my_reservations,
+    ("GET", "/overdue"): overdue,
+    ("GET", "/top-equipment"): top_equipment,
+    ("GET", "/metrics"): metrics,
+}
+
+
+# Run on the event loop without a thread or a pooled connection: logout and metrics always,
+# catalog reads whenever the catalog cache is running.
+INLINE_HANDLERS = {logout, metrics}
+CACHED_HANDLERS = {catalog, availability}
+
+
+# Read-only handlers may be served by a replica, except for a user who just wrote.
+READ_HANDLERS = {catalog, availability, search, calendar, my_reservations, overdue, top_equipment}
+
+
+def _run_in_session(handler, params):
+    if handler in READ_HANDLERS:
+        entry = params["_session"]
+        username = params.get("username") or (entry[0] if entry else None)
+        session = drs.read_session(username if isinstance(username, str) else None)
+    else:
+        session = drs.db_session()
+    with session as (conn, cursor):
+        return handler(conn, cursor, params)
+
+
+class RentalServer:
+    def __init__(self, host, port, db_concurrency):
+        self.host = host
+        self.port = port
+        self.db_concurrency = db_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=db_concurrency, thread_name_prefix="db")
+        self._db_slots = None
+
+    async def run_db(self, handler, params):
+        # Only db_concurrency requests queue for a pooled connection; the rest wait here without a thread.
+        async with self._db_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, _run_in_session, handler, params)
+
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        methods = [m for (m, path) in ROUTES if path == url.path]
+        if not methods:
+            raise HttpError(404, f"Unknown endpoint {url.path}.")
+        if method not in methods:
+            raise HttpError(405, f"Use {', '.join(methods)} for {url.path}.")
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if body:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                raise HttpError(400, "Request body must be JSON.")
+            if not isinstance(payload, dict):
+                raise HttpError(400, "Request body must be a JSON object.")
+            params.update(payload)
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        token = token.strip() if scheme.lower() == "bearer" else ""
+        # Always overwritten, so a client cannot supply its own session in the body.
+        params["_token"] = token
+        params["_session"] = SESSIONS.get(token) if token else None
+        handler = ROUTES[(method, url.path)]
+        if handler in INLINE_HANDLERS or (handler in CACHED_HANDLERS and drs.catalog_cache_ready()):
+            return handler(None, None, params)
+        return await self.run_db(handler, params)
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    await self.write_response(writer, 413, {"error": "Request body too large."}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, payload = 200, await self.dispatch(method, target, headers, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": e.message}
+                    if e.code:
+                        payload["code"] = e.code
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def write_response(self, writer, status, payload, keep_alive):
+        if isinstance(payload, PlainText):
+            body, content_type = payload.encode("utf-8"), payload.content_type
+        else:
+            body, content_type = json.dumps(payload, default=json_default).encode("utf-8"), "application/json"
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def serve_forever(self):
+        self._db_slots = asyncio.Semaphore(self.db_concurrency)
+        server = await asyncio.start_server(self.handle_client, self.host, self.port, backlog=4096)
+        print(f"Serving on http://{self.host}:{self.port} (database concurrency {self.db_concurrency})")
+        async with server:
+            await server.serve_forever()
+
+
+def serve(host, port, db_concurrency=None, catalog_cache=True, sweep_interval=None, metrics_file=None, job_workers=0):
+    pool = drs.init_pool()
+    SESSIONS.ttl = float(os.getenv("session_ttl", SESSIONS.ttl))
+    SESSIONS.max_sessions = int(os.getenv("session_max", SESSIONS.max_sessions))
+    with drs.db_session() as (conn, cursor):
+        drs.initialize_db(cursor, conn)
+    if catalog_cache:
+        drs.enable_catalog_cache()
+    sweeper = None
+    if sweep_interval:
+        sweeper = drs.OverdueSweeper(sweep_interval)
+        sweeper.start()
+    workers = None
+    if job_workers:
+        workers = drs.JobWorkers(job_workers)
+        workers.start()
+    metrics_writer = None
+    if metrics_file:
+        metrics_writer = Metrics.MetricsFileWriter(metrics_file, float(os.getenv("metrics_file_interval", 15)))
+        metrics_writer.start()
+    server = RentalServer(host, port, db_concurrency or pool.maxconn)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("Shutting down...")
+    finally:
+        server.close()
+        if sweeper is not None:
+            sweeper.stop()
+        if workers is not None:
+            workers.stop()
+        if metrics_writer is not None:
+            metrics_writer.stop()
+        drs.disable_catalog_cache()
+        drs.close_pool()
@@ -0,0 +1,55 @@
+from datetime import date
+
+import DigitalRentalSystem as drs
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+# Request field checks shared by the HTTP service and batch mode. error turns a message
+# into the exception to raise (an HTTP 400, a batch invalid_request), and noun is what the
+# messages call a field ("Parameter" over HTTP, "Field" in batch mode).
+class RequestFields:
+    def __init__(self, error, noun):
+        self._error = error
+        self._noun = noun
+
+    def require(self, request, name):
+        value = request.get(name)
+        if value is None or value == "":
+            raise self._error(f"Missing {self._noun.lower()} '{name}'.")
+        return value
+
+    def require_int(self, request, name):
+        try:
+            return int(self.require(request, name))
+        except (TypeError, ValueError):
+            raise self._error(f"{self._noun} '{name}' must be a number.")
+
+    def require_date(self, request, name):
+        value = drs.validate_date_format(str(self.require(request, name)))
+        if value is None:
+            raise self._error(f"{self._noun} '{name}' must use YYYY-MM-DD.")
+        return value
+
+    def optional_date(self, request, name):
+        return self.require_date(request, name) if request.get(name) not in (None, "") else None
+
+    # An int between 1 and MAX_PAGE_SIZE; required when default is None.
+    def bounded_int(self, request, name, default=None):
+        if default is not None and request.get(name) in (None, ""):
+            return default
+        value = self.require_int(request, name)
+        if not 1 <= value <= MAX_PAGE_SIZE:
+            raise self._error(f"{self._noun} '{name}' must be between 1 and {MAX_PAGE_SIZE}.")
+        return value
+
+    def limit(self, request):
+        return self.bounded_int(request, "limit", DEFAULT_PAGE_SIZE)
+
+
+def json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
@@ -0,0 +1,188 @@
+import bisect
+import itertools
+import time
+from array import array
+
+import DigitalRentalSystem as drs
+
+
+# In-memory copy of Equipment, the Active reservations, the units out on Overdue bookings
+# and the usernames, for answering overlap, free-unit and what-if questions without a
+# database round trip per check. It is a snapshot: reload it (or book through
+# reserve_batch) to see other sessions' changes.
+#
+# reservation_no_overlap guarantees a unit's Active bookings never overlap, so each unit's
+# interval index is just its bookings sorted by start in parallel arrays of day ordinals:
+# the ends are sorted too, and one bisect finds every booking that can touch a range.
+
+class Unit:
+    __slots__ = ("equipment_id", "name", "condition", "available", "in_service", "overdue", "starts", "ends", "reservation_ids")
+
+    def __init__(self, equipment_id, name, condition, available, in_service=True):
+        self.equipment_id = equipment_id
+        self.name = name
+        self.condition = condition
+        self.available = available
+        self.in_service = in_service
+        self.overdue = False
+        self.starts = array("l")
+        self.ends = array("l")
+        self.reservation_ids = array("l")
+
+    def overlapping(self, start, end):
+        index = bisect.bisect_right(self.starts, end) - 1
+        found = []
+        while index >= 0 and self.ends[index] >= start:
+            found.append(index)
+            index -= 1
+        return found
+
+    def add(self, start, end, reservation_id):
+        index = bisect.bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.reservation_ids.insert(index, reservation_id)
+
+    def remove(self, reservation_id):
+        index = self.reservation_ids.index(reservation_id)
+        del self.starts[index], self.ends[index], self.reservation_ids[index]
+
+    # Same rule as reserve_equipment.
+    def bookable(self):
+        return self.condition not in ("Lost", "Damaged") and self.in_service and not self.overdue
+
+
+class ReservationEngine:
+    def __init__(self):
+        self.units = {}
+        self.usernames = set()
+        self.loaded_at = None
+        # What-if bookings get negative ids so they never collide with real ones.
+        self._tentative_ids = itertools.count(-1, -1)
+
+    @classmethod
+    def load(cls, conn, batch_size=10000):
+        engine = cls()
+        engine.reload(conn, batch_size)
+        return engine
+
+    def reload(self, conn, batch_size=10000):
+        started = time.perf_counter()
+        units = {}
+        for equipment_id, name, condition, available, in_service in self._fetch(conn, batch_size, """
+        SELECT equipment_id, name, equipment_condition, equipment_availability, in_service FROM Equipment;
+        """):
+            units[equipment_id] = Unit(equipment_id, name, condition, available, in_service)
+        for reservation_id, equipment_id, start_date, end_date in self._fetch(conn, batch_size, """
+        SELECT reservation_id, equipment_id, start_date, end_date
+        FROM Active_Reservation
+        ORDER BY equipment_id, start_date;
+        """):
+            unit = units[equipment_id]
+            unit.starts.append(start_date.toordinal())
+            unit.ends.append(end_date.toordinal())
+            unit.reservation_ids.append(reservation_id)
+        for (equipment_id,) in self._fetch(conn, batch_size, """
+        SELECT DISTINCT equipment_id FROM Reservation WHERE status = 'Overdue';
+        """):
+            units[equipment_id].overdue = True
+        self.usernames = {row[0] for row in self._fetch(conn, batch_size, "SELECT username FROM User_Account;")}
+        self.units = units
+        self.loaded_at = time.time()
+        return time.perf_counter() - started
+
+    @staticmethod
+    def _fetch(conn, batch_size, query):
+        return drs._stream(conn, query, None, batch_size, "engine_load")
+
+    def overlapping(self, equipment_id, start_date, end_date):
+        unit = self.units.get(equipment_id)
+        if unit is None:
+            return []
+        return [unit.reservation_ids[i] for i in reversed(unit.overlapping(start_date.toordinal(), end_date.toordinal()))]
+
+    def is_free(self, equipment_id, start_date, end_date):
+        return self.check(None, equipment_id, start_date, end_date) == drs.RESERVATION_OK
+
+    def free_units(self, start_date, end_date, name=None, condition=None):
+        start, end = start_date.toordinal(), end_date.toordinal()
+        return [
+            unit.equipment_id for unit in sorted(self.units.values(), key=lambda u: u.equipment_id)
+            if (name is None or unit.name == name)
+            and (condition is None or unit.condition == condition)
+            and unit.bookable()
+            and not unit.overlapping(start, end)
+        ]
+
+    # Result code reserve_equipment would give, checked in the same order. A None username
+    # skips the account check.
+    def check(self, username, equipment_id, start_date, end_date):
+        if start_date > end_date:
+            return "invalid_dates"
+        unit = self.units.get(equipment_id)
+        if unit is None:
+            return "not_found"
+        if not unit.bookable():
+            return "unavailable"
+        if unit.overlapping(start_date.toordinal(), end_date.toordinal()):
+            return "conflict"
+        if username is not None and username not in self.usernames:
+            return "unknown_user"
+        return drs.RESERVATION_OK
+
+    def book(self, username, equipment_id, start_date, end_date):
+        code = self.check(username, equipment_id, start_date, end_date)
+        if code != drs.RESERVATION_OK:
+            return code, None
+        reservation_id = next(self._tentative_ids)
+        self.add(equipment_id, start_date, end_date, reservation_id)
+        return code, reservation_id
+
+    # Records a booking without checking it, e.g. one the database has already accepted.
+    def add(self, equipment_id, start_date, end_date, reservation_id):
+        unit = self.units.get(equipment_id)
+        if unit is not None:
+            unit.add(start_date.toordinal(), end_date.toordinal(), reservation_id)
+            unit.available = False
+
+    # Results in make_reservations_batch's shape, without touching the database or
+    # keeping any of the bookings. Items are tried in the order the database tries them,
+    # by equipment_id and then position, and each sees the ones tried before it.
+    def what_if(self, items, all_or_nothing=True):
+        items = list(items)
+        results = [None] * len(items)
+        booked = []
+        failed = False
+        for index in sorted(range(len(items)), key=lambda i: (items[i][1], i)):
+            username, equipment_id, start_date, end_date = items[index]
+            if failed and all_or_nothing:
+                results[index] = ("skipped", None, "Not attempted because another item failed.")
+                continue
+            was_available = equipment_id in self.units and self.units[equipment_id].available
+            code, reservation_id = self.book(username, equipment_id, start_date, end_date)
+            if code == drs.RESERVATION_OK:
+                booked.append((self.units[equipment_id], reservation_id, was_available))
+                results[index] = (code, None, None)
+            else:
+                failed = True
+                results[index] = (code, None, drs.RESERVATION_MESSAGES[code])
+        for unit, reservation_id, was_available in reversed(booked):
+            unit.remove(reservation_id)
+            unit.available = was_available
+        if failed and all_or_nothing:
+            results = [("rolled_back", None, "Rolled back because another item failed.") if result[0] == drs.RESERVATION_OK
+                       else result for result in results]
+        return results
+
+    # Checks the batch in memory first; an all-or-nothing batch that cannot succeed never
+    # reaches the database. Bookings the database accepts are added to the engine.
+    def reserve_batch(self, conn, cursor, items, all_or_nothing=True):
+        items = list(items)
+        predicted = self.what_if(items, all_or_nothing)
+        if all_or_nothing and any(code != drs.RESERVATION_OK for code, _, _ in predicted):
+            return predicted
+        results = drs.make_reservations_batch(conn, cursor, items, all_or_nothing)
+        for (username, equipment_id, start_date, end_date), (code, reservation_id, _) in zip(items, results):
+            if code == drs.RESERVATION_OK:
+                self.add(equipment_id, start_date, end_date, reservation_id)
+        return results
@@ -0,0 +1,1123 @@
+# Each entry is (version, description, sql). Versions are applied in order and
+# never edited once released; add a new entry to change the schema.
+MIGRATIONS = [
+    (1, "Base tables, account functions and make_reservation_proc", """
+    CREATE TABLE IF NOT EXISTS Student_Staff (
+        id SERIAL PRIMARY KEY,
+        fullname VARCHAR(50) NOT NULL,
+        email VARCHAR(50) NOT NULL UNIQUE,
+        role VARCHAR(10) CHECK (role IN ('Student', 'Staff'))
+    );
+
+    CREATE TABLE IF NOT EXISTS User_Account (
+        id INT PRIMARY KEY REFERENCES Student_Staff(id),
+        username VARCHAR(50) UNIQUE NOT NULL,
+        password VARCHAR(255) NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS Equipment (
+        equipment_id SERIAL PRIMARY KEY,
+        name VARCHAR(50) NOT NULL,
+        equipment_condition VARCHAR(20) DEFAULT 'Good',
+        equipment_availability BOOLEAN DEFAULT TRUE
+    );
+
+    CREATE TABLE IF NOT EXISTS Reservation (
+        reservation_id SERIAL PRIMARY KEY,
+        username VARCHAR(50) NOT NULL REFERENCES User_Account(username),
+        equipment_id INT NOT NULL REFERENCES Equipment(equipment_id),
+        start_date DATE NOT NULL,
+        end_date DATE NOT NULL,
+        status VARCHAR(20) DEFAULT 'Active'
+    );
+
+    DROP FUNCTION IF EXISTS check_person_exists(VARCHAR, VARCHAR);
+
+    CREATE OR REPLACE FUNCTION check_person_exists(p_email VARCHAR, p_fullname VARCHAR)
+    RETURNS BOOLEAN AS $$
+    DECLARE
+        exists BOOLEAN;
+    BEGIN
+        SELECT EXISTS (SELECT 1 FROM Student_Staff WHERE email = p_email AND fullname = p_fullname) INTO exists;
+        RETURN exists;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP FUNCTION IF EXISTS check_username_exists(VARCHAR);
+
+    CREATE OR REPLACE FUNCTION check_username_exists(p_username VARCHAR)
+    RETURNS BOOLEAN AS $$
+    DECLARE
+        exists BOOLEAN;
+    BEGIN
+        SELECT EXISTS (SELECT 1 FROM User_Account WHERE username = p_username) INTO exists;
+        RETURN exists;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP FUNCTION IF EXISTS check_credentials(VARCHAR, VARCHAR);
+
+    CREATE OR REPLACE FUNCTION check_credentials(p_username VARCHAR, p_password VARCHAR)
+    RETURNS BOOLEAN AS $$
+    DECLARE
+        valid BOOLEAN;
+    BEGIN
+        SELECT EXISTS (
+            SELECT 1 FROM User_Account WHERE username = p_username AND password = p_password) INTO valid;
+            RETURN valid;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP FUNCTION IF EXISTS add_user_account(VARCHAR, VARCHAR, VARCHAR);
+
+    CREATE OR REPLACE FUNCTION add_user_account(p_email VARCHAR, p_username VARCHAR, p_password VARCHAR)
+    RETURNS BOOLEAN AS $$
+    DECLARE
+        user_id INT;
+        exists BOOLEAN;
+    BEGIN
+        SELECT id INTO user_id FROM Student_Staff WHERE email = p_email;
+        IF user_id IS NULL THEN
+            RETURN FALSE;
+        END IF;
+
+        SELECT EXISTS(SELECT 1 FROM User_Account WHERE id = user_id) INTO exists;
+        IF exists THEN
+            RETURN FALSE;
+        ELSE
+            INSERT INTO User_Account (id, username, password) VALUES (user_id, p_username, p_password);
+            RETURN TRUE;
+        END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP PROCEDURE IF EXISTS make_reservation_proc(VARCHAR, INT, DATE, DATE);
+
+    CREATE OR REPLACE PROCEDURE make_reservation_proc(
+        p_username VARCHAR,
+        p_equipment_id INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        available BOOLEAN;
+        conflict_count INT;
+    BEGIN
+        SELECT equipment_availability INTO available FROM Equipment WHERE equipment_id = p_equipment_id;
+        IF available IS NULL THEN
+            RAISE EXCEPTION 'Equipment ID % does not exist.', p_equipment_id;
+        END IF;
+
+        IF NOT available THEN
+            RAISE EXCEPTION 'Equipment is currently not available.';
+        END IF;
+
+        SELECT COUNT(*) INTO conflict_count FROM Reservation
+        WHERE equipment_id = p_equipment_id
+          AND status = 'Active'
+          AND (p_start_date <= end_date AND p_end_date >= start_date);
+
+        IF conflict_count > 0 THEN
+            RAISE EXCEPTION 'Equipment is already reserved for the selected date range.';
+        END IF;
+
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES (p_username, p_equipment_id, p_start_date, p_end_date, 'Active');
+
+        UPDATE Equipment SET equipment_availability = FALSE WHERE equipment_id = p_equipment_id;
+
+        RAISE NOTICE 'Reservation successful.';
+    END;
+    $$;
+    """),
+
+    (2, "Reservation daterange with GiST exclusion constraint on active bookings", """
+    CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+    -- Older rows can end before they start, which daterange() rejects. Their dates are
+    -- swapped, and the CHECK stops new ones.
+    UPDATE Reservation SET start_date = end_date, end_date = start_date WHERE start_date > end_date;
+
+    ALTER TABLE Reservation
+        ADD CONSTRAINT reservation_dates_check CHECK (start_date <= end_date);
+
+    ALTER TABLE Reservation
+        ADD COLUMN period DATERANGE GENERATED ALWAYS AS (daterange(start_date, end_date, '[]')) STORED;
+
+    ALTER TABLE Reservation
+        ADD CONSTRAINT reservation_no_overlap
+        EXCLUDE USING gist (equipment_id WITH =, period WITH &&)
+        WHERE (status = 'Active');
+
+    CREATE OR REPLACE PROCEDURE make_reservation_proc(
+        p_username VARCHAR,
+        p_equipment_id INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        available BOOLEAN;
+    BEGIN
+        IF p_start_date > p_end_date THEN
+            RAISE EXCEPTION 'Start date cannot be after end date.' USING ERRCODE = 'RS003';
+        END IF;
+
+        SELECT equipment_availability INTO available FROM Equipment WHERE equipment_id = p_equipment_id;
+        IF available IS NULL THEN
+            RAISE EXCEPTION 'Equipment ID % does not exist.', p_equipment_id USING ERRCODE = 'RS001';
+        END IF;
+
+        IF NOT available THEN
+            RAISE EXCEPTION 'Equipment is currently not available.' USING ERRCODE = 'RS002';
+        END IF;
+
+        -- Overlapping active bookings are rejected by reservation_no_overlap (SQLSTATE 23P01).
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES (p_username, p_equipment_id, p_start_date, p_end_date, 'Active');
+
+        UPDATE Equipment SET equipment_availability = FALSE WHERE equipment_id = p_equipment_id;
+
+        RAISE NOTICE 'Reservation successful.';
+    END;
+    $$;
+    """),
+
+    (3, "reserve_equipment function and set-based make_reservations_batch", """
+    CREATE OR REPLACE FUNCTION reserve_equipment(
+        p_username VARCHAR,
+        p_equipment_id INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    RETURNS INT
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        available BOOLEAN;
+        new_id INT;
+    BEGIN
+        IF p_start_date > p_end_date THEN
+            RAISE EXCEPTION 'Start date cannot be after end date.' USING ERRCODE = 'RS003';
+        END IF;
+
+        SELECT equipment_availability INTO available FROM Equipment WHERE equipment_id = p_equipment_id;
+        IF available IS NULL THEN
+            RAISE EXCEPTION 'Equipment ID % does not exist.', p_equipment_id USING ERRCODE = 'RS001';
+        END IF;
+
+        IF NOT available THEN
+            RAISE EXCEPTION 'Equipment is currently not available.' USING ERRCODE = 'RS002';
+        END IF;
+
+        -- Overlapping active bookings are rejected by reservation_no_overlap (SQLSTATE 23P01).
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES (p_username, p_equipment_id, p_start_date, p_end_date, 'Active')
+        RETURNING reservation_id INTO new_id;
+
+        UPDATE Equipment SET equipment_availability = FALSE WHERE equipment_id = p_equipment_id;
+
+        RETURN new_id;
+    END;
+    $$;
+
+    CREATE OR REPLACE PROCEDURE make_reservation_proc(
+        p_username VARCHAR,
+        p_equipment_id INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    LANGUAGE plpgsql
+    AS $$
+    BEGIN
+        PERFORM reserve_equipment(p_username, p_equipment_id, p_start_date, p_end_date);
+        RAISE NOTICE 'Reservation successful.';
+    END;
+    $$;
+
+    -- Books every item in its own subtransaction and reports one row per attempted item.
+    -- Items are taken in equipment_id order so concurrent batches lock Equipment rows in
+    -- the same order. With p_stop_on_error the loop ends at the first failure.
+    CREATE OR REPLACE FUNCTION make_reservations_batch(
+        p_usernames VARCHAR[],
+        p_equipment_ids INT[],
+        p_start_dates DATE[],
+        p_end_dates DATE[],
+        p_stop_on_error BOOLEAN DEFAULT FALSE
+    )
+    RETURNS TABLE (item_index INT, new_reservation_id INT, error_code TEXT, error_message TEXT)
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        item RECORD;
+    BEGIN
+        FOR item IN
+            SELECT t.username, t.equipment_id, t.start_date, t.end_date, t.idx
+            FROM unnest(p_usernames, p_equipment_ids, p_start_dates, p_end_dates)
+                WITH ORDINALITY AS t(username, equipment_id, start_date, end_date, idx)
+            ORDER BY t.equipment_id, t.idx
+        LOOP
+            item_index := item.idx;
+            BEGIN
+                new_reservation_id := reserve_equipment(item.username, item.equipment_id, item.start_date, item.end_date);
+                error_code := NULL;
+                error_message := NULL;
+            EXCEPTION WHEN OTHERS THEN
+                new_reservation_id := NULL;
+                error_code := SQLSTATE;
+                error_message := SQLERRM;
+            END;
+            RETURN NEXT;
+            EXIT WHEN p_stop_on_error AND error_code IS NOT NULL;
+        END LOOP;
+    END;
+    $$;
+    """),
+
+    (4, "Equipment change notifications for the in-process catalog cache", """
+    CREATE OR REPLACE FUNCTION notify_equipment_change()
+    RETURNS TRIGGER
+    LANGUAGE plpgsql
+    AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            PERFORM pg_notify('equipment_changed', '*');
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('equipment_changed', OLD.equipment_id::TEXT);
+        ELSIF TG_OP = 'INSERT' OR OLD IS DISTINCT FROM NEW THEN
+            PERFORM pg_notify('equipment_changed', NEW.equipment_id::TEXT);
+        END IF;
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE TRIGGER equipment_changed
+        AFTER INSERT OR UPDATE OR DELETE ON Equipment
+        FOR EACH ROW EXECUTE FUNCTION notify_equipment_change();
+
+    CREATE TRIGGER equipment_truncated
+        AFTER TRUNCATE ON Equipment
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_equipment_change();
+    """),
+
+    (5, "Indexes for keyset-paginated catalog and reservation history", """
+    CREATE INDEX IF NOT EXISTS equipment_name_idx ON Equipment (name, equipment_id);
+
+    CREATE INDEX IF NOT EXISTS equipment_condition_idx ON Equipment (equipment_condition, equipment_id);
+
+    CREATE INDEX IF NOT EXISTS reservation_user_history_idx
+        ON Reservation (username, start_date DESC, reservation_id DESC);
+
+    CREATE INDEX IF NOT EXISTS reservation_overdue_idx
+        ON Reservation (end_date, reservation_id) WHERE status = 'Overdue';
+    """),
+
+    (6, "Partial index on active reservations by end date for the overdue sweeper", """
+    CREATE INDEX IF NOT EXISTS reservation_active_end_idx
+        ON Reservation (end_date) WHERE status = 'Active';
+    """),
+
+    (7, "Per-day usage counters maintained by statement-level triggers on Reservation", """
+    CREATE TABLE IF NOT EXISTS Equipment_Usage_Daily (
+        usage_date DATE NOT NULL,
+        name VARCHAR(50) NOT NULL,
+        borrow_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (usage_date, name)
+    );
+
+    INSERT INTO Equipment_Usage_Daily (usage_date, name, borrow_count)
+    SELECT r.start_date, e.name, COUNT(*)
+    FROM Reservation r
+    JOIN Equipment e ON r.equipment_id = e.equipment_id
+    GROUP BY r.start_date, e.name
+    ON CONFLICT (usage_date, name) DO UPDATE SET borrow_count = EXCLUDED.borrow_count;
+
+    -- Statement-level with transition tables, so COPY and batch inserts update each
+    -- (day, name) counter once per statement rather than once per row.
+    CREATE OR REPLACE FUNCTION count_equipment_usage()
+    RETURNS TRIGGER
+    LANGUAGE plpgsql
+    AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO Equipment_Usage_Daily (usage_date, name, borrow_count)
+            SELECT n.start_date, e.name, COUNT(*)
+            FROM new_reservations n
+            JOIN Equipment e ON n.equipment_id = e.equipment_id
+            GROUP BY n.start_date, e.name
+            ON CONFLICT (usage_date, name)
+                DO UPDATE SET borrow_count = Equipment_Usage_Daily.borrow_count + EXCLUDED.borrow_count;
+        ELSE
+            UPDATE Equipment_Usage_Daily u
+            SET borrow_count = u.borrow_count - d.removed
+            FROM (
+                SELECT o.start_date, e.name, COUNT(*) AS removed
+                FROM old_reservations o
+                JOIN Equipment e ON o.equipment_id = e.equipment_id
+                GROUP BY o.start_date, e.name
+            ) d
+            WHERE u.usage_date = d.start_date AND u.name = d.name;
+        END IF;
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE TRIGGER reservation_usage_insert
+        AFTER INSERT ON Reservation
+        REFERENCING NEW TABLE AS new_reservations
+        FOR EACH STATEMENT EXECUTE FUNCTION count_equipment_usage();
+
+    CREATE TRIGGER reservation_usage_delete
+        AFTER DELETE ON Reservation
+        REFERENCING OLD TABLE AS old_reservations
+        FOR EACH STATEMENT EXECUTE FUNCTION count_equipment_usage();
+    """),
+
+    (8, "Allow future bookings on units whose only bookings are for other dates", """
+    -- equipment_availability is FALSE both while a unit is booked and when staff take it
+    -- out of service. Only the second case now blocks new bookings; date clashes with
+    -- existing bookings are left to reservation_no_overlap.
+    CREATE OR REPLACE FUNCTION reserve_equipment(
+        p_username VARCHAR,
+        p_equipment_id INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    RETURNS INT
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        available BOOLEAN;
+        current_condition VARCHAR;
+        new_id INT;
+    BEGIN
+        IF p_start_date > p_end_date THEN
+            RAISE EXCEPTION 'Start date cannot be after end date.' USING ERRCODE = 'RS003';
+        END IF;
+
+        SELECT equipment_availability, equipment_condition INTO available, current_condition
+        FROM Equipment WHERE equipment_id = p_equipment_id;
+        IF available IS NULL THEN
+            RAISE EXCEPTION 'Equipment ID % does not exist.', p_equipment_id USING ERRCODE = 'RS001';
+        END IF;
+
+        IF current_condition IN ('Lost', 'Damaged') OR (NOT available AND NOT EXISTS (
+            SELECT 1 FROM Reservation WHERE equipment_id = p_equipment_id AND status = 'Active'
+        )) THEN
+            RAISE EXCEPTION 'Equipment is currently not available.' USING ERRCODE = 'RS002';
+        END IF;
+
+        -- Overlapping active bookings are rejected by reservation_no_overlap (SQLSTATE 23P01).
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES (p_username, p_equipment_id, p_start_date, p_end_date, 'Active')
+        RETURNING reservation_id INTO new_id;
+
+        UPDATE Equipment SET equipment_availability = FALSE WHERE equipment_id = p_equipment_id;
+
+        RETURN new_id;
+    END;
+    $$;
+    """),
+
+    (9, "bcrypt password hashes and single-call authenticate()", """
+    CREATE EXTENSION IF NOT EXISTS pgcrypto;
+
+    UPDATE User_Account SET password = crypt(password, gen_salt('bf', 10))
+    WHERE password NOT LIKE '$2_$%';
+
+    CREATE OR REPLACE FUNCTION check_credentials(p_username VARCHAR, p_password VARCHAR)
+    RETURNS BOOLEAN AS $$
+    DECLARE
+        valid BOOLEAN;
+    BEGIN
+        SELECT EXISTS (
+            SELECT 1 FROM User_Account WHERE username = p_username AND password = crypt(p_password, password)) INTO valid;
+            RETURN valid;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP FUNCTION IF EXISTS add_user_account(VARCHAR, VARCHAR, VARCHAR);
+
+    CREATE OR REPLACE FUNCTION add_user_account(p_email VARCHAR, p_username VARCHAR, p_password VARCHAR, p_cost INT DEFAULT 10)
+    RETURNS BOOLEAN AS $$
+    DECLARE
+        user_id INT;
+        exists BOOLEAN;
+    BEGIN
+        SELECT id INTO user_id FROM Student_Staff WHERE email = p_email;
+        IF user_id IS NULL THEN
+            RETURN FALSE;
+        END IF;
+
+        SELECT EXISTS(SELECT 1 FROM User_Account WHERE id = user_id) INTO exists;
+        IF exists THEN
+            RETURN FALSE;
+        ELSE
+            INSERT INTO User_Account (id, username, password)
+            VALUES (user_id, p_username, crypt(p_password, gen_salt('bf', p_cost)));
+            RETURN TRUE;
+        END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Credential check, role and account id in one call; role and id are only
+    -- returned when the password matches.
+    CREATE OR REPLACE FUNCTION authenticate(p_username VARCHAR, p_password VARCHAR)
+    RETURNS TABLE (valid BOOLEAN, role VARCHAR, account_id INT) AS $$
+    DECLARE
+        stored VARCHAR;
+    BEGIN
+        SELECT ua.password, ss.role, ua.id INTO stored, role, account_id
+        FROM User_Account ua JOIN Student_Staff ss ON ss.id = ua.id
+        WHERE ua.username = p_username;
+
+        valid := stored IS NOT NULL AND stored = crypt(p_password, stored);
+        IF NOT valid THEN
+            role := NULL;
+            account_id := NULL;
+        END IF;
+        RETURN NEXT;
+    END;
+    $$ LANGUAGE plpgsql;
+    """),
+    (10, "Partition Reservation by month of start_date; active bookings move to Active_Reservation", """
+    -- Exclusion constraints cannot span partitions, so the no-overlap rule now lives on
+    -- Active_Reservation: a small side table holding only the Active bookings, kept in
+    -- step with Reservation by trigger. Hot-path checks read it instead of the history.
+    ALTER TABLE Reservation RENAME TO Reservation_Unpartitioned;
+
+    CREATE TABLE Reservation (
+        reservation_id INT NOT NULL DEFAULT nextval('reservation_reservation_id_seq'),
+        username VARCHAR(50) NOT NULL REFERENCES User_Account(username),
+        equipment_id INT NOT NULL REFERENCES Equipment(equipment_id),
+        start_date DATE NOT NULL,
+        end_date DATE NOT NULL,
+        status VARCHAR(20) DEFAULT 'Active',
+        CONSTRAINT reservation_partitioned_pkey PRIMARY KEY (reservation_id, start_date)
+    ) PARTITION BY RANGE (start_date);
+
+    -- One partition per month, named reservation_YYYY_MM.
+    CREATE OR REPLACE FUNCTION create_reservation_partition(p_day DATE)
+    RETURNS BOOLEAN
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        month_start DATE := date_trunc('month', p_day)::DATE;
+        partition_name TEXT := 'reservation_' || to_char(p_day, 'YYYY_MM');
+    BEGIN
+        IF to_regclass(partition_name) IS NOT NULL THEN
+            RETURN FALSE;
+        END IF;
+        EXECUTE format('CREATE TABLE %I PARTITION OF Reservation FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, month_start, (month_start + INTERVAL '1 month')::DATE);
+        RETURN TRUE;
+    EXCEPTION
+        -- Another session created it first, or the month lies inside reservation_history.
+        WHEN duplicate_table OR invalid_object_definition THEN
+            RETURN FALSE;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION ensure_reservation_partitions(p_months_ahead INT DEFAULT 3)
+    RETURNS INT
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        created INT := 0;
+    BEGIN
+        FOR m IN 0..p_months_ahead LOOP
+            IF create_reservation_partition((date_trunc('month', CURRENT_DATE) + make_interval(months => m))::DATE) THEN
+                created := created + 1;
+            END IF;
+        END LOOP;
+        RETURN created;
+    END;
+    $$;
+
+    -- Everything older than a year goes into one partition; later months get their own.
+    DO $$
+    DECLARE
+        first_month DATE := (date_trunc('month', CURRENT_DATE) - INTERVAL '12 months')::DATE;
+        month_start DATE;
+    BEGIN
+        EXECUTE format('CREATE TABLE reservation_history PARTITION OF Reservation FOR VALUES FROM (MINVALUE) TO (%L)',
+                       first_month);
+        FOR month_start IN
+            SELECT generate_series(first_month, date_trunc('month', CURRENT_DATE)::DATE, INTERVAL '1 month')::DATE
+            UNION
+            SELECT DISTINCT date_trunc('month', start_date)::DATE FROM Reservation_Unpartitioned WHERE start_date >= first_month
+        LOOP
+            PERFORM create_reservation_partition(month_start);
+        END LOOP;
+        PERFORM ensure_reservation_partitions(3);
+    END $$;
+
+    INSERT INTO Reservation (reservation_id, username, equipment_id, start_date, end_date, status)
+    SELECT reservation_id, username, equipment_id, start_date, end_date, status
+    FROM Reservation_Unpartitioned;
+
+    ALTER SEQUENCE reservation_reservation_id_seq OWNED BY Reservation.reservation_id;
+    DROP TABLE Reservation_Unpartitioned;
+    ALTER TABLE Reservation RENAME CONSTRAINT reservation_partitioned_pkey TO reservation_pkey;
+
+    CREATE INDEX reservation_user_history_idx
+        ON Reservation (username, start_date DESC, reservation_id DESC);
+
+    CREATE INDEX reservation_overdue_idx
+        ON Reservation (end_date, reservation_id) WHERE status = 'Overdue';
+
+    CREATE TABLE Active_Reservation (
+        reservation_id INT PRIMARY KEY,
+        equipment_id INT NOT NULL,
+        start_date DATE NOT NULL,
+        end_date DATE NOT NULL,
+        period DATERANGE GENERATED ALWAYS AS (daterange(start_date, end_date, '[]')) STORED,
+        CONSTRAINT reservation_no_overlap EXCLUDE USING gist (equipment_id WITH =, period WITH &&)
+    );
+
+    INSERT INTO Active_Reservation (reservation_id, equipment_id, start_date, end_date)
+    SELECT reservation_id, equipment_id, start_date, end_date
+    FROM Reservation
+    WHERE status = 'Active';
+
+    CREATE INDEX reservation_active_end_idx ON Active_Reservation (end_date);
+
+    -- An overlapping booking fails here with SQLSTATE 23P01, as it did on Reservation.
+    CREATE OR REPLACE FUNCTION sync_active_reservation()
+    RETURNS TRIGGER
+    LANGUAGE plpgsql
+    AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'Active' THEN
+            DELETE FROM Active_Reservation WHERE reservation_id = OLD.reservation_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'Active' THEN
+            INSERT INTO Active_Reservation (reservation_id, equipment_id, start_date, end_date)
+            VALUES (NEW.reservation_id, NEW.equipment_id, NEW.start_date, NEW.end_date);
+        END IF;
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE TRIGGER reservation_active_sync
+        AFTER INSERT OR UPDATE OR DELETE ON Reservation
+        FOR EACH ROW EXECUTE FUNCTION sync_active_reservation();
+
+    CREATE TRIGGER reservation_usage_insert
+        AFTER INSERT ON Reservation
+        REFERENCING NEW TABLE AS new_reservations
+        FOR EACH STATEMENT EXECUTE FUNCTION count_equipment_usage();
+
+    CREATE TRIGGER reservation_usage_delete
+        AFTER DELETE ON Reservation
+        REFERENCING OLD TABLE AS old_reservations
+        FOR EACH STATEMENT EXECUTE FUNCTION count_equipment_usage();
+
+    -- Creates the month's partition on first use if maintenance has not done so yet.
+    CREATE OR REPLACE FUNCTION reserve_equipment(
+        p_username VARCHAR,
+        p_equipment_id INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    RETURNS INT
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        available BOOLEAN;
+        current_condition VARCHAR;
+        new_id INT;
+    BEGIN
+        IF p_start_date > p_end_date THEN
+            RAISE EXCEPTION 'Start date cannot be after end date.' USING ERRCODE = 'RS003';
+        END IF;
+
+        SELECT equipment_availability, equipment_condition INTO available, current_condition
+        FROM Equipment WHERE equipment_id = p_equipment_id;
+        IF available IS NULL THEN
+            RAISE EXCEPTION 'Equipment ID % does not exist.', p_equipment_id USING ERRCODE = 'RS001';
+        END IF;
+
+        IF current_condition IN ('Lost', 'Damaged') OR (NOT available AND NOT EXISTS (
+            SELECT 1 FROM Active_Reservation WHERE equipment_id = p_equipment_id
+        )) THEN
+            RAISE EXCEPTION 'Equipment is currently not available.' USING ERRCODE = 'RS002';
+        END IF;
+
+        IF to_regclass('reservation_' || to_char(p_start_date, 'YYYY_MM')) IS NULL THEN
+            PERFORM create_reservation_partition(p_start_date);
+        END IF;
+
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES (p_username, p_equipment_id, p_start_date, p_end_date, 'Active')
+        RETURNING reservation_id INTO new_id;
+
+        UPDATE Equipment SET equipment_availability = FALSE WHERE equipment_id = p_equipment_id;
+
+        RETURN new_id;
+    END;
+    $$;
+    """),
+    (11, "reserve_by_model(): book any N free Good units of a model at once", """
+    -- Candidates are locked FOR UPDATE SKIP LOCKED, so concurrent requests for the same
+    -- model take different units instead of queueing behind each other. A unit booked by
+    -- a concurrent single-unit reservation fails with 23P01 in its own subtransaction and
+    -- the next candidate is tried. Any shortfall raises RS004, undoing the whole request.
+    CREATE OR REPLACE FUNCTION reserve_by_model(
+        p_username VARCHAR,
+        p_name VARCHAR,
+        p_quantity INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    RETURNS TABLE(booked_equipment_id INT, new_reservation_id INT)
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        unit RECORD;
+        booked INT := 0;
+        tried INT[] := '{}';
+        found_any BOOLEAN;
+    BEGIN
+        IF p_start_date > p_end_date THEN
+            RAISE EXCEPTION 'Start date cannot be after end date.' USING ERRCODE = 'RS003';
+        END IF;
+
+        LOOP
+            found_any := FALSE;
+            FOR unit IN
+                SELECT e.equipment_id
+                FROM Equipment e
+                WHERE e.name = p_name
+                  AND e.equipment_condition = 'Good'
+                  AND e.equipment_id <> ALL(tried)
+                  AND (e.equipment_availability OR EXISTS (
+                      SELECT 1 FROM Active_Reservation a WHERE a.equipment_id = e.equipment_id))
+                  AND NOT EXISTS (
+                      SELECT 1 FROM Active_Reservation a
+                      WHERE a.equipment_id = e.equipment_id AND a.period && daterange(p_start_date, p_end_date, '[]'))
+                ORDER BY e.equipment_id
+                LIMIT p_quantity - booked
+                FOR UPDATE OF e SKIP LOCKED
+            LOOP
+                found_any := TRUE;
+                tried := tried || unit.equipment_id;
+                BEGIN
+                    new_reservation_id := reserve_equipment(p_username, unit.equipment_id, p_start_date, p_end_date);
+                    booked_equipment_id := unit.equipment_id;
+                    booked := booked + 1;
+                    RETURN NEXT;
+                EXCEPTION WHEN exclusion_violation THEN
+                    NULL;
+                END;
+            END LOOP;
+            EXIT WHEN booked >= p_quantity OR NOT found_any;
+        END LOOP;
+
+        IF booked < p_quantity THEN
+            RAISE EXCEPTION 'Only % of % % units are free for those dates.', booked, p_quantity, p_name
+                USING ERRCODE = 'RS004';
+        END IF;
+    END;
+    $$;
+    """),
+    (12, "Waitlist and a durable job queue; returns queue offers to waiting users", """
+    CREATE TABLE Waitlist (
+        waitlist_id SERIAL PRIMARY KEY,
+        username VARCHAR(50) NOT NULL REFERENCES User_Account(username),
+        equipment_id INT NOT NULL REFERENCES Equipment(equipment_id),
+        start_date DATE NOT NULL,
+        end_date DATE NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'Waiting' CHECK (status IN ('Waiting', 'Fulfilled', 'Expired', 'Cancelled')),
+        reservation_id INT,
+        created_at TIMESTAMP NOT NULL DEFAULT now(),
+        CHECK (start_date <= end_date)
+    );
+
+    CREATE INDEX waitlist_waiting_idx ON Waitlist (equipment_id, created_at, waitlist_id) WHERE status = 'Waiting';
+    CREATE INDEX waitlist_user_idx ON Waitlist (username, created_at DESC);
+
+    -- Jobs are claimed FOR UPDATE SKIP LOCKED and deleted once done; failures are retried
+    -- with a delay until attempts runs out, then kept as Failed for inspection.
+    CREATE TABLE Job_Queue (
+        job_id BIGSERIAL PRIMARY KEY,
+        kind VARCHAR(50) NOT NULL,
+        payload JSONB NOT NULL DEFAULT '{}',
+        status VARCHAR(20) NOT NULL DEFAULT 'Queued' CHECK (status IN ('Queued', 'Failed')),
+        run_at TIMESTAMP NOT NULL DEFAULT now(),
+        attempts INT NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT now()
+    );
+
+    CREATE INDEX job_queue_ready_idx ON Job_Queue (run_at, job_id) WHERE status = 'Queued';
+
+    -- Books the unit for waiting users in the order they joined, skipping entries other
+    -- workers hold and any whose dates still clash. Entries whose start has passed expire.
+    CREATE OR REPLACE FUNCTION offer_to_waiters(p_equipment_id INT)
+    RETURNS TABLE(fulfilled_waitlist_id INT, fulfilled_username VARCHAR, new_reservation_id INT)
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        waiter RECORD;
+    BEGIN
+        FOR waiter IN
+            SELECT w.waitlist_id, w.username, w.start_date, w.end_date
+            FROM Waitlist w
+            WHERE w.equipment_id = p_equipment_id AND w.status = 'Waiting'
+            ORDER BY w.created_at, w.waitlist_id
+            FOR UPDATE SKIP LOCKED
+        LOOP
+            IF waiter.start_date < CURRENT_DATE THEN
+                UPDATE Waitlist SET status = 'Expired' WHERE waitlist_id = waiter.waitlist_id;
+                CONTINUE;
+            END IF;
+            BEGIN
+                new_reservation_id := reserve_equipment(waiter.username, p_equipment_id, waiter.start_date, waiter.end_date);
+                UPDATE Waitlist SET status = 'Fulfilled', reservation_id = new_reservation_id
+                WHERE waitlist_id = waiter.waitlist_id;
+                fulfilled_waitlist_id := waiter.waitlist_id;
+                fulfilled_username := waiter.username;
+                RETURN NEXT;
+            EXCEPTION WHEN exclusion_violation OR SQLSTATE 'RS002' THEN
+                NULL;
+            END;
+        END LOOP;
+    END;
+    $$;
+    """),
+    (13, "Default Reservation partition; partitions are only created by maintenance, never by a booking", """
+    -- Bookings for a month whose partition does not exist yet land here. Creating the
+    -- partition inside the booking took an ACCESS EXCLUSIVE lock on Reservation and
+    -- blocked every reader and writer behind a single reservation.
+    CREATE TABLE reservation_default PARTITION OF Reservation DEFAULT;
+
+    -- The month is built as a standalone table and attached, which locks Reservation far
+    -- more lightly than CREATE TABLE ... PARTITION OF. Bookings for the month that are
+    -- already in reservation_default move with it; deleting them there fires the
+    -- Active_Reservation sync, so their Active rows are put back once it is attached.
+    CREATE OR REPLACE FUNCTION create_reservation_partition(p_day DATE)
+    RETURNS BOOLEAN
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        month_start DATE := date_trunc('month', p_day)::DATE;
+        month_end DATE := (date_trunc('month', p_day) + INTERVAL '1 month')::DATE;
+        partition_name TEXT := 'reservation_' || to_char(p_day, 'YYYY_MM');
+    BEGIN
+        IF to_regclass(partition_name) IS NOT NULL THEN
+            RETURN FALSE;
+        END IF;
+        EXECUTE format('CREATE TABLE %I (LIKE Reservation INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+        EXECUTE format('WITH moved AS (DELETE FROM reservation_default WHERE start_date >= %L AND start_date < %L RETURNING *) '
+                       'INSERT INTO %I SELECT * FROM moved', month_start, month_end, partition_name);
+        EXECUTE format('ALTER TABLE Reservation ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, month_start, month_end);
+        EXECUTE format('INSERT INTO Active_Reservation (reservation_id, equipment_id, start_date, end_date) '
+                       'SELECT reservation_id, equipment_id, start_date, end_date FROM %I WHERE status = %L',
+                       partition_name, 'Active');
+        RETURN TRUE;
+    EXCEPTION
+        -- Another session created it first, or the month lies inside reservation_history.
+        WHEN duplicate_table OR invalid_object_definition THEN
+            RETURN FALSE;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION reserve_equipment(
+        p_username VARCHAR,
+        p_equipment_id INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    RETURNS INT
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        available BOOLEAN;
+        current_condition VARCHAR;
+        new_id INT;
+    BEGIN
+        IF p_start_date > p_end_date THEN
+            RAISE EXCEPTION 'Start date cannot be after end date.' USING ERRCODE = 'RS003';
+        END IF;
+
+        SELECT equipment_availability, equipment_condition INTO available, current_condition
+        FROM Equipment WHERE equipment_id = p_equipment_id;
+        IF available IS NULL THEN
+            RAISE EXCEPTION 'Equipment ID % does not exist.', p_equipment_id USING ERRCODE = 'RS001';
+        END IF;
+
+        IF current_condition IN ('Lost', 'Damaged') OR (NOT available AND NOT EXISTS (
+            SELECT 1 FROM Active_Reservation WHERE equipment_id = p_equipment_id
+        )) THEN
+            RAISE EXCEPTION 'Equipment is currently not available.' USING ERRCODE = 'RS002';
+        END IF;
+
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES (p_username, p_equipment_id, p_start_date, p_end_date, 'Active')
+        RETURNING reservation_id INTO new_id;
+
+        UPDATE Equipment SET equipment_availability = FALSE WHERE equipment_id = p_equipment_id;
+
+        RETURN new_id;
+    END;
+    $$;
+    """),
+    (14, "An Overdue booking blocks new bookings of its unit", """
+    -- Overdue bookings are not in Active_Reservation, so a unit still out on one and also
+    -- booked for later dates passed the availability check and could be booked for today.
+    CREATE INDEX reservation_overdue_unit_idx ON Reservation (equipment_id) WHERE status = 'Overdue';
+
+    CREATE OR REPLACE FUNCTION reserve_equipment(
+        p_username VARCHAR,
+        p_equipment_id INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    RETURNS INT
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        available BOOLEAN;
+        current_condition VARCHAR;
+        new_id INT;
+    BEGIN
+        IF p_start_date > p_end_date THEN
+            RAISE EXCEPTION 'Start date cannot be after end date.' USING ERRCODE = 'RS003';
+        END IF;
+
+        SELECT equipment_availability, equipment_condition INTO available, current_condition
+        FROM Equipment WHERE equipment_id = p_equipment_id;
+        IF available IS NULL THEN
+            RAISE EXCEPTION 'Equipment ID % does not exist.', p_equipment_id USING ERRCODE = 'RS001';
+        END IF;
+
+        IF current_condition IN ('Lost', 'Damaged') OR (NOT available AND NOT EXISTS (
+            SELECT 1 FROM Active_Reservation WHERE equipment_id = p_equipment_id
+        )) OR EXISTS (
+            SELECT 1 FROM Reservation WHERE equipment_id = p_equipment_id AND status = 'Overdue'
+        ) THEN
+            RAISE EXCEPTION 'Equipment is currently not available.' USING ERRCODE = 'RS002';
+        END IF;
+
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES (p_username, p_equipment_id, p_start_date, p_end_date, 'Active')
+        RETURNING reservation_id INTO new_id;
+
+        UPDATE Equipment SET equipment_availability = FALSE WHERE equipment_id = p_equipment_id;
+
+        RETURN new_id;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION reserve_by_model(
+        p_username VARCHAR,
+        p_name VARCHAR,
+        p_quantity INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    RETURNS TABLE(booked_equipment_id INT, new_reservation_id INT)
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        unit RECORD;
+        booked INT := 0;
+        tried INT[] := '{}';
+        found_any BOOLEAN;
+    BEGIN
+        IF p_start_date > p_end_date THEN
+            RAISE EXCEPTION 'Start date cannot be after end date.' USING ERRCODE = 'RS003';
+        END IF;
+
+        LOOP
+            found_any := FALSE;
+            FOR unit IN
+                SELECT e.equipment_id
+                FROM Equipment e
+                WHERE e.name = p_name
+                  AND e.equipment_condition = 'Good'
+                  AND e.equipment_id <> ALL(tried)
+                  AND (e.equipment_availability OR EXISTS (
+                      SELECT 1 FROM Active_Reservation a WHERE a.equipment_id = e.equipment_id))
+                  AND NOT EXISTS (
+                      SELECT 1 FROM Reservation r WHERE r.equipment_id = e.equipment_id AND r.status = 'Overdue')
+                  AND NOT EXISTS (
+                      SELECT 1 FROM Active_Reservation a
+                      WHERE a.equipment_id = e.equipment_id AND a.period && daterange(p_start_date, p_end_date, '[]'))
+                ORDER BY e.equipment_id
+                LIMIT p_quantity - booked
+                FOR UPDATE OF e SKIP LOCKED
+            LOOP
+                found_any := TRUE;
+                tried := tried || unit.equipment_id;
+                BEGIN
+                    new_reservation_id := reserve_equipment(p_username, unit.equipment_id, p_start_date, p_end_date);
+                    booked_equipment_id := unit.equipment_id;
+                    booked := booked + 1;
+                    RETURN NEXT;
+                EXCEPTION WHEN exclusion_violation THEN
+                    NULL;
+                END;
+            END LOOP;
+            EXIT WHEN booked >= p_quantity OR NOT found_any;
+        END LOOP;
+
+        IF booked < p_quantity THEN
+            RAISE EXCEPTION 'Only % of % % units are free for those dates.', booked, p_quantity, p_name
+                USING ERRCODE = 'RS004';
+        END IF;
+    END;
+    $$;
+    """),
+    (15, "authenticate() rehashes a password whose bcrypt cost differs from the configured one", """
+    DROP FUNCTION IF EXISTS authenticate(VARCHAR, VARCHAR);
+
+    -- Only a login has the plaintext, so hashes made at another cost (migration 9 used 10)
+    -- are rehashed at p_cost here, the first time their owner logs in after a change.
+    CREATE OR REPLACE FUNCTION authenticate(p_username VARCHAR, p_password VARCHAR, p_cost INT DEFAULT NULL)
+    RETURNS TABLE (valid BOOLEAN, role VARCHAR, account_id INT) AS $$
+    DECLARE
+        stored VARCHAR;
+    BEGIN
+        SELECT ua.password, ss.role, ua.id INTO stored, role, account_id
+        FROM User_Account ua JOIN Student_Staff ss ON ss.id = ua.id
+        WHERE ua.username = p_username;
+
+        valid := stored IS NOT NULL AND stored = crypt(p_password, stored);
+        IF NOT valid THEN
+            role := NULL;
+            account_id := NULL;
+        ELSIF p_cost IS NOT NULL AND substring(stored FROM 5 FOR 2)::INT <> p_cost THEN
+            UPDATE User_Account SET password = crypt(p_password, gen_salt('bf', p_cost))
+            WHERE id = account_id;
+        END IF;
+        RETURN NEXT;
+    END;
+    $$ LANGUAGE plpgsql;
+    """),
+    (16, "CHECK that reservations do not end before they start", """
+    -- Migration 10 rebuilt Reservation without the CHECK from migration 2. Partitions made
+    -- later copy it through LIKE ... INCLUDING CONSTRAINTS.
+    UPDATE Reservation SET start_date = end_date, end_date = start_date WHERE start_date > end_date;
+
+    ALTER TABLE Reservation
+        ADD CONSTRAINT reservation_dates_check CHECK (start_date <= end_date);
+    """),
+    (17, "Equipment.in_service: the staff flag, kept apart from whether the unit is booked", """
+    -- equipment_availability is cleared by every booking, so reserve_equipment could not
+    -- tell a unit staff took out of service from one that is merely out on loan, and
+    -- ignored the staff flag while the unit was booked. in_service is changed by staff only.
+    ALTER TABLE Equipment ADD COLUMN in_service BOOLEAN NOT NULL DEFAULT TRUE;
+
+    UPDATE Equipment e SET in_service = FALSE
+    WHERE NOT e.equipment_availability
+      AND NOT EXISTS (SELECT 1 FROM Active_Reservation a WHERE a.equipment_id = e.equipment_id)
+      AND NOT EXISTS (SELECT 1 FROM Reservation r WHERE r.equipment_id = e.equipment_id AND r.status = 'Overdue');
+
+    CREATE OR REPLACE FUNCTION reserve_equipment(
+        p_username VARCHAR,
+        p_equipment_id INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    RETURNS INT
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        serviceable BOOLEAN;
+        current_condition VARCHAR;
+        new_id INT;
+    BEGIN
+        IF p_start_date > p_end_date THEN
+            RAISE EXCEPTION 'Start date cannot be after end date.' USING ERRCODE = 'RS003';
+        END IF;
+
+        SELECT in_service, equipment_condition INTO serviceable, current_condition
+        FROM Equipment WHERE equipment_id = p_equipment_id;
+        IF serviceable IS NULL THEN
+            RAISE EXCEPTION 'Equipment ID % does not exist.', p_equipment_id USING ERRCODE = 'RS001';
+        END IF;
+
+        IF current_condition IN ('Lost', 'Damaged') OR NOT serviceable OR EXISTS (
+            SELECT 1 FROM Reservation WHERE equipment_id = p_equipment_id AND status = 'Overdue'
+        ) THEN
+            RAISE EXCEPTION 'Equipment is currently not available.' USING ERRCODE = 'RS002';
+        END IF;
+
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES (p_username, p_equipment_id, p_start_date, p_end_date, 'Active')
+        RETURNING reservation_id INTO new_id;
+
+        UPDATE Equipment SET equipment_availability = FALSE WHERE equipment_id = p_equipment_id;
+
+        RETURN new_id;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION reserve_by_model(
+        p_username VARCHAR,
+        p_name VARCHAR,
+        p_quantity INT,
+        p_start_date DATE,
+        p_end_date DATE
+    )
+    RETURNS TABLE(booked_equipment_id INT, new_reservation_id INT)
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        unit RECORD;
+        booked INT := 0;
+        tried INT[] := '{}';
+        found_any BOOLEAN;
+    BEGIN
+        IF p_start_date > p_end_date THEN
+            RAISE EXCEPTION 'Start date cannot be after end date.' USING ERRCODE = 'RS003';
+        END IF;
+
+        LOOP
+            found_any := FALSE;
+            FOR unit IN
+                SELECT e.equipment_id
+                FROM Equipment e
+                WHERE e.name = p_name
+                  AND e.equipment_condition = 'Good'
+                  AND e.equipment_id <> ALL(tried)
+                  AND e.in_service
+                  AND NOT EXISTS (
+                      SELECT 1 FROM Reservation r WHERE r.equipment_id = e.equipment_id AND r.status = 'Overdue')
+                  AND NOT EXISTS (
+                      SELECT 1 FROM Active_Reservation a
+                      WHERE a.equipment_id = e.equipment_id AND a.period && daterange(p_start_date, p_end_date, '[]'))
+                ORDER BY e.equipment_id
+                LIMIT p_quantity - booked
+                FOR UPDATE OF e SKIP LOCKED
+            LOOP
+                found_any := TRUE;
+                tried := tried || unit.equipment_id;
+                BEGIN
+                    new_reservation_id := reserve_equipment(p_username, unit.equipment_id, p_start_date, p_end_date);
+                    booked_equipment_id := unit.equipment_id;
+                    booked := booked + 1;
+                    RETURN NEXT;
+                EXCEPTION WHEN exclusion_violation THEN
+                    NULL;
+                END;
+            END LOOP;
+            EXIT WHEN booked >= p_quantity OR NOT found_any;
+        END LOOP;
+
+        IF booked < p_quantity THEN
+            RAISE EXCEPTION 'Only % of % % units are free for those dates.', booked, p_quantity, p_name
+                USING ERRCODE = 'RS004';
+        END IF;
+    END;
+    $$;
+    """),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
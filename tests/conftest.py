@@ -0,0 +1,82 @@
+import os
+import sys
+import uuid
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import DigitalRentalSystem as drs
+
+
+# Each test gets a throwaway database on the server named by test_dsn, a libpq DSN for a
+# role allowed to CREATE DATABASE (e.g. "host=localhost user=postgres"). The server needs
+# the btree_gist and pgcrypto extensions. Without test_dsn the tests are skipped.
+ADMIN_DSN = os.getenv("test_dsn")
+
+DB_CONFIG_KEYS = ("user", "password", "host", "port", "dbname")
+
+
+def _admin_execute(statement):
+    conn = psycopg2.connect(ADMIN_DSN)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(statement)
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def empty_db(monkeypatch):
+    if not ADMIN_DSN:
+        pytest.skip("set test_dsn to run the database tests")
+    name = f"rental_test_{uuid.uuid4().hex[:12]}"
+    _admin_execute(f"CREATE DATABASE {name};")
+    params = {**psycopg2.extensions.parse_dsn(ADMIN_DSN), "dbname": name}
+    # The helpers read their connection settings from the environment, as from .env.
+    for key in DB_CONFIG_KEYS:
+        if params.get(key):
+            monkeypatch.setenv(key, params[key])
+        else:
+            monkeypatch.delenv(key, raising=False)
+    monkeypatch.setenv("replica_dsns", "")
+    drs.close_pool()
+    try:
+        yield drs.get_db_config()
+    finally:
+        drs.close_pool()
+        _admin_execute(f"DROP DATABASE {name} WITH (FORCE);")
+
+
+# A database migrated to the latest schema.
+@pytest.fixture
+def db(empty_db):
+    with drs.db_session() as (conn, cursor):
+        drs.initialize_db(cursor, conn)
+    return empty_db
+
+
+def backend_pid(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_backend_pid();")
+        pid = cursor.fetchone()[0]
+    conn.rollback()
+    return pid
+
+
+def add_person(cursor, username, role="Student"):
+    cursor.execute("""
+    WITH person AS (
+        INSERT INTO Student_Staff (fullname, email, role) VALUES (%s, %s, %s) RETURNING id
+    )
+    INSERT INTO User_Account (id, username, password)
+    SELECT id, %s, crypt('secret', gen_salt('bf', 4)) FROM person;
+    """, (username, f"{username}@example.com", role, username))
+
+
+def add_equipment(cursor, name="Laptop", condition="Good"):
+    cursor.execute("INSERT INTO Equipment (name, equipment_condition) VALUES (%s, %s) RETURNING equipment_id;",
+                   (name, condition))
+    return cursor.fetchone()[0]
@@ -0,0 +1,97 @@
+from datetime import date, timedelta
+
+import pytest
+
+import DigitalRentalSystem as drs
+import RentalServer
+from ReservationEngine import ReservationEngine
+
+from conftest import add_equipment, add_person
+
+TODAY = date.today()
+
+
+def _day(offset):
+    return TODAY + timedelta(days=offset)
+
+
+def _bookable_everywhere(conn, cursor, equipment_id, start_date, end_date):
+    searched = equipment_id in [row[0] for row in drs.search_available_equipment(cursor, start_date, end_date)]
+    engine = ReservationEngine.load(conn)
+    return searched, engine.is_free(equipment_id, start_date, end_date)
+
+
+def test_overdue_unit_with_a_future_booking_takes_no_booking_for_today(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        unit = add_equipment(cursor)
+        cursor.execute("""
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES ('alice', %s, %s, %s, 'Overdue'), ('alice', %s, %s, %s, 'Active');
+        """, (unit, _day(-10), _day(-3), unit, _day(20), _day(22)))
+        cursor.execute("UPDATE Equipment SET equipment_availability = FALSE WHERE equipment_id = %s;", (unit,))
+        conn.commit()
+
+        assert _bookable_everywhere(conn, cursor, unit, TODAY, _day(1)) == (False, False)
+        assert drs.call_make_reservation_proc(conn, cursor, "alice", unit, TODAY, _day(1)) == ("unavailable", None)
+
+
+def test_staff_flag_holds_while_the_unit_is_booked(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        unit = add_equipment(cursor)
+        conn.commit()
+        code, reservation_id = drs.call_make_reservation_proc(conn, cursor, "alice", unit, TODAY, _day(2))
+        assert code == drs.RESERVATION_OK
+
+        assert drs.mark_equipment_status(conn, cursor, unit, "Worn Out")
+        assert _bookable_everywhere(conn, cursor, unit, _day(10), _day(12)) == (False, False)
+        assert drs.call_make_reservation_proc(conn, cursor, "alice", unit, _day(10), _day(12))[0] == "unavailable"
+
+        # A return does not put the unit back in service.
+        assert drs.return_equipment_batch(conn, cursor, [reservation_id])[0][0] == drs.RESERVATION_OK
+        assert drs.call_make_reservation_proc(conn, cursor, "alice", unit, _day(10), _day(12))[0] == "unavailable"
+
+        assert drs.mark_equipment_status(conn, cursor, unit, "Good")
+        assert _bookable_everywhere(conn, cursor, unit, _day(10), _day(12)) == (True, True)
+        assert drs.call_make_reservation_proc(conn, cursor, "alice", unit, _day(10), _day(12))[0] == drs.RESERVATION_OK
+
+
+def test_booked_unit_still_takes_bookings_for_other_dates(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        unit = add_equipment(cursor)
+        conn.commit()
+        assert drs.call_make_reservation_proc(conn, cursor, "alice", unit, TODAY, _day(2))[0] == drs.RESERVATION_OK
+        assert _bookable_everywhere(conn, cursor, unit, _day(5), _day(6)) == (True, True)
+        assert drs.call_make_reservation_proc(conn, cursor, "alice", unit, _day(5), _day(6))[0] == drs.RESERVATION_OK
+
+
+def test_calendar_agrees_with_search(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        free, lost, overdue = add_equipment(cursor), add_equipment(cursor, condition="Lost"), add_equipment(cursor)
+        cursor.execute("""
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES ('alice', %s, %s, %s, 'Overdue'), ('alice', %s, %s, %s, 'Active');
+        """, (overdue, _day(-5), _day(-1), free, _day(1), _day(1)))
+        conn.commit()
+
+        calendar = drs.get_availability_calendar(cursor, [free, lost, overdue, free, 99999], TODAY, _day(2))
+        assert sorted(calendar) == [free, lost, overdue]
+        assert [is_free for _, is_free in calendar[free]] == [True, False, True]
+        assert not any(is_free for _, is_free in calendar[lost])
+        assert not any(is_free for _, is_free in calendar[overdue])
+
+
+def test_calendar_endpoint_rejects_unknown_ids_and_ignores_repeats(db):
+    with drs.db_session() as (conn, cursor):
+        unit = add_equipment(cursor)
+        conn.commit()
+        params = {"start_date": str(TODAY), "end_date": str(_day(1))}
+        days = RentalServer.calendar(conn, cursor, {**params, "equipment_ids": f"{unit},{unit}"})
+        assert list(days) == [str(unit)] and len(days[str(unit)]) == 2
+
+        with pytest.raises(RentalServer.HttpError) as error:
+            RentalServer.calendar(conn, cursor, {**params, "equipment_ids": f"{unit},99999"})
+        assert error.value.status == 404 and "99999" in error.value.message
@@ -0,0 +1,130 @@
+import io
+import os
+import re
+from datetime import date, timedelta
+
+import DigitalRentalSystem as drs
+from SchemaMigrations import LATEST_SCHEMA_VERSION, MIGRATIONS
+
+from conftest import add_equipment, add_person
+
+DUMP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database_dump.sql")
+DUMP_TABLES = ("student_staff", "user_account", "equipment", "reservation")
+
+
+# {table: (COPY statement, data)} for the public tables in database_dump.sql.
+def _dump_copies():
+    with open(DUMP_PATH, encoding="utf-8") as dump:
+        text = dump.read()
+    copies = {}
+    for match in re.finditer(r"^(COPY public\.(\w+) \(.*?\) FROM stdin;)\n(.*?)^\\\.$", text, re.M | re.S):
+        copies[match.group(2)] = (match.group(1), match.group(3))
+    return copies
+
+
+def _partition_of(cursor, reservation_id):
+    cursor.execute("SELECT tableoid::regclass::TEXT FROM Reservation WHERE reservation_id = %s;", (reservation_id,))
+    return cursor.fetchone()[0]
+
+
+def _month_start(months_ahead):
+    day = date.today().replace(day=1)
+    for _ in range(months_ahead):
+        day = (day + timedelta(days=32)).replace(day=1)
+    return day
+
+
+def test_migrating_a_populated_database(empty_db):
+    copies = _dump_copies()
+    with drs.db_session() as (conn, cursor):
+        # The tables as the pre-migration program created them, with the dump's rows.
+        cursor.execute(MIGRATIONS[0][2])
+        for table in DUMP_TABLES:
+            statement, data = copies[table]
+            cursor.copy_expert(statement, io.StringIO(data))
+        cursor.execute("SELECT setval('reservation_reservation_id_seq', (SELECT MAX(reservation_id) FROM Reservation));")
+        cursor.execute("SELECT reservation_id, username, equipment_id, status FROM Reservation ORDER BY reservation_id;")
+        before = cursor.fetchall()
+        conn.commit()
+
+        assert drs.initialize_db(cursor, conn) == LATEST_SCHEMA_VERSION
+
+        cursor.execute("SELECT reservation_id, username, equipment_id, status FROM Reservation ORDER BY reservation_id;")
+        assert cursor.fetchall() == before
+        # Reservation 19 ends before it starts in the dump; its dates are swapped.
+        cursor.execute("SELECT start_date, end_date FROM Reservation WHERE reservation_id = 19;")
+        assert cursor.fetchone() == (date(2025, 5, 10), date(2025, 5, 20))
+        cursor.execute("SELECT reservation_id FROM Active_Reservation ORDER BY reservation_id;")
+        assert cursor.fetchall() == [(row[0],) for row in before if row[3] == "Active"]
+
+        code, reservation_id = drs.call_make_reservation_proc(
+            conn, cursor, "user_1", 4, date.today() + timedelta(days=1), date.today() + timedelta(days=2))
+        assert code == drs.RESERVATION_OK and reservation_id > before[-1][0]
+
+
+def test_migrations_are_applied_once(db):
+    with drs.db_session() as (conn, cursor):
+        assert drs.get_schema_version(conn, cursor) == LATEST_SCHEMA_VERSION
+        assert drs.run_migrations(conn, cursor) == LATEST_SCHEMA_VERSION
+        cursor.execute("SELECT COUNT(*) FROM Schema_Version;")
+        assert cursor.fetchone()[0] == len(MIGRATIONS)
+
+
+def test_creating_a_partition_moves_rows_out_of_reservation_default(db):
+    month = _month_start(24)
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        unit, other = add_equipment(cursor), add_equipment(cursor)
+        conn.commit()
+        code, active_id = drs.call_make_reservation_proc(conn, cursor, "alice", unit, month, month + timedelta(days=3))
+        assert code == drs.RESERVATION_OK
+        cursor.execute("""
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES ('alice', %s, %s, %s, 'Returned') RETURNING reservation_id;
+        """, (other, month + timedelta(days=5), month + timedelta(days=6)))
+        returned_id = cursor.fetchone()[0]
+        conn.commit()
+        assert _partition_of(cursor, active_id) == "reservation_default"
+
+        cursor.execute("SELECT create_reservation_partition(%s);", (month,))
+        assert cursor.fetchone()[0] is True
+        conn.commit()
+
+        partition = f"reservation_{month:%Y_%m}"
+        assert _partition_of(cursor, active_id) == partition
+        assert _partition_of(cursor, returned_id) == partition
+        cursor.execute("SELECT COUNT(*) FROM reservation_default;")
+        assert cursor.fetchone()[0] == 0
+        # The moved Active booking still blocks its dates.
+        cursor.execute("SELECT reservation_id FROM Active_Reservation WHERE equipment_id = %s;", (unit,))
+        assert cursor.fetchall() == [(active_id,)]
+        code, _ = drs.call_make_reservation_proc(conn, cursor, "alice", unit, month + timedelta(days=1), month + timedelta(days=1))
+        assert code == "conflict"
+
+        cursor.execute("SELECT create_reservation_partition(%s);", (month,))
+        assert cursor.fetchone()[0] is False
+
+
+def test_archiving_skips_partitions_with_open_bookings(db):
+    old = date.today() - timedelta(days=800)
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        unit = add_equipment(cursor)
+        cursor.execute("""
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES ('alice', %s, %s, %s, 'Overdue') RETURNING reservation_id;
+        """, (unit, old, old + timedelta(days=2)))
+        overdue_id = cursor.fetchone()[0]
+        conn.commit()
+        assert _partition_of(cursor, overdue_id) == "reservation_history"
+
+        assert drs.archive_reservation_partitions(conn, cursor) == []
+        assert _partition_of(cursor, overdue_id) == "reservation_history"
+
+        assert drs.return_equipment_batch(conn, cursor, [overdue_id])[0][0] == drs.RESERVATION_OK
+        archived = drs.archive_reservation_partitions(conn, cursor)
+        assert archived == [("reservation_history", f"{drs.ARCHIVE_SCHEMA}.reservation_history")]
+        cursor.execute(f"SELECT status FROM {drs.ARCHIVE_SCHEMA}.reservation_history WHERE reservation_id = %s;",
+                       (overdue_id,))
+        assert cursor.fetchone() == ("Returned",)
+
@@ -0,0 +1,47 @@
+import DigitalRentalSystem as drs
+
+from conftest import backend_pid
+
+
+def test_returned_connections_stay_open_for_reuse(empty_db):
+    pool = drs.ConnectionPool(1, 4, **empty_db)
+    try:
+        first = [pool.getconn() for _ in range(3)]
+        pids = {backend_pid(conn) for conn in first}
+        for conn in first:
+            pool.putconn(conn)
+        assert not any(conn.closed for conn in first)
+
+        second = [pool.getconn() for _ in range(3)]
+        assert {backend_pid(conn) for conn in second} == pids
+        for conn in second:
+            pool.putconn(conn)
+    finally:
+        pool.closeall()
+
+
+def test_max_idle_limits_kept_connections(empty_db):
+    pool = drs.ConnectionPool(0, 3, max_idle=1, **empty_db)
+    try:
+        conns = [pool.getconn() for _ in range(3)]
+        for conn in conns:
+            pool.putconn(conn)
+        assert [conn.closed != 0 for conn in conns] == [False, True, True]
+    finally:
+        pool.closeall()
+
+
+def test_closed_connections_are_forgotten(empty_db):
+    pool = drs.ConnectionPool(0, 2, **empty_db)
+    try:
+        conn = pool.getconn()
+        assert conn in pool._last_checked
+        conn.close()
+        pool.putconn(conn)
+        assert conn not in pool._last_checked
+
+        kept = pool.getconn()
+        pool.putconn(kept, close=True)
+        assert len(pool._last_checked) == 0
+    finally:
+        pool.closeall()
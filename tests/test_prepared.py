@@ -0,0 +1,34 @@
+import DigitalRentalSystem as drs
+
+
+def _prepared_on_connection():
+    with drs.db_session() as (conn, cursor):
+        drs.get_user_reservations_page(cursor, "nobody")
+        cursor.execute("SELECT pg_backend_pid();")
+        pid = cursor.fetchone()[0]
+        cursor.execute("SELECT name, prepare_time FROM pg_prepared_statements;")
+        return pid, dict(cursor.fetchall())
+
+
+def test_statements_are_prepared_once_per_pooled_connection(db):
+    pid, statements = _prepared_on_connection()
+    assert "user_reservations_first" in statements
+    for _ in range(5):
+        assert _prepared_on_connection() == (pid, statements)
+
+
+def test_statements_are_prepared_again_after_a_migration(db):
+    pid, statements = _prepared_on_connection()
+    drs.invalidate_prepared_statements()
+    again_pid, again = _prepared_on_connection()
+    assert again_pid == pid
+    assert again["user_reservations_first"] > statements["user_reservations_first"]
+
+
+def test_prepared_and_plain_queries_agree(db, monkeypatch):
+    with drs.db_session() as (conn, cursor):
+        assert drs.authenticate(cursor, "nobody", "secret") == (False, None, None)
+    monkeypatch.setenv("use_prepared_statements", "false")
+    with drs.db_session() as (conn, cursor):
+        assert drs.authenticate(cursor, "nobody", "secret") == (False, None, None)
+        assert drs.get_user_reservations_page(cursor, "nobody") == ([], None)
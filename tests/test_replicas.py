@@ -0,0 +1,31 @@
+import psycopg2
+
+import DigitalRentalSystem as drs
+
+from conftest import backend_pid
+
+
+def test_replica_reads_and_lag_probes_reuse_connections(empty_db):
+    # The test database stands in for a replica that is never behind.
+    router = drs.ReplicaRouter([psycopg2.extensions.make_dsn(**empty_db)], 4, lag_check_interval=0)
+    try:
+        pids = set()
+        for _ in range(5):
+            pool, conn = router.checkout()
+            pids.add(backend_pid(conn))
+            pool.putconn(conn)
+        assert len(pids) == 1
+        assert router.status()[0][1] == 0
+    finally:
+        router.closeall()
+
+
+def test_recent_writers_read_from_the_primary(empty_db):
+    router = drs.ReplicaRouter([psycopg2.extensions.make_dsn(**empty_db)], 2)
+    try:
+        router.note_write("user_1")
+        assert router.checkout("user_1") is None
+        pool, conn = router.checkout("user_2")
+        pool.putconn(conn)
+    finally:
+        router.closeall()
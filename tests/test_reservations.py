@@ -0,0 +1,106 @@
+import threading
+from datetime import date, timedelta
+
+import DigitalRentalSystem as drs
+
+from conftest import add_equipment, add_person
+
+START = date.today() + timedelta(days=7)
+END = START + timedelta(days=2)
+
+
+def _reserve(cursor, conn, equipment_id, start=START, end=END, username="alice"):
+    return drs.call_make_reservation_proc(conn, cursor, username, equipment_id, start, end)
+
+
+def test_reserve_codes(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        unit = add_equipment(cursor)
+        lost = add_equipment(cursor, condition="Lost")
+        conn.commit()
+
+        code, reservation_id = _reserve(cursor, conn, unit)
+        assert code == drs.RESERVATION_OK and reservation_id is not None
+        assert _reserve(cursor, conn, unit, START + timedelta(days=1), END + timedelta(days=1)) == ("conflict", None)
+        assert _reserve(cursor, conn, lost) == ("unavailable", None)
+        assert _reserve(cursor, conn, 999999) == ("not_found", None)
+        assert _reserve(cursor, conn, unit, END + timedelta(days=5), END + timedelta(days=3)) == ("invalid_dates", None)
+        assert _reserve(cursor, conn, unit, END + timedelta(days=1), END + timedelta(days=1),
+                        username="nobody") == ("unknown_user", None)
+        # Back-to-back bookings do not overlap.
+        code, _ = _reserve(cursor, conn, unit, END + timedelta(days=1), END + timedelta(days=1))
+        assert code == drs.RESERVATION_OK
+
+        cursor.execute("SELECT COUNT(*) FROM Reservation;")
+        assert cursor.fetchone()[0] == 2
+
+
+def test_overdue_unit_cannot_be_booked(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        unit = add_equipment(cursor)
+        _, reservation_id = _reserve(cursor, conn, unit)
+        cursor.execute("UPDATE Reservation SET status = 'Overdue' WHERE reservation_id = %s;", (reservation_id,))
+        conn.commit()
+        later = END + timedelta(days=30)
+        assert _reserve(cursor, conn, unit, later, later) == ("unavailable", None)
+
+
+def test_reserve_by_model(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        units = [add_equipment(cursor, "Camera") for _ in range(2)]
+        add_equipment(cursor, "Camera", condition="Damaged")
+        conn.commit()
+
+        code, booked, message = drs.reserve_by_model(conn, cursor, "alice", "Camera", 3, START, END)
+        assert (code, booked) == ("insufficient_units", [])
+        assert message == drs.RESERVATION_MESSAGES["insufficient_units"]
+
+        code, booked, _ = drs.reserve_by_model(conn, cursor, "alice", "Camera", 2, START, END)
+        assert code == drs.RESERVATION_OK
+        assert sorted(equipment_id for equipment_id, _ in booked) == units
+        code, booked, _ = drs.reserve_by_model(conn, cursor, "alice", "Camera", 1, START, END)
+        assert (code, booked) == ("insufficient_units", [])
+
+
+def test_reservation_batch_is_all_or_nothing(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        first, second = add_equipment(cursor), add_equipment(cursor)
+        conn.commit()
+        items = [("alice", first, START, END), ("alice", first, START, END), ("alice", second, START, END)]
+
+        results = drs.make_reservations_batch(conn, cursor, items)
+        assert [result[0] for result in results] == ["rolled_back", "conflict", "skipped"]
+        cursor.execute("SELECT COUNT(*) FROM Reservation;")
+        assert cursor.fetchone()[0] == 0
+
+        results = drs.make_reservations_batch(conn, cursor, items, all_or_nothing=False)
+        assert [result[0] for result in results] == [drs.RESERVATION_OK, "conflict", drs.RESERVATION_OK]
+        cursor.execute("SELECT COUNT(*) FROM Reservation;")
+        assert cursor.fetchone()[0] == 2
+
+
+def test_concurrent_bookings_of_one_unit(db):
+    with drs.db_session() as (conn, cursor):
+        for username in ("alice", "bob"):
+            add_person(cursor, username)
+        unit = add_equipment(cursor)
+        conn.commit()
+
+    barrier = threading.Barrier(2)
+    codes = []
+
+    def book(username):
+        with drs.db_session() as (conn, cursor):
+            barrier.wait()
+            codes.append(_reserve(cursor, conn, unit, username=username)[0])
+
+    threads = [threading.Thread(target=book, args=(username,)) for username in ("alice", "bob")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(codes) == ["conflict", drs.RESERVATION_OK]
@@ -0,0 +1,67 @@
+import io
+import json
+from datetime import date, timedelta
+
+import BatchRunner
+import DigitalRentalSystem as drs
+import RentalServer
+
+from conftest import add_equipment, add_person
+
+TODAY = date.today()
+
+
+def _book(conn, cursor, username, equipment_id, days=1):
+    code, reservation_id = drs.call_make_reservation_proc(
+        conn, cursor, username, equipment_id, TODAY, TODAY + timedelta(days=days))
+    assert code == drs.RESERVATION_OK
+    return reservation_id
+
+
+def test_repeated_ids_are_returned_once(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        first, second = add_equipment(cursor), add_equipment(cursor)
+        conn.commit()
+        one, two = _book(conn, cursor, "alice", first), _book(conn, cursor, "alice", second)
+
+        results = drs.return_equipment_batch(conn, cursor, [one, two, 99999, one])
+        assert [code for code, _, _ in results] == ["ok", "ok", "not_found", "not_active"]
+        assert results[3][1] == first
+
+
+def test_return_batch_endpoint_reports_repeats(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "staff", role="Staff")
+        unit = add_equipment(cursor)
+        conn.commit()
+        reservation_id = _book(conn, cursor, "staff", unit)
+        params = {"_session": ("staff", "Staff", 1), "reservation_ids": [reservation_id, reservation_id]}
+        codes = [entry["code"] for entry in RentalServer.return_batch(conn, cursor, params)]
+        assert codes == ["ok", "not_active"]
+
+
+def test_overdue_reservations_can_be_returned(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        unit = add_equipment(cursor)
+        cursor.execute("""
+        INSERT INTO Reservation (username, equipment_id, start_date, end_date, status)
+        VALUES ('alice', %s, %s, %s, 'Overdue') RETURNING reservation_id;
+        """, (unit, TODAY - timedelta(days=5), TODAY - timedelta(days=2)))
+        reservation_id = cursor.fetchone()[0]
+        conn.commit()
+        assert drs.return_equipment_batch(conn, cursor, [reservation_id]) == [(drs.RESERVATION_OK, unit, None)]
+        assert drs.check_equipment_availability(cursor, unit)
+
+
+def test_batch_mode_reports_repeated_returns(db):
+    with drs.db_session() as (conn, cursor):
+        add_person(cursor, "alice")
+        unit = add_equipment(cursor)
+        conn.commit()
+        reservation_id = _book(conn, cursor, "alice", unit)
+    lines = [json.dumps({"op": "return", "reservation_id": reservation_id})] * 2
+    out = io.StringIO()
+    assert BatchRunner.run_batch(lines, out) == (2, 1)
+    assert [json.loads(line)["code"] for line in out.getvalue().splitlines()] == ["ok", "not_active"]